@@ -3,7 +3,7 @@ Custom adapter لحل مشكلة MultipleObjectsReturned في Google OAuth
 """
 from allauth.socialaccount.adapter import DefaultSocialAccountAdapter
 from allauth.socialaccount.models import SocialApp
-from django.contrib.sites.models import Site
+from project.middleware import get_site_for_host
 from django.contrib.auth import get_user_model
 from django.http import HttpResponseRedirect
 from django.urls import reverse
@@ -44,40 +44,15 @@ class CustomSocialAccountAdapter(DefaultSocialAccountAdapter):
     
     def get_current_site(self, request):
         """
-        الحصول على الموقع الحالي حسب النطاق
+        الموقع الحالي حسب النطاق (يحدده DynamicSiteMiddleware في request.site)
         """
-        # فحص وجود request لتجنب خطأ NoneType
         if request is None:
-            # إرجاع الموقع الافتراضي إذا لم يكن request متاح
-            try:
-                return Site.objects.get(domain='localhost:8000')
-            except Site.DoesNotExist:
-                return Site.objects.create(
-                    domain='localhost:8000',
-                    name='Localhost Development'
-                )
-        
-        host = request.get_host()
-        
-        # تحديث للنطاق الجديد
-        if '15d0212cf8fe.ngrok-free.app' in host:
-            try:
-                return Site.objects.get(domain='15d0212cf8fe.ngrok-free.app')
-            except Site.DoesNotExist:
-                # إنشاء الموقع إذا لم يكن موجوداً
-                return Site.objects.create(
-                    domain='15d0212cf8fe.ngrok-free.app',
-                    name='Ngrok Site'
-                )
-        else:
-            try:
-                return Site.objects.get(domain='localhost:8000')
-            except Site.DoesNotExist:
-                # إنشاء الموقع إذا لم يكن موجوداً
-                return Site.objects.create(
-                    domain='localhost:8000',
-                    name='Localhost Development'
-                )
+            # بدون request: الموقع الافتراضي
+            return get_site_for_host('')
+        site = getattr(request, 'site', None)
+        if site is None:
+            site = get_site_for_host(request.get_host())
+        return site
 
     def populate_user(self, request, sociallogin, data):
         """
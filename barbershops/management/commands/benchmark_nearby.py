@@ -0,0 +1,67 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from barbershops.location_utils import SpatialIndex, calculate_distance
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the in-memory spatial index against a linear Haversine scan on synthetic shops'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shops',
+            type=int,
+            nargs='+',
+            default=[10000, 50000, 100000],
+            help='Number of synthetic shops for each run',
+        )
+        parser.add_argument('--queries', type=int, default=200, help='Queries per run')
+        parser.add_argument('--radius', type=float, default=5, help='Radius query distance (km)')
+        parser.add_argument('--k', type=int, default=10, help='Number of neighbours for k-nearest queries')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+        k = options['k']
+
+        for shop_count in options['shops']:
+            # نقاط عشوائية داخل مربع يغطي مصر تقريباً
+            points = [
+                (i, rng.uniform(22.0, 31.5), rng.uniform(25.0, 35.0))
+                for i in range(shop_count)
+            ]
+            queries = [
+                (rng.uniform(22.0, 31.5), rng.uniform(25.0, 35.0))
+                for _ in range(options['queries'])
+            ]
+
+            started = time.perf_counter()
+            index = SpatialIndex(points)
+            build_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for lat, lon in queries:
+                index.within(lat, lon, radius)
+            radius_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for lat, lon in queries:
+                index.nearest(lat, lon, k)
+            knn_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for lat, lon in queries:
+                sorted(
+                    (calculate_distance(lat, lon, p_lat, p_lon), point_id)
+                    for point_id, p_lat, p_lon in points
+                )[:k]
+            linear_time = time.perf_counter() - started
+
+            per_query = 1000 / len(queries)
+            self.stdout.write(self.style.SUCCESS(
+                f'{shop_count} shops: build {build_time * 1000:.1f} ms | '
+                f'radius {radius_time * per_query:.3f} ms/query | '
+                f'k-nearest {knn_time * per_query:.3f} ms/query | '
+                f'linear scan {linear_time * per_query:.3f} ms/query'
+            ))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db.models import Count
 from barbershops.models import Barbershop
+from barbershops.utils import rebuild_rating_aggregates
 
 class Command(BaseCommand):
     help = 'Finds and merges duplicate barbershops based on owner and name.'
@@ -48,6 +49,7 @@ class Command(BaseCommand):
                 if hasattr(dup_shop, 'reviews'):
                     reviews_moved = dup_shop.reviews.update(barbershop=original_shop)
                     if reviews_moved:
+                        rebuild_rating_aggregates([original_shop.id])
                         self.stdout.write(self.style.SUCCESS(f"   Moved {reviews_moved} review(s) to the original shop."))
 
                 if hasattr(dup_shop, 'bookings'):
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from barbershops.utils import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored rating aggregates of barbershops from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'barbershop_ids',
+            nargs='*',
+            type=int,
+            help='Only rebuild these barbershops (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        updated_count = rebuild_rating_aggregates(options['barbershop_ids'] or None)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully rebuilt rating aggregates for {updated_count} barbershops'
+            )
+        )
@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Barbershop
+from .location_utils import invalidate_spatial_index
+
+# الحقول التي تؤثر على نتائج البحث الجغرافي
+SPATIAL_FIELDS = {'latitude', 'longitude', 'is_active', 'is_verified'}
+
+
+@receiver(post_save, sender=Barbershop)
+def refresh_spatial_index_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """إعادة بناء فهرس الصالونات القريبة عند تغيير موقع أو حالة المحل"""
+    if update_fields is None or SPATIAL_FIELDS & set(update_fields):
+        # بعد نجاح المعاملة حتى لا يعيد عامل آخر بناء الفهرس من البيانات القديمة
+        transaction.on_commit(invalidate_spatial_index)
+
+
+@receiver(post_delete, sender=Barbershop)
+def refresh_spatial_index_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_spatial_index)
@@ -7,7 +7,8 @@ from django.db.models import Q, Avg, Count, Prefetch
 from django.db import models
 from django.utils import timezone
 from bookings.models import Booking
-from django.http import Http404, JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import logging
@@ -15,7 +16,9 @@ import json
 from .models import Barbershop, Service
 from .forms import ServiceForm, BarbershopCreateForm
 from reviews.models import Review
-from .location_utils import get_nearest_barbershops, format_distance
+from .location_utils import (
+    get_nearest_barbershops, find_nearby_matches, paginate_nearby_matches, serialize_nearby_barbershops
+)
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +34,8 @@ class HomePageView(ListView):
             is_active=True, 
             is_verified=True
         ).select_related('owner').prefetch_related(
-            'services', 'reviews'
-        ).annotate(
-            avg_rating=Avg('reviews__rating'),
-            reviews_count=models.Count('reviews', filter=models.Q(reviews__is_approved=True))
-        ).order_by('-avg_rating', '-created_at')[:6]
+            'services'
+        ).order_by('-rating_avg', '-created_at')[:6]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -53,11 +53,8 @@ class BarbershopListView(ListView):
             is_active=True, 
             is_verified=True
         ).select_related('owner').prefetch_related(
-            'services', 'reviews'
-        ).annotate(
-            avg_rating=Avg('reviews__rating'),
-            reviews_count=models.Count('reviews', filter=models.Q(reviews__is_approved=True))
-        )
+            'services'
+        ).order_by('-rating_avg', '-created_at')
 
 
 class NearbyBarbershopsView(ListView):
@@ -79,9 +76,11 @@ class NearbyBarbershopsView(ListView):
         try:
             user_lat = float(user_lat)
             user_lon = float(user_lon)
+            limit = self.request.GET.get('limit')
+            limit = int(limit) if limit else None
             
             # الحصول على أقرب الصالونات
-            return get_nearest_barbershops(user_lat, user_lon)
+            return get_nearest_barbershops(user_lat, user_lon, limit=limit)
             
         except (ValueError, TypeError):
             return []
@@ -102,54 +101,48 @@ class NearbyBarbershopsAPIView(ListView):
     """
     model = Barbershop
     
+    # حجم الدفعة عند بث النتائج الكاملة (استعلام واحد لكل دفعة)
+    stream_batch_size = 100
+    max_page_size = 100
+
     def post(self, request, *args, **kwargs):
         try:
             data = json.loads(request.body)
             user_lat = float(data.get('latitude'))
             user_lon = float(data.get('longitude'))
             max_distance = float(data.get('max_distance', 50))  # افتراضي 50 كم
+            limit = int(data['limit']) if data.get('limit') else None
+            offset = int(data.get('offset') or 0)
+            cursor = data.get('cursor')
+            if (limit is not None and limit <= 0) or offset < 0:
+                raise ValueError('limit/offset غير صالح')
             
-            # الحصول على أقرب الصالونات
-            nearby_barbershops = get_nearest_barbershops(user_lat, user_lon, max_distance)
-            
-            # تحويل البيانات إلى JSON
-            barbershops_data = []
-            for item in nearby_barbershops:
-                barbershop = item['barbershop']
-                distance = item['distance']
-                
-                # حساب متوسط التقييم
-                avg_rating = barbershop.reviews.filter(
-                    is_approved=True
-                ).aggregate(Avg('rating'))['rating__avg'] or 0
-                
-                barbershops_data.append({
-                    'id': barbershop.id,
-                    'name': barbershop.name,
-                    'description': barbershop.description,
-                    'address': barbershop.address,
-                    'phone_number': barbershop.phone_number,
-                    'image_url': barbershop.image.url if barbershop.image else None,
-                    'latitude': float(barbershop.latitude),
-                    'longitude': float(barbershop.longitude),
-                    'distance': distance,
-                    'distance_text': format_distance(distance),
-                    'avg_rating': round(avg_rating, 1),
-                    'reviews_count': barbershop.reviews.filter(is_approved=True).count(),
-                    'services_count': barbershop.services.filter(is_active=True).count(),
-                    'opening_time': barbershop.opening_time.strftime('%H:%M') if barbershop.opening_time else None,
-                    'closing_time': barbershop.closing_time.strftime('%H:%M') if barbershop.closing_time else None,
-                    'detail_url': f'/barbershops/{barbershop.id}/'
-                })
+            # معرفات الصالونات القريبة مرتبة حسب المسافة (بدون استعلامات)
+            matches = find_nearby_matches(user_lat, user_lon, max_distance)
+            user_location = {
+                'latitude': user_lat,
+                'longitude': user_lon
+            }
+
+            if limit is None and not cursor and not offset:
+                # بدون تقسيم صفحات: بث النتائج على دفعات بدلاً من بناء JSON كامل في الذاكرة
+                return StreamingHttpResponse(
+                    self.stream_barbershops(matches, user_location),
+                    content_type='application/json'
+                )
+
+            page, next_cursor = paginate_nearby_matches(
+                matches, min(limit or self.max_page_size, self.max_page_size), offset, cursor
+            )
+            barbershops_data = serialize_nearby_barbershops(page)
             
             return JsonResponse({
                 'success': True,
                 'barbershops': barbershops_data,
-                'total_count': len(barbershops_data),
-                'user_location': {
-                    'latitude': user_lat,
-                    'longitude': user_lon
-                }
+                'total_count': len(matches),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'user_location': user_location
             })
             
         except (ValueError, TypeError, json.JSONDecodeError) as e:
@@ -166,6 +159,18 @@ class NearbyBarbershopsAPIView(ListView):
                 'error': 'حدث خطأ في الخادم'
             }, status=500)
 
+    def stream_barbershops(self, matches, user_location):
+        """توليد استجابة JSON تدريجياً، دفعة صالونات في كل استعلام"""
+        yield '{"success": true, "total_count": %d, "user_location": %s, "barbershops": [' % (
+            len(matches), json.dumps(user_location)
+        )
+        separator = ''
+        for start in range(0, len(matches), self.stream_batch_size):
+            for item in serialize_nearby_barbershops(matches[start:start + self.stream_batch_size]):
+                yield separator + json.dumps(item, cls=DjangoJSONEncoder)
+                separator = ', '
+        yield ']}'
+
 
 class BarbershopDetailView(DetailView):
     model = Barbershop
@@ -263,10 +268,8 @@ class MyBarbershopsListView(LoginRequiredMixin, ListView):
         return Barbershop.objects.filter(
             owner=self.request.user
         ).select_related('owner').prefetch_related(
-            'services', 'reviews', 'bookings'
+            'services'
         ).annotate(
-            avg_rating=Avg('reviews__rating'),
-            reviews_count=models.Count('reviews', filter=models.Q(reviews__is_approved=True)),
             bookings_count=models.Count('bookings')
         ).order_by('-created_at')
 
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from notifications.utils import build_chat_notification, chat_notification_key, deliver_notifications
+from .models import Booking, BookingMessage, BookingReadState
+
+logger = logging.getLogger(__name__)
+
+# عدد الرسائل في كل صفحة من سجل المحادثة، والحد الأقصى الذي يمكن طلبه
+CHAT_HISTORY_PAGE_SIZE = 30
+CHAT_HISTORY_MAX_PAGE_SIZE = 100
+
+
+def get_chat_history(booking_id: int, before_id: Optional[int] = None, after_id: Optional[int] = None,
+                     limit: int = CHAT_HISTORY_PAGE_SIZE) -> Tuple[List[BookingMessage], bool]:
+    """
+    صفحة من رسائل المحادثة مرتبة من الأقدم للأحدث، و has_more
+
+    - بدون مؤشر: آخر limit رسالة (has_more: توجد رسائل أقدم)
+    - before_id: الرسائل الأقدم من هذه الرسالة (has_more: توجد رسائل أقدم)
+    - after_id: الرسائل الأحدث من هذه الرسالة (has_more: توجد رسائل أحدث)
+
+    الترقيم بالمفتاح (booking_id, id) وليس بالإزاحة، فتكلفة كل صفحة ثابتة
+    مهما طالت المحادثة.
+    """
+    messages = BookingMessage.objects.filter(booking_id=booking_id).select_related('sender')
+    if after_id is not None:
+        page = list(messages.filter(pk__gt=after_id).order_by('pk')[:limit + 1])
+        return page[:limit], len(page) > limit
+
+    if before_id is not None:
+        messages = messages.filter(pk__lt=before_id)
+    page = list(messages.order_by('-pk')[:limit + 1])
+    return page[:limit][::-1], len(page) > limit
+
+
+def unread_counts_for(bookings: Iterable[Booking], user) -> Dict[int, int]:
+    """
+    عدد رسائل الطرف الآخر غير المقروءة للمستخدم في كل حجز {booking_id: العدد}
+
+    استعلام واحد لكل الحجوزات: الرسائل بعد آخر رسالة مقروءة في BookingReadState.
+    الحجوزات بدون رسائل غير مقروءة لا تظهر في الناتج.
+    """
+    booking_ids = [booking.pk for booking in bookings]
+    if not booking_ids:
+        return {}
+
+    last_read = BookingReadState.objects.filter(
+        booking_id=OuterRef('booking_id'),
+        user_id=user.pk
+    ).values('last_read_message_id')[:1]
+
+    return dict(
+        BookingMessage.objects.filter(
+            booking_id__in=booking_ids
+        ).exclude(
+            sender_id=user.pk
+        ).alias(
+            last_read=Coalesce(Subquery(last_read), Value(0))
+        ).filter(
+            pk__gt=F('last_read')
+        ).order_by().values('booking_id').annotate(
+            count=Count('pk')
+        ).values_list('booking_id', 'count')
+    )
+
+
+def serialize_chat_message(message: BookingMessage) -> Dict[str, Any]:
+    """نفس شكل رسائل chat_message المرسلة عبر WebSocket"""
+    return {
+        'id': message.pk,
+        'message': message.message,
+        'sender_username': message.sender.username,
+        'created_at': timezone.localtime(message.created_at).strftime('%d/%m/%Y %H:%M'),
+    }
+
+
+def chat_write_behind_enabled() -> bool:
+    return getattr(settings, 'CHAT_WRITE_BEHIND', False)
+
+
+@dataclass
+class BufferedChatMessage:
+    """رسالة تم بثها للغرفة وتنتظر الحفظ في قاعدة البيانات"""
+    uid: str
+    booking_id: int
+    sender: object
+    message: str
+    reply_channel: str
+    recipient_id: Optional[int] = None
+    notification_title: str = ''
+
+
+class ChatWriteBuffer:
+    """
+    تجميع رسائل المحادثة وحفظها دفعة واحدة بـ bulk_create
+
+    يتم الحفظ كل CHAT_FLUSH_INTERVAL_MS أو عند اكتمال CHAT_FLUSH_BATCH_SIZE
+    رسالة، وبعد الحفظ يُرسل لكل مرسل تأكيد chat_ack برقم الرسالة في قاعدة
+    البيانات (أو chat_nack عند الفشل)، في رسالة واحدة لكل مرسل في الدفعة.
+
+    - الترتيب: دفعة واحدة فقط تُحفظ في كل مرة وبترتيب الوصول، فترتيب أرقام
+      الرسائل في قاعدة البيانات هو نفس ترتيب بثها.
+    - التعطل: الرسائل التي لم تُحفظ بعد تضيع إذا توقفت العملية؛ المرسل لا
+      يتلقى لها تأكيداً ويمكنه إعادة إرسالها.
+    """
+
+    def __init__(self, flush_interval_ms: Optional[int] = None, batch_size: Optional[int] = None):
+        self.flush_interval = (
+            flush_interval_ms if flush_interval_ms is not None
+            else getattr(settings, 'CHAT_FLUSH_INTERVAL_MS', 50)
+        ) / 1000
+        self.batch_size = batch_size or getattr(settings, 'CHAT_FLUSH_BATCH_SIZE', 50)
+        self.pending: List[BufferedChatMessage] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def add(self, entry: BufferedChatMessage) -> None:
+        self.pending.append(entry)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.flush_interval, lambda: loop.create_task(self.flush())
+            )
+
+    async def flush(self) -> None:
+        """حفظ كل الرسائل المنتظرة وإرسال التأكيدات لأصحابها"""
+        async with self._flush_lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            while self.pending:
+                batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+                try:
+                    saved = await database_sync_to_async(self.persist)(batch)
+                except Exception as e:
+                    logger.error(f"Error saving {len(batch)} buffered chat messages: {e}")
+                    await self.acknowledge(batch, None)
+                else:
+                    await self.acknowledge(batch, saved)
+
+    @staticmethod
+    def persist(batch: List[BufferedChatMessage]) -> List[BookingMessage]:
+        """الرسائل وإشعاراتها في معاملة واحدة: إدراجان مهما كان عدد الرسائل"""
+        with transaction.atomic():
+            saved = BookingMessage.objects.bulk_create([
+                BookingMessage(booking_id=entry.booking_id, sender=entry.sender, message=entry.message)
+                for entry in batch
+            ])
+            notified = [(entry, message) for entry, message in zip(batch, saved) if entry.recipient_id]
+            deliver_notifications(
+                [
+                    build_chat_notification(message, entry.recipient_id, entry.notification_title)
+                    for entry, message in notified
+                ],
+                [chat_notification_key(message) for _, message in notified]
+            )
+        return saved
+
+    @staticmethod
+    async def acknowledge(batch: List[BufferedChatMessage], saved: Optional[List[BookingMessage]]) -> None:
+        """رسالة تأكيد واحدة لكل مرسل في الدفعة (حتى لا تمتلئ قناته)"""
+        results = defaultdict(list)
+        for index, entry in enumerate(batch):
+            results[entry.reply_channel].append(
+                {'uid': entry.uid, 'id': saved[index].pk if saved is not None else None}
+            )
+
+        channel_layer = get_channel_layer()
+        event_type = 'chat_nack' if saved is None else 'chat_ack'
+        for reply_channel, messages in results.items():
+            try:
+                await channel_layer.send(reply_channel, {'type': event_type, 'messages': messages})
+            except Exception as e:
+                logger.error(f"Error acknowledging {len(messages)} chat messages on {reply_channel}: {e}")
+
+
+# مخزن واحد لكل حلقة أحداث (عملية ASGI)
+_chat_write_buffers: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ChatWriteBuffer]' = weakref.WeakKeyDictionary()
+
+
+def get_chat_write_buffer() -> ChatWriteBuffer:
+    loop = asyncio.get_running_loop()
+    buffer = _chat_write_buffers.get(loop)
+    if buffer is None:
+        buffer = _chat_write_buffers[loop] = ChatWriteBuffer()
+    return buffer
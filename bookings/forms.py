@@ -1,7 +1,8 @@
 from django import forms
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Booking, BookingMessage, BookingService
+from django.db import transaction
+from .models import Booking, BookingMessage, BookingService, QueueCounter
 from barbershops.models import Barbershop, Service
 from decimal import Decimal
 import logging
@@ -605,38 +606,40 @@ class BookingForm(forms.ModelForm):
             
             selected_services = valid_services  # استخدام الخدمات الصالحة فقط
             booking.total_price = total_price
+            booking.set_services_summary((service, 1) for service in selected_services)
             logger.info(f"عدد الخدمات الصالحة: {len(valid_services)}")
             logger.info(f"السعر الإجمالي: {total_price}")
             
-            # حساب رقم الدور
-            bookings_count = Booking.objects.filter(
-                barbershop=booking.barbershop,
-                booking_day=booking.booking_day
-            ).count()
-            booking.queue_number = bookings_count + 1
-            logger.info(f"رقم الدور: {booking.queue_number}")
-
             if commit:
-                booking.save()
-                logger.info(f"تم حفظ الحجز بنجاح - ID: {booking.id}")
-                
-                # إضافة الخدمات المحددة إلى الحجز
-                for service in selected_services:
-                    booking_service = BookingService.objects.create(
-                        booking=booking,
-                        service=service,
-                        quantity=1,  # كمية ثابتة = 1
-                        price_at_booking=service.price
-                    )
-                    # استخدام اسم آمن للخدمة
-                    service_name = service.name if hasattr(service, 'name') and service.name else f"خدمة رقم {service.id if hasattr(service, 'id') else 'Unknown'}"
-                    logger.info(f"تم إضافة الخدمة: {service_name} للحجز {booking.id}")
-                
-                # ربط العميل بالحجز إذا لم يكن موجوداً
-                if not booking.customer and self.user and self.user.is_authenticated:
-                    booking.customer = self.user
+                with transaction.atomic():
+                    is_new = booking.pk is None
+
+                    # حجز رقم الدور من عداد المحل اليومي داخل نفس المعاملة
+                    if is_new or {'barbershop', 'booking_day'} & set(self.changed_data):
+                        booking.queue_number = QueueCounter.next_number(
+                            booking.barbershop, booking.booking_day
+                        )
+                    logger.info(f"رقم الدور: {booking.queue_number}")
+
+                    # حفظ واحد للحجز (يرسل post_save إشعار الحجز الجديد مرة واحدة)
                     booking.save()
-                    logger.info("تم ربط العميل بالحجز")
+                    logger.info(f"تم حفظ الحجز بنجاح - ID: {booking.id}")
+
+                    if not is_new:
+                        # تعديل حجز: استبدال الخدمات السابقة بالخدمات المختارة
+                        booking.booking_services.all().delete()
+
+                    # إضافة الخدمات المحددة إلى الحجز في استعلام INSERT واحد
+                    BookingService.objects.bulk_create([
+                        BookingService(
+                            booking=booking,
+                            service=service,
+                            quantity=1,  # كمية ثابتة = 1
+                            price_at_booking=service.price
+                        )
+                        for service in selected_services
+                    ])
+                    logger.info(f"تم إضافة {len(selected_services)} خدمة للحجز {booking.id}")
                     
             return booking
             
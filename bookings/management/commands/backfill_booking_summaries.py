@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from bookings.utils import backfill_services_summary
+
+
+class Command(BaseCommand):
+    help = 'Populate the stored services totals and summary of bookings from their BookingService rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'booking_ids',
+            nargs='*',
+            type=int,
+            help='Only backfill these bookings (default: all)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of bookings updated per query',
+        )
+
+    def handle(self, *args, **options):
+        updated_count = backfill_services_summary(
+            options['booking_ids'] or None,
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully backfilled services summary for {updated_count} bookings'
+            )
+        )
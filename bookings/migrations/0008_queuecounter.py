@@ -0,0 +1,74 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def renumber_duplicate_turns(apps, schema_editor):
+    """إعادة ترقيم الأدوار المكررة وتهيئة العدادات من الحجوزات الحالية"""
+    Booking = apps.get_model('bookings', 'Booking')
+    QueueCounter = apps.get_model('bookings', 'QueueCounter')
+
+    groups = (
+        Booking.objects.exclude(booking_day__isnull=True)
+        .values('barbershop_id', 'booking_day')
+        .annotate(
+            total=models.Count('id'),
+            distinct_numbers=models.Count('queue_number', distinct=True),
+            max_number=models.Max('queue_number'),
+        )
+    )
+
+    counters = []
+    for group in groups:
+        last_number = group['max_number']
+        if group['total'] != group['distinct_numbers']:
+            # يوجد أرقام مكررة: إعادة الترقيم حسب ترتيب الإنشاء
+            bookings = Booking.objects.filter(
+                barbershop_id=group['barbershop_id'],
+                booking_day=group['booking_day'],
+            ).order_by('queue_number', 'created_at', 'id')
+            renumbered = []
+            for number, booking in enumerate(bookings, start=1):
+                booking.queue_number = number
+                renumbered.append(booking)
+            Booking.objects.bulk_update(renumbered, ['queue_number'])
+            last_number = len(renumbered)
+
+        counters.append(QueueCounter(
+            barbershop_id=group['barbershop_id'],
+            day=group['booking_day'],
+            last_number=last_number,
+        ))
+
+    QueueCounter.objects.bulk_create(counters, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barbershops', '0009_barbershop_current_turn_number_and_more'),
+        ('bookings', '0007_alter_booking_service_bookingservice_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='آخر رقم دور تم إصداره')),
+                ('barbershop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queue_counters', to='barbershops.barbershop', verbose_name='محل الحلاقة')),
+            ],
+            options={
+                'verbose_name': 'عداد الأدوار',
+                'verbose_name_plural': 'عدادات الأدوار',
+                'unique_together': {('barbershop', 'day')},
+            },
+        ),
+        migrations.RunPython(renumber_duplicate_turns, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('barbershop', 'booking_day', 'queue_number'), name='unique_queue_number_per_shop_day'),
+        ),
+    ]
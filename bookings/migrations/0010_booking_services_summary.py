@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_servicetimeestimate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='services_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='عدد الخدمات'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='services_summary',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ملخص الخدمات'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='total_duration_minutes',
+            field=models.PositiveIntegerField(default=0, verbose_name='إجمالي مدة الخدمات (دقائق)'),
+        ),
+    ]
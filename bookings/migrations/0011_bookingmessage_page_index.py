@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_booking_services_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookingmessage',
+            index=models.Index(fields=['booking', 'id'], name='bookings_message_page_idx'),
+        ),
+    ]
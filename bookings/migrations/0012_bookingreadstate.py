@@ -0,0 +1,70 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def initial_read_states(apps, schema_editor):
+    """آخر رسالة مقروءة لكل طرف من الرسائل المحددة سابقاً بـ is_read"""
+    Booking = apps.get_model('bookings', 'Booking')
+    BookingMessage = apps.get_model('bookings', 'BookingMessage')
+    BookingReadState = apps.get_model('bookings', 'BookingReadState')
+
+    # آخر رسالة مقروءة من كل مرسل في كل حجز
+    last_read = {}
+    for row in (
+        BookingMessage.objects.filter(is_read=True)
+        .values('booking_id', 'sender_id')
+        .annotate(last=models.Max('id'))
+    ):
+        last_read[row['booking_id'], row['sender_id']] = row['last']
+    if not last_read:
+        return
+
+    participants = Booking.objects.filter(
+        pk__in={booking_id for booking_id, _ in last_read}
+    ).values_list('pk', 'customer_id', 'barbershop__owner_id')
+
+    # آخر رسالة مقروءة من الطرف الآخر لكل (حجز، قارئ)، في مرور واحد على last_read
+    readers = {booking_id: {customer_id, owner_id} - {None} for booking_id, customer_id, owner_id in participants}
+    last_read_by = {}
+    for (booking_id, sender_id), last in last_read.items():
+        # القارئ قرأ رسائل الطرف الآخر فقط
+        for reader_id in readers.get(booking_id, ()):
+            if reader_id != sender_id:
+                key = (booking_id, reader_id)
+                last_read_by[key] = max(last_read_by.get(key, 0), last)
+
+    states = [
+        BookingReadState(booking_id=booking_id, user_id=reader_id, last_read_message_id=last)
+        for (booking_id, reader_id), last in last_read_by.items()
+    ]
+    BookingReadState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_bookingmessage_page_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0, verbose_name='آخر رسالة مقروءة')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='bookings.booking', verbose_name='الحجز')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_read_states', to=settings.AUTH_USER_MODEL, verbose_name='المستخدم')),
+            ],
+            options={
+                'verbose_name': 'حالة قراءة المحادثة',
+                'verbose_name_plural': 'حالات قراءة المحادثات',
+                'unique_together': {('booking', 'user')},
+            },
+        ),
+        migrations.RunPython(initial_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+def backfill_services_summary(apps, schema_editor):
+    """تعبئة ملخص الخدمات للحجوزات السابقة لإضافة الحقول حتى تعتمد القوائم والإشعارات عليها فقط"""
+    Booking = apps.get_model('bookings', 'Booking')
+    BookingService = apps.get_model('bookings', 'BookingService')
+
+    pending = Booking.objects.filter(services_count=0).select_related('service')
+    services = {}
+    for booking_service in BookingService.objects.filter(
+        booking__services_count=0
+    ).select_related('service').order_by('pk'):
+        services.setdefault(booking_service.booking_id, []).append(
+            (booking_service.service, booking_service.quantity)
+        )
+
+    updated = []
+    for booking in pending.iterator(chunk_size=500):
+        items = services.get(booking.pk) or ([(booking.service, 1)] if booking.service else [])
+        if not items:
+            continue
+        names = [
+            f"{service.name} (x{quantity})" if quantity > 1 else service.name
+            for service, quantity in items
+        ]
+        summary = '، '.join(names)
+        if len(summary) > 255:
+            summary = summary[:254] + '…'
+        booking.total_duration_minutes = sum(service.duration * quantity for service, quantity in items)
+        booking.services_count = len(names)
+        booking.services_summary = summary
+        updated.append(booking)
+
+    Booking.objects.bulk_update(
+        updated, ['total_duration_minutes', 'services_count', 'services_summary'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0012_bookingreadstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_services_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0013_backfill_services_summary'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bookingmessage',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,762 @@
+import asyncio
+import datetime
+import threading
+from importlib import import_module
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError, connection, transaction
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from barbershops.models import Barbershop, Service
+from notifications.models import Notification
+from notifications.utils import build_booking_notification
+from .availability_utils import WEEKDAYS, get_available_slots
+from .chat_utils import CHAT_HISTORY_MAX_PAGE_SIZE, BufferedChatMessage, ChatWriteBuffer, get_chat_history
+from .forms import BookingForm
+from .broadcast_utils import get_turn_sequence, get_turn_snapshot, get_turn_update_since, store_turn_snapshot
+from .transition_utils import (
+    TransitionError, TurnConflictError, apply_bulk_transition, apply_transition, call_next_turn
+)
+from .consumers import ChatConsumer
+from .models import Booking, BookingHistory, BookingMessage, BookingReadState, QueueCounter, status_breakdown_cache_key
+
+User = get_user_model()
+
+
+class BookingTestMixin:
+    """محل وصاحبه وعميل وخدمة، مع إنشاء حجوزات اليوم بأرقام أدوار متتالية"""
+
+    @classmethod
+    def create_shop(cls, name='shop'):
+        owner = User.objects.create_user(
+            username=f'owner_{name}', email=f'owner_{name}@example.com', password='pass',
+            user_type='barber', is_email_verified=True
+        )
+        barbershop = Barbershop.objects.create(
+            owner=owner, name=name, description='d', address='a', phone_number='1',
+            opening_time=datetime.time(9), closing_time=datetime.time(18)
+        )
+        service = Service.objects.create(barbershop=barbershop, name='قص', price=10, duration=30)
+        return owner, barbershop, service
+
+    @classmethod
+    def create_customer(cls, name='customer'):
+        return User.objects.create_user(
+            username=name, email=f'{name}@example.com', password='pass', is_email_verified=True
+        )
+
+    def build_form(self, services, day=None, user=None, **data):
+        """نموذج حجز صالح للخدمات المحددة (لعميل مسجل أو لضيف ببيانات data)"""
+        form_data = QueryDict(mutable=True)
+        form_data.update({
+            'barbershop': self.barbershop.pk,
+            'booking_day': day or timezone.localdate() + datetime.timedelta(days=1),
+            **data
+        })
+        form_data.setlist('selected_services', [service.pk for service in services])
+        form = BookingForm(data=form_data, user=user, barbershop=self.barbershop)
+        if not form.is_valid():
+            raise AssertionError(form.errors)
+        return form
+
+    def create_booking(self, queue_number, service=None, day=None, status='pending', customer=None):
+        return Booking.objects.create(
+            barbershop=self.barbershop,
+            customer=customer or self.customer,
+            service=service,
+            booking_day=day or timezone.localdate(),
+            queue_number=queue_number,
+            status=status,
+            total_price=10
+        )
+
+
+class BookingWithoutServiceRenderTests(BookingTestMixin, TestCase):
+    """الحجوزات متعددة الخدمات (service=None) تُعرض بدون أخطاء في صفحات صاحب المحل"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+
+    def setUp(self):
+        self.booking = self.create_booking(1)
+        self.client.force_login(self.owner)
+
+    def test_merchant_pages_render(self):
+        for url in (
+            reverse('bookings:merchant_list', args=[self.barbershop.pk]),
+            reverse('bookings:today'),
+            reverse('bookings:search'),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_services_summary_is_shown(self):
+        self.booking.set_services_summary([(self.service, 2)])
+        self.booking.save()
+        for url in (reverse('bookings:today'), reverse('bookings:search')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, self.booking.services_summary)
+                self.assertContains(response, '60 دقيقة')
+
+    def test_notification_uses_stored_summary(self):
+        self.booking.set_services_summary([(self.service, 2)])
+        self.booking.save()
+        booking = Booking.objects.select_related('barbershop__owner', 'customer').get(pk=self.booking.pk)
+        with self.assertNumQueries(0):
+            notification = build_booking_notification(booking, 'new_booking')
+        self.assertIn(self.booking.services_summary, notification.message)
+
+    def test_migration_backfills_summary(self):
+        legacy = self.create_booking(2, service=self.service)
+        backfill = import_module('bookings.migrations.0013_backfill_services_summary').backfill_services_summary
+        backfill(apps, None)
+        legacy.refresh_from_db()
+        self.assertEqual(
+            (legacy.total_duration_minutes, legacy.services_count, legacy.services_summary),
+            (30, 1, 'قص')
+        )
+        # حجز بدون أي خدمة يبقى بدون ملخص
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.services_count, 0)
+
+
+class AvailabilityTests(BookingTestMixin, TestCase):
+    """المواعيد المتاحة بعد توزيع طابور اليوم"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+        # من 9 إلى 18 كل الأيام بدون فترة راحة
+        cls.barbershop.settings = {
+            'working_hours': {day: {'start': '09:00', 'end': '18:00'} for day in WEEKDAYS}
+        }
+        cls.barbershop.booking_slots = {}
+        cls.barbershop.save()
+
+    def setUp(self):
+        # حذف الكاش يتم بعد نجاح المعاملة، وهو ما لا يحدث داخل TestCase
+        cache.clear()
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+
+    def slots_at(self, hour, minute=0):
+        now = datetime.datetime.combine(self.day, datetime.time(hour, minute))
+        return get_available_slots(self.barbershop, self.day, 30, now=now)
+
+    def test_queue_laid_out_from_opening_time(self):
+        self.create_booking(1, service=self.service, day=self.day)
+        self.create_booking(2, service=self.service, day=self.day)
+        self.assertEqual(self.slots_at(8)[:2], ['10:00', '10:30'])
+
+    def test_queue_behind_schedule_occupies_upcoming_time(self):
+        # حجزان منتظران (ساعة كاملة) لم يُنفذا رغم أن وقت الفتح مضى منذ 3 ساعات
+        self.create_booking(1, service=self.service, day=self.day)
+        self.create_booking(2, service=self.service, day=self.day)
+        slots = self.slots_at(12)
+        self.assertNotIn('12:00', slots)
+        self.assertNotIn('12:30', slots)
+        self.assertEqual(slots[0], '13:00')
+
+    def test_other_days_ignore_current_time(self):
+        self.create_booking(1, service=self.service, day=self.day)
+        now = datetime.datetime.combine(self.day - datetime.timedelta(days=1), datetime.time(12))
+        self.assertEqual(get_available_slots(self.barbershop, self.day, 30, now=now)[0], '09:30')
+
+
+class TurnSequenceTests(BookingTestMixin, TestCase):
+    """أرقام تسلسل حالة الطابور تُستخدم فقط مع كاش مشترك بين العمليات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SHARED_CACHE=True)
+    def test_updates_since_sequence(self):
+        first = store_turn_snapshot(self.barbershop.pk, get_turn_snapshot(self.barbershop.pk))
+        self.assertIsNone(get_turn_update_since(self.barbershop.pk, first['sequence']))
+
+        booking = self.create_booking(1, service=self.service)
+        cache.delete(status_breakdown_cache_key(self.barbershop.pk, booking.booking_day))
+        second = store_turn_snapshot(self.barbershop.pk, get_turn_snapshot(self.barbershop.pk))
+        self.assertEqual(second['sequence'], first['sequence'] + 1)
+
+        delta = get_turn_update_since(self.barbershop.pk, first['sequence'])
+        self.assertTrue(delta['delta'])
+        self.assertEqual(delta['waiting_count'], 1)
+        self.assertNotIn('current_turn_number', delta)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_no_sequence_without_shared_cache(self):
+        snapshot = store_turn_snapshot(self.barbershop.pk, get_turn_snapshot(self.barbershop.pk))
+        self.assertNotIn('sequence', snapshot)
+        self.assertIsNone(get_turn_sequence(self.barbershop.pk))
+        # since يُتجاهل: الحالة الكاملة الحالية
+        update = get_turn_update_since(self.barbershop.pk, 5)
+        self.assertNotIn('delta', update)
+        self.assertEqual(update['current_turn_number'], 0)
+
+
+class QueueCounterConcurrencyTests(BookingTestMixin, TransactionTestCase):
+    """حجوزات متزامنة لنفس المحل واليوم تحصل على أرقام أدوار متتالية بدون تكرار أو فجوات"""
+
+    BOOKINGS = 200
+    WORKERS = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('يحتاج قاعدة اختبار تقبل عدة اتصالات (ملف SQLite أو PostgreSQL)')
+        self.owner, self.barbershop, self.service = self.create_shop()
+        self.customer = self.create_customer()
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+
+    def book(self, start, index):
+        # حجز ضيف برقم هاتف مختلف (الحد اليومي لكل رقم هاتف)
+        form = self.build_form(
+            [self.service], day=self.day, customer_name=f'guest {index}', customer_phone=f'01{index:09d}'
+        )
+        start.wait()
+        try:
+            return form.save().queue_number
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_get_unique_consecutive_numbers(self):
+        start = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            futures = [executor.submit(self.book, start, i) for i in range(self.BOOKINGS)]
+            start.set()
+            numbers = [future.result() for future in futures]
+
+        expected = list(range(1, self.BOOKINGS + 1))
+        self.assertEqual(sorted(numbers), expected)
+        self.assertEqual(
+            sorted(Booking.objects.filter(barbershop=self.barbershop).values_list('queue_number', flat=True)),
+            expected
+        )
+        self.assertEqual(QueueCounter.objects.get(barbershop=self.barbershop, day=self.day).last_number, self.BOOKINGS)
+
+    def test_duplicate_queue_number_rejected(self):
+        self.create_booking(1, service=self.service, day=self.day)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_booking(1, service=self.service, day=self.day)
+
+
+class BookingFormSaveQueryTests(BookingTestMixin, TestCase):
+    """حفظ حجز متعدد الخدمات: إدراج واحد للحجز وإدراج مجمع واحد للخدمات وإشعار واحد"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+        cls.services = [cls.service] + [
+            Service.objects.create(barbershop=cls.barbershop, name=f'خدمة {i}', price=5, duration=15)
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def writes(self, queries, table):
+        return {
+            kind: sum(1 for query in queries if query['sql'].startswith(f'{kind} "{table}"'))
+            for kind in ('INSERT INTO', 'UPDATE')
+        }
+
+    def test_save_query_budget(self):
+        form = self.build_form(self.services, user=self.customer)
+        # عداد الأدوار لأول حجز في اليوم (7 مع نقاط الحفظ)، إدراج الحجز، قراءة صاحب
+        # المحل وإدراج إشعاره، إدراج مجمع للخدمات، ونقطتا حفظ معاملة النموذج
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(13) as context:
+                booking = form.save()
+
+        self.assertEqual(self.writes(context.captured_queries, Booking._meta.db_table), {'INSERT INTO': 1, 'UPDATE': 0})
+        self.assertEqual(self.writes(context.captured_queries, 'bookings_bookingservice')['INSERT INTO'], 1)
+        self.assertEqual(booking.booking_services.count(), len(self.services))
+        self.assertEqual(Notification.objects.filter(recipient=self.owner).count(), 1)
+
+
+class TransitionQueryTests(BookingTestMixin, TestCase):
+    """انتقال حالة حجز واحد بعدد استعلامات ثابت"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+
+    def setUp(self):
+        self.booking = self.create_booking(3, service=self.service)
+        self.booking.set_services_summary([(self.service, 1)])
+        self.booking.save()
+
+    def test_confirm_query_count(self):
+        # نقطتا الحفظ، رقم محل الحجز، قفل المحل ثم الحجز، تحديث الحالة، تحديث
+        # رقم الدور، وإدراج سجل التاريخ والرسالة والإشعار
+        with self.assertNumQueries(10):
+            booking = apply_transition(self.booking.pk, 'confirm', self.owner)
+
+        self.assertEqual(booking.status, 'confirmed')
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, 'confirmed')
+        self.barbershop.refresh_from_db()
+        self.assertEqual(self.barbershop.current_turn_number, 3)
+        self.assertTrue(BookingHistory.objects.filter(booking=booking, new_status='confirmed').exists())
+        self.assertEqual(BookingMessage.objects.filter(booking=booking).count(), 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.customer).count(), 1)
+
+    def test_complete_query_count(self):
+        # بدون رسالة محادثة أو تحديث لرقم الدور
+        with self.assertNumQueries(8):
+            apply_transition(self.booking.pk, 'complete', self.owner)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatWriteBufferTests(BookingTestMixin, TransactionTestCase):
+    """حفظ رسائل المحادثة المؤجل: الترتيب والتأكيدات وفشل الحفظ"""
+
+    def setUp(self):
+        self.owner, self.barbershop, self.service = self.create_shop()
+        self.customer = self.create_customer()
+        self.booking = self.create_booking(1, service=self.service)
+        # مدة طويلة حتى لا يتم الحفظ إلا باستدعاء flush
+        self.buffer = ChatWriteBuffer(flush_interval_ms=60 * 1000, batch_size=3)
+
+    def entry(self, uid, reply_channel, sender=None):
+        sender = sender or self.customer
+        return BufferedChatMessage(
+            uid=uid, booking_id=self.booking.pk, sender=sender, message=f'رسالة {uid}',
+            reply_channel=reply_channel,
+            recipient_id=self.owner.pk if sender == self.customer else self.customer.pk,
+            notification_title='رسالة جديدة'
+        )
+
+    @async_to_sync
+    async def send_and_flush(self, entries, count):
+        """إضافة الرسائل ثم الحفظ، وإرجاع ما وصل لكل قناة رد"""
+        layer = get_channel_layer()
+        channels = [await layer.new_channel() for _ in range(count)]
+        for entry in entries(channels):
+            await self.buffer.add(entry)
+        await self.buffer.flush()
+        return [await layer.receive(channel) for channel in channels], channels
+
+    def test_messages_saved_in_arrival_order_and_acknowledged(self):
+        uids = [f'u{i}' for i in range(7)]
+        received, _ = self.send_and_flush(
+            lambda channels: [
+                self.entry(uid, channels[i % 2], self.customer if i % 2 else self.owner)
+                for i, uid in enumerate(uids)
+            ],
+            2
+        )
+
+        saved = list(BookingMessage.objects.filter(booking=self.booking).order_by('pk'))
+        self.assertEqual([message.message for message in saved], [f'رسالة {uid}' for uid in uids])
+        self.assertEqual(Notification.objects.filter(notification_type='new_message').count(), len(uids))
+        self.assertEqual(self.buffer.pending, [])
+
+        # تأكيد واحد لكل مرسل في كل دفعة، بأرقام قاعدة البيانات بنفس ترتيب الإرسال
+        ids = {message.message.split()[-1]: message.pk for message in saved}
+        self.assertEqual(received[0]['type'], 'chat_ack')
+        self.assertEqual(received[0]['messages'], [{'uid': 'u0', 'id': ids['u0']}, {'uid': 'u2', 'id': ids['u2']}])
+
+    def test_failed_flush_nacks_and_saves_nothing(self):
+        with mock.patch.object(ChatWriteBuffer, 'persist', side_effect=RuntimeError('db down')):
+            received, _ = self.send_and_flush(
+                lambda channels: [self.entry('a', channels[0]), self.entry('b', channels[0])],
+                1
+            )
+
+        self.assertEqual(received[0], {'type': 'chat_nack', 'messages': [{'uid': 'a', 'id': None}, {'uid': 'b', 'id': None}]})
+        self.assertFalse(BookingMessage.objects.exists())
+        self.assertEqual(self.buffer.pending, [])
+
+    @async_to_sync
+    async def add_without_flush(self, uid):
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await self.buffer.add(self.entry(uid, channel))
+        return layer, channel
+
+    def test_unflushed_messages_are_lost_without_ack(self):
+        # توقف العملية قبل الحفظ: لا شيء في قاعدة البيانات ولا تأكيد للمرسل
+        layer, channel = self.add_without_flush('lost')
+        self.buffer._flush_handle.cancel()
+        self.buffer = None
+
+        self.assertFalse(BookingMessage.objects.exists())
+        with self.assertRaises(asyncio.TimeoutError):
+            async_to_sync(asyncio.wait_for)(layer.receive(channel), 0.1)
+
+
+class ChatHistoryTests(BookingTestMixin, TestCase):
+    """صفحات سجل المحادثة بالمؤشرات before_id و after_id"""
+
+    MESSAGES = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+        cls.booking, other = (
+            Booking.objects.create(
+                barbershop=cls.barbershop, customer=cls.customer, service=cls.service,
+                booking_day=timezone.localdate(), queue_number=number, total_price=10
+            )
+            for number in (1, 2)
+        )
+        # رسائل المحادثتين متداخلة حتى لا تكون أرقام رسائل الحجز متتالية
+        messages = []
+        for i in range(cls.MESSAGES):
+            messages.append(BookingMessage(booking=cls.booking, sender=cls.customer, message=f'رسالة {i}'))
+            messages.append(BookingMessage(booking=other, sender=cls.customer, message=f'أخرى {i}'))
+        BookingMessage.objects.bulk_create(messages)
+        cls.ids = list(
+            BookingMessage.objects.filter(booking=cls.booking).order_by('pk').values_list('pk', flat=True)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def page_ids(self, **kwargs):
+        page, has_more = get_chat_history(self.booking.pk, **kwargs)
+        return [message.pk for message in page], has_more
+
+    def get(self, **params):
+        return self.client.get(reverse('bookings:chat_history', args=[self.booking.pk]), params)
+
+    def test_latest_page(self):
+        self.assertEqual(self.page_ids(limit=10), (self.ids[-10:], True))
+        self.assertEqual(self.page_ids(limit=self.MESSAGES), (self.ids, False))
+
+    def test_page_boundaries(self):
+        # before_id و after_id لا يشملان الرسالة نفسها
+        self.assertEqual(self.page_ids(before_id=self.ids[10], limit=10), (self.ids[:10], False))
+        self.assertEqual(self.page_ids(before_id=self.ids[11], limit=10), (self.ids[1:11], True))
+        self.assertEqual(self.page_ids(after_id=self.ids[14], limit=10), (self.ids[15:25], False))
+        self.assertEqual(self.page_ids(after_id=self.ids[13], limit=10), (self.ids[14:24], True))
+        self.assertEqual(self.page_ids(before_id=self.ids[0]), ([], False))
+        self.assertEqual(self.page_ids(after_id=self.ids[-1]), ([], False))
+
+    def test_paging_backwards_through_conversation(self):
+        seen = []
+        data = self.get(limit=7).json()
+        while True:
+            seen = [message['id'] for message in data['messages']] + seen
+            if not data['has_more']:
+                break
+            data = self.get(before_id=data['messages'][0]['id'], limit=7).json()
+        self.assertEqual(seen, self.ids)
+
+    def test_paging_forwards_through_conversation(self):
+        seen = []
+        data = self.get(after_id=0, limit=7).json()
+        while True:
+            seen += [message['id'] for message in data['messages']]
+            if not data['has_more']:
+                break
+            data = self.get(after_id=seen[-1], limit=7).json()
+        self.assertEqual(seen, self.ids)
+        self.assertEqual(data['messages'][-1]['message'], f'رسالة {self.MESSAGES - 1}')
+
+    def test_invalid_parameters(self):
+        for params in (
+            {'before_id': 'abc'},
+            {'after_id': '1.5'},
+            {'limit': 'x'},
+            {'before_id': self.ids[5], 'after_id': self.ids[1]},
+        ):
+            with self.subTest(params=params):
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['status'], 'error')
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.get(limit=0).json()['messages']), 1)
+        self.assertEqual(len(self.get(limit=-5).json()['messages']), 1)
+        with mock.patch('bookings.views.CHAT_HISTORY_MAX_PAGE_SIZE', 4):
+            self.assertEqual(len(self.get(limit=CHAT_HISTORY_MAX_PAGE_SIZE).json()['messages']), 4)
+
+    def test_other_users_cannot_read_history(self):
+        self.client.force_login(self.create_customer('stranger'))
+        self.assertEqual(self.get().status_code, 404)
+
+
+class ReadStateTests(BookingTestMixin, TransactionTestCase):
+    """آخر رسالة مقروءة لا ترجع للخلف، وقيم القراءة غير الصالحة من WebSocket يتم تجاهلها"""
+
+    # TransactionTestCase: database_sync_to_async في المستهلك يغلق الاتصال المفتوح داخل معاملة TestCase
+
+    def setUp(self):
+        self.owner, self.barbershop, self.service = self.create_shop()
+        self.customer = self.create_customer()
+        self.booking = self.create_booking(1, service=self.service)
+
+    def last_read(self):
+        return BookingReadState.objects.get(booking=self.booking, user=self.customer).last_read_message_id
+
+    def test_mark_read_is_monotonic(self):
+        BookingReadState.mark_read(self.booking.pk, self.customer.pk, 10)
+        self.assertEqual(self.last_read(), 10)
+        BookingReadState.mark_read(self.booking.pk, self.customer.pk, 5)
+        self.assertEqual(self.last_read(), 10)
+        BookingReadState.mark_read(self.booking.pk, self.customer.pk, 12)
+        self.assertEqual(self.last_read(), 12)
+
+    def test_mark_read_defaults_to_last_message(self):
+        message = BookingMessage.objects.create(booking=self.booking, sender=self.owner, message='m')
+        BookingReadState.mark_read(self.booking.pk, self.customer.pk)
+        self.assertEqual(self.last_read(), message.pk)
+
+    def test_consumer_ignores_invalid_read_values(self):
+        consumer = ChatConsumer()
+        consumer.booking_id = self.booking.pk
+        consumer.user = self.customer
+        BookingReadState.mark_read(self.booking.pk, self.customer.pk, 3)
+        for value in ('abc', [1], {'id': 1}, -1, 0):
+            with self.subTest(value=value):
+                async_to_sync(consumer.mark_read)(value)
+                self.assertEqual(self.last_read(), 3)
+        async_to_sync(consumer.mark_read)('7')
+        self.assertEqual(self.last_read(), 7)
+
+
+class BulkStatusTests(BookingTestMixin, TestCase):
+    """تحديث حالة عدة حجوزات دفعة واحدة: الصلاحيات وتخطي الانتقالات غير المسموحة وعدد الاستعلامات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.other_owner, cls.other_barbershop, _ = cls.create_shop('other')
+        cls.customer = cls.create_customer()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+
+    def create_bookings(self, statuses):
+        bookings = []
+        for number, status in enumerate(statuses, start=1):
+            booking = self.create_booking(number, service=self.service, status=status)
+            booking.set_services_summary([(self.service, 1)])
+            booking.save()
+            bookings.append(booking)
+        return bookings
+
+    def post(self, booking_ids, status):
+        return self.client.post(
+            reverse('bookings:bulk_status', args=[self.barbershop.pk]),
+            {'booking_ids': booking_ids, 'status': status},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+
+    def test_booking_of_other_shop_rejects_whole_batch(self):
+        own, = self.create_bookings(['pending'])
+        foreign = Booking.objects.create(
+            barbershop=self.other_barbershop, customer=self.customer, service=None,
+            booking_day=timezone.localdate(), queue_number=1, total_price=10
+        )
+        with self.assertRaises(PermissionDenied):
+            apply_bulk_transition(self.barbershop, [own.pk, foreign.pk], 'confirmed', self.owner)
+
+        self.assertEqual(self.post([own.pk, foreign.pk], 'confirmed').status_code, 403)
+        self.assertEqual(
+            set(Booking.objects.values_list('status', flat=True)), {'pending'}
+        )
+        self.assertFalse(BookingHistory.objects.exists())
+
+    def test_other_owner_is_denied(self):
+        booking, = self.create_bookings(['pending'])
+        self.client.force_login(self.other_owner)
+        self.assertEqual(self.post([booking.pk], 'confirmed').status_code, 403)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'pending')
+
+    def test_invalid_transitions_in_batch_are_skipped(self):
+        first, done, last = self.create_bookings(['pending', 'completed', 'pending'])
+        missing = last.pk + 100
+
+        response = self.post([first.pk, done.pk, last.pk, missing], 'confirmed')
+
+        data = response.json()
+        self.assertEqual(data['updated'], [first.pk, last.pk])
+        self.assertEqual(data['skipped'], [done.pk, missing])
+        self.assertEqual(data['current_turn_number'], 3)
+        self.assertEqual(
+            dict(Booking.objects.values_list('pk', 'status')),
+            {first.pk: 'confirmed', done.pk: 'completed', last.pk: 'confirmed'}
+        )
+        self.assertEqual(
+            sorted(BookingHistory.objects.values_list('booking_id', flat=True)), [first.pk, last.pk]
+        )
+
+    def test_unsupported_status(self):
+        booking, = self.create_bookings(['pending'])
+        self.assertEqual(self.post([booking.pk], 'pending').status_code, 400)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        # التحقق من محل الحجوزات، نقطتا الحفظ، قفل المحل ثم الحجوزات، تحديث الحالة
+        # ورقم الدور، وإدراج مجمع للتاريخ والرسائل والإشعارات
+        for count in (2, 10):
+            with self.subTest(count=count):
+                Booking.objects.all().delete()
+                ids = [booking.pk for booking in self.create_bookings(['pending'] * count)]
+                with self.assertNumQueries(10):
+                    bookings, skipped = apply_bulk_transition(self.barbershop, ids, 'confirmed', self.owner)
+                self.assertEqual((len(bookings), skipped), (count, []))
+
+
+class TransitionResponseTests(BookingTestMixin, TestCase):
+    """ردود أخطاء ونجاح طلبات تغيير الحالة الموحدة بين طلبات AJAX والنماذج العادية"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+        self.booking = self.create_booking(1, service=self.service, status='completed')
+        self.merchant_url = reverse('bookings:merchant_list', args=[self.barbershop.pk])
+
+    def post(self, url, data=None, ajax=False):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+        return self.client.post(url, data or {}, **headers)
+
+    def test_transition_error(self):
+        url = reverse('bookings:confirm', args=[self.booking.pk])
+        response = self.post(url, ajax=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+
+        response = self.post(url)
+        self.assertRedirects(response, self.merchant_url, fetch_redirect_response=False)
+
+    def test_permission_denied(self):
+        self.client.force_login(self.customer)
+        for ajax in (True, False):
+            with self.subTest(ajax=ajax):
+                response = self.post(reverse('bookings:call_next', args=[self.barbershop.pk]), ajax=ajax)
+                self.assertEqual(response.status_code, 403)
+
+    def test_turn_conflict(self):
+        url = reverse('bookings:call_next', args=[self.barbershop.pk])
+        response = self.post(url, {'current_turn_number': 5}, ajax=True)
+        self.assertEqual(response.status_code, 409)
+
+    def test_bulk_without_bookings(self):
+        url = reverse('bookings:bulk_status', args=[self.barbershop.pk])
+        self.assertEqual(self.post(url, {'status': 'confirmed'}, ajax=True).status_code, 400)
+        self.assertRedirects(
+            self.post(url, {'status': 'confirmed'}), self.merchant_url, fetch_redirect_response=False
+        )
+
+    def test_success(self):
+        pending = self.create_booking(2, service=self.service)
+        url = reverse('bookings:confirm', args=[pending.pk])
+        data = self.post(url, ajax=True).json()
+        self.assertEqual((data['status'], data['booking_id'], data['current_turn_number']), ('success', pending.pk, 2))
+
+        other = self.create_booking(3, service=self.service)
+        response = self.post(reverse('bookings:confirm', args=[other.pk]))
+        self.assertRedirects(response, self.merchant_url, fetch_redirect_response=False)
+
+
+class CallNextTurnTests(BookingTestMixin, TestCase):
+    """استدعاء الدور التالي: قفل المحل أولاً ثم الحجوزات ثم كتابة رقم الدور"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+
+    def setUp(self):
+        self.barbershop.refresh_from_db()
+
+    def test_calls_next_pending_and_completes_current(self):
+        first = self.create_booking(1, service=self.service, status='confirmed')
+        second = self.create_booking(2, service=self.service)
+        for booking in (first, second):
+            booking.set_services_summary([(self.service, 1)])
+            booking.save()
+        Barbershop.objects.filter(pk=self.barbershop.pk).update(current_turn_number=1)
+        self.barbershop.refresh_from_db()
+
+        # نقطتا الحفظ، قفل المحل، قفل الحجزين، تحديث حالتي الحجزين، تحديث رقم
+        # الدور، وإدراج سجلات التاريخ ورسالة التأكيد والإشعارات
+        with self.assertNumQueries(9):
+            previous, called = call_next_turn(self.barbershop, self.owner, 1)
+
+        self.assertEqual((previous.pk, called.pk), (first.pk, second.pk))
+        self.assertEqual(Booking.objects.get(pk=first.pk).status, 'completed')
+        self.assertEqual(Booking.objects.get(pk=second.pk).status, 'confirmed')
+        self.assertEqual(Barbershop.objects.get(pk=self.barbershop.pk).current_turn_number, 2)
+        self.assertEqual(self.barbershop.current_turn_number, 2)
+
+    def test_stale_turn_number_conflicts(self):
+        self.create_booking(1, service=self.service)
+        self.create_booking(2, service=self.service)
+        call_next_turn(self.barbershop, self.owner, 0)
+
+        # حلاق آخر ما زال يرى الدور 0
+        with self.assertRaises(TurnConflictError):
+            call_next_turn(self.barbershop, self.owner, 0)
+        self.assertEqual(Barbershop.objects.get(pk=self.barbershop.pk).current_turn_number, 1)
+
+    def test_empty_queue(self):
+        self.create_booking(1, service=self.service, status='cancelled')
+        with self.assertRaisesMessage(TransitionError, 'لا توجد حجوزات في الانتظار'):
+            call_next_turn(self.barbershop, self.owner, 0)
+        self.assertEqual(Barbershop.objects.get(pk=self.barbershop.pk).current_turn_number, 0)
+
+
+class MerchantDashboardLiveUpdateTests(BookingTestMixin, TestCase):
+    """لوحة صاحب المحل تطبق حالة الطابور على الصفحة بدلاً من إعادة تحميلها"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.barbershop, cls.service = cls.create_shop()
+        cls.customer = cls.create_customer()
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+        self.url = reverse('bookings:merchant_list', args=[self.barbershop.pk])
+
+    def test_page_marks_todays_bookings_for_live_updates(self):
+        booking = self.create_booking(1, service=self.service)
+        response = self.client.get(self.url)
+        self.assertContains(response, f'data-booking-id="{booking.pk}" data-status="pending" data-today')
+        self.assertContains(response, 'const showsToday = true;')
+        self.assertNotContains(response, 'location.reload()')
+
+    def test_older_pages_do_not_show_today(self):
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        self.create_booking(1, service=self.service, day=yesterday)
+        response = self.client.get(self.url, {'before': timezone.localdate().isoformat()})
+        self.assertContains(response, 'const showsToday = false;')
+
+    @override_settings(SHARED_CACHE=False)
+    def test_reconnect_without_shared_cache_gets_full_snapshot(self):
+        # كل اتصال يتلقى الحالة الكاملة بدون تسلسل، والصفحة تطبقها كما هي
+        booking = self.create_booking(1, service=self.service)
+        update = get_turn_update_since(self.barbershop.pk)
+        self.assertNotIn('sequence', update)
+        self.assertEqual([item['booking_id'] for item in update['wait_times']], [booking.pk])
+        again = get_turn_update_since(self.barbershop.pk)
+        self.assertEqual(again.keys(), update.keys())
+        self.assertEqual(again['waiting_count'], 1)
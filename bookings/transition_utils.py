@@ -0,0 +1,310 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from django.core.exceptions import PermissionDenied
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from barbershops.models import Barbershop
+from notifications.utils import booking_notification_key, build_booking_notification, deliver_notifications
+from notifications.signals import STATUS_NOTIFICATION_TYPES
+from .broadcast_utils import broadcast_turn_update
+from .models import Booking, BookingHistory, BookingMessage
+from .signals import invalidate_day_caches
+from .wait_time_utils import learn_from_completion
+
+# انتقالات الحجز المسموحة:
+#   actor: من يحق له التنفيذ (owner صاحب المحل / customer العميل)
+#   from: الحالات التي يمكن الانتقال منها
+#   message: رسالة تُضاف لمحادثة الحجز (اختياري)
+#   advance_turn: تحديث رقم الدور الحالي في المحل إلى رقم الحجز
+TRANSITIONS: Dict[str, Dict[str, Any]] = {
+    'confirm': {
+        'actor': 'owner',
+        'from': ('pending',),
+        'to': 'confirmed',
+        'notes': 'تم تأكيد الحجز بواسطة صاحب المحل.',
+        'message': 'تهانينا! تم تأكيد حجزك.',
+        'advance_turn': True,
+        'error': 'لا يمكن تأكيد هذا الحجز لأنه ليس في حالة الانتظار.',
+    },
+    'reject': {
+        'actor': 'owner',
+        'from': ('pending',),
+        'to': 'cancelled',
+        'notes': 'تم رفض الحجز بواسطة صاحب المحل.',
+        'message': 'نعتذر، تم رفض حجزك من قبل صاحب المحل.',
+        'error': 'لا يمكن رفض هذا الحجز لأنه ليس في حالة الانتظار.',
+    },
+    'complete': {
+        'actor': 'owner',
+        'from': ('pending', 'confirmed'),
+        'to': 'completed',
+        'notes': 'تم تحديث الحالة إلى مكتمل بواسطة صاحب المحل.',
+        'error': 'لا يمكن إكمال حجز ملغي أو منتهي.',
+    },
+    'no_show': {
+        'actor': 'owner',
+        'from': ('pending', 'confirmed'),
+        'to': 'no_show',
+        'notes': 'تم تحديث الحالة إلى لم يحضر بواسطة صاحب المحل.',
+        'error': 'لا يمكن تحديث حجز ملغي أو منتهي.',
+    },
+    'cancel': {
+        'actor': 'customer',
+        'from': ('pending', 'confirmed'),
+        'to': 'cancelled',
+        'notes': 'تم إلغاء الحجز من قبل العميل',
+        'error': 'لا يمكن إلغاء هذا الحجز لأنه ملغي أو منتهي بالفعل.',
+    },
+}
+
+
+# الحالة المطلوبة في التحديث المجمع -> انتقال صاحب المحل المقابل
+BULK_STATUS_ACTIONS = {
+    'confirmed': 'confirm',
+    'completed': 'complete',
+    'no_show': 'no_show',
+    'cancelled': 'reject',
+}
+
+
+class TransitionError(Exception):
+    """الانتقال غير مسموح من حالة الحجز الحالية"""
+
+
+class TurnConflictError(TransitionError):
+    """تم تغيير رقم الدور الحالي في المحل من طلب آخر"""
+
+
+def _select_for_update(queryset):
+    """قفل صفوف النموذج الأساسي فقط (العميل اختياري ولا يمكن قفل الطرف الاختياري من الربط)"""
+    if connection.features.has_select_for_update_of:
+        return queryset.select_for_update(of=('self',))
+    return queryset.select_for_update()
+
+
+def _lock_barbershop(barbershop_id: int) -> Barbershop:
+    """
+    قفل صف المحل مع تحميل صاحبه
+
+    كل الانتقالات تقفل المحل أولاً ثم حجوزاته، فلا تتعارض أقفال استدعاء الدور
+    التالي مع تأكيد أو إلغاء حجز في نفس المحل (deadlock).
+    """
+    return _select_for_update(Barbershop.objects.select_related('owner')).get(pk=barbershop_id)
+
+
+def _lock_booking(booking_id: int) -> Booking:
+    """قفل محل الحجز ثم الحجز نفسه مع العميل"""
+    barbershop_id = Booking.objects.values_list('barbershop_id', flat=True).get(pk=booking_id)
+    barbershop = _lock_barbershop(barbershop_id)
+    booking = _select_for_update(Booking.objects.select_related('customer')).get(pk=booking_id)
+    if booking.barbershop_id != barbershop.pk:
+        raise TransitionError('تم تعديل الحجز، يرجى تحديث الصفحة.')
+    booking.barbershop = barbershop
+    return booking
+
+
+def _write_transition(barbershop, changes: List[Tuple[Booking, Dict[str, Any]]], user, notes: Optional[str]) -> None:
+    """
+    حفظ انتقالات حجوزات محل واحد (داخل المعاملة وبعد القفل): تحديث واحد
+    للحالة وإدراج مجمع لسجلات التاريخ والرسائل والإشعارات
+
+    Args:
+        changes: قائمة (الحجز، الانتقال) ويمكن أن تختلف الحالة الجديدة بين الحجوزات
+    """
+    bookings = [booking for booking, _ in changes]
+    now = timezone.now()
+    old_statuses = {booking.pk: booking.status for booking in bookings}
+    new_statuses = {booking.pk: transition['to'] for booking, transition in changes}
+
+    if len(set(new_statuses.values())) == 1:
+        status = next(iter(new_statuses.values()))
+    else:
+        status = Case(*(When(pk=pk, then=Value(value)) for pk, value in new_statuses.items()))
+    Booking.objects.filter(pk__in=list(new_statuses)).update(status=status, updated_at=now)
+    for booking in bookings:
+        booking.status = new_statuses[booking.pk]
+        booking.updated_at = now
+        # الحالة المحفوظة أصبحت الحالة الجديدة (لا يوجد تغيير معلق على الكائن)
+        booking._loaded_status = booking.status
+
+    turn_numbers = [booking.queue_number for booking, transition in changes if transition.get('advance_turn')]
+    if turn_numbers:
+        # تحديث شرطي: لا يرجع رقم الدور للخلف عند تأكيد حجزين في نفس الوقت
+        Barbershop.objects.filter(pk=barbershop.pk).update(
+            current_turn_number=Greatest(F('current_turn_number'), max(turn_numbers))
+        )
+        barbershop.current_turn_number = max(barbershop.current_turn_number, *turn_numbers)
+
+    histories = BookingHistory.objects.bulk_create([
+        BookingHistory(
+            booking=booking,
+            old_status=old_statuses[booking.pk],
+            new_status=booking.status,
+            changed_by=user,
+            notes=transition['notes'] if notes is None else notes
+        )
+        for booking, transition in changes
+    ])
+
+    # رسالة النظام لا تولد إشعار "رسالة جديدة": العميل يتلقى إشعار الحالة أدناه
+    chat_messages = [
+        BookingMessage(booking=booking, sender=user, message=transition['message'])
+        for booking, transition in changes if transition.get('message')
+    ]
+    if chat_messages:
+        BookingMessage.objects.bulk_create(chat_messages)
+
+    notifications, dedup_keys = [], []
+    for booking in bookings:
+        notification_type = STATUS_NOTIFICATION_TYPES.get(booking.status)
+        notification = notification_type and build_booking_notification(booking, notification_type)
+        if notification:
+            notifications.append(notification)
+            dedup_keys.append(booking_notification_key(booking, notification_type))
+    deliver_notifications(notifications, dedup_keys)
+
+    for day in {booking.booking_day for booking in bookings}:
+        invalidate_day_caches(barbershop.pk, day)
+    completed = [history for history in histories if history.new_status == 'completed']
+    if completed:
+        def learn():
+            for history in completed:
+                learn_from_completion(history)
+        transaction.on_commit(learn)
+    broadcast_turn_update(barbershop.pk)
+
+
+def apply_transition(booking_id: int, action: str, user, notes: Optional[str] = None) -> Booking:
+    """
+    تنفيذ انتقال حالة الحجز في معاملة واحدة
+
+    يتم تحميل الحجز مرة واحدة مع القفل، وتحديث عمود الحالة فقط، وإدراج سجل
+    التاريخ والرسالة والإشعار مباشرة بدون المرور بإشارات الحفظ، ثم إرسال
+    التحديثات عبر WebSocket بعد نجاح المعاملة.
+
+    Raises:
+        Booking.DoesNotExist: الحجز غير موجود
+        PermissionDenied: المستخدم ليس صاحب المحل/العميل حسب الانتقال
+        TransitionError: الانتقال غير مسموح من الحالة الحالية
+    """
+    transition = TRANSITIONS[action]
+
+    with transaction.atomic():
+        booking = _lock_booking(booking_id)
+        barbershop = booking.barbershop
+
+        actor_id = barbershop.owner_id if transition['actor'] == 'owner' else booking.customer_id
+        if actor_id is None or actor_id != user.pk:
+            raise PermissionDenied('ليس لديك صلاحية لتنفيذ هذا الإجراء.')
+        if booking.status not in transition['from']:
+            raise TransitionError(transition['error'])
+
+        _write_transition(barbershop, [(booking, transition)], user, notes)
+
+    return booking
+
+
+def apply_bulk_transition(barbershop, booking_ids: Iterable[int], status: str, user,
+                          notes: Optional[str] = None) -> Tuple[List[Booking], List[int]]:
+    """
+    تطبيق حالة واحدة على عدة حجوزات في المحل في معاملة واحدة
+
+    الحجوزات غير الموجودة أو التي لا يسمح انتقالها من حالتها الحالية يتم
+    تخطيها بدون إلغاء الباقي، أما وجود حجز من محل آخر فيرفض الدفعة كاملة.
+
+    Returns:
+        (الحجوزات المحدثة، أرقام الحجوزات المتخطاة)
+
+    Raises:
+        PermissionDenied: المستخدم ليس صاحب المحل، أو أحد الحجوزات يتبع محلاً آخر
+        TransitionError: الحالة المطلوبة غير مدعومة في التحديث المجمع
+    """
+    if barbershop.owner_id != user.pk:
+        raise PermissionDenied('ليس لديك صلاحية لتنفيذ هذا الإجراء.')
+    action = BULK_STATUS_ACTIONS.get(status)
+    if action is None:
+        raise TransitionError('الحالة المطلوبة غير مدعومة في التحديث المجمع.')
+    transition = TRANSITIONS[action]
+    booking_ids = set(booking_ids)
+    # محل الحجز لا يتغير، فالتحقق يتم قبل المعاملة بدون قفل حجوزات محلات أخرى
+    if Booking.objects.filter(pk__in=booking_ids).exclude(barbershop_id=barbershop.pk).exists():
+        raise PermissionDenied('ليس لديك صلاحية لتنفيذ هذا الإجراء.')
+
+    with transaction.atomic():
+        locked = _lock_barbershop(barbershop.pk)
+        bookings = list(
+            _select_for_update(
+                Booking.objects.select_related('customer')
+            ).filter(
+                pk__in=booking_ids,
+                barbershop=locked,
+                status__in=transition['from']
+            ).order_by('queue_number')
+        )
+        for booking in bookings:
+            booking.barbershop = locked
+        if bookings:
+            _write_transition(locked, [(booking, transition) for booking in bookings], user, notes)
+
+    barbershop.current_turn_number = locked.current_turn_number
+
+    skipped = sorted(booking_ids - {booking.pk for booking in bookings})
+    return bookings, skipped
+
+
+def call_next_turn(barbershop, user, expected_turn_number: Optional[int] = None,
+                   day=None) -> Tuple[Optional[Booking], Booking]:
+    """
+    استدعاء الدور التالي: إكمال الحجز المؤكد في الدور الحالي وتأكيد أول حجز
+    في الانتظار بعده في معاملة واحدة قصيرة
+
+    يتم قفل صف المحل أولاً ومقارنة رقم الدور الحالي بالرقم الذي رآه المستخدم
+    (expected_turn_number، أو رقم المحل المحمل)، فإذا ضغط حلاقان في نفس اللحظة
+    ينجح أحدهما فقط ويتلقى الآخر TurnConflictError بدلاً من إرجاع الدور للخلف
+    أو تخطي عميل. بعد القفل لا يمكن لتأكيد أو إلغاء حجز آخر في المحل أن يغير
+    الطابور قبل كتابة رقم الدور الجديد.
+
+    Returns:
+        (الحجز الذي تم إكماله أو None، الحجز الذي تم تأكيده)
+
+    Raises:
+        PermissionDenied: المستخدم ليس صاحب المحل
+        TurnConflictError: تغير الدور الحالي منذ تحميل المحل
+        TransitionError: لا توجد حجوزات في الانتظار
+    """
+    if barbershop.owner_id != user.pk:
+        raise PermissionDenied('ليس لديك صلاحية لتنفيذ هذا الإجراء.')
+    day = day or timezone.localdate()
+    current = barbershop.current_turn_number if expected_turn_number is None else expected_turn_number
+
+    with transaction.atomic():
+        locked = _lock_barbershop(barbershop.pk)
+        if locked.current_turn_number != current:
+            raise TurnConflictError('تم تغيير الدور الحالي من حلاق آخر، يرجى تحديث الصفحة.')
+
+        # الحجز المؤكد في الدور الحالي وأول حجز في الانتظار بعده
+        bookings = list(
+            _select_for_update(
+                Booking.objects.select_related('customer')
+            ).filter(
+                Q(queue_number=current, status='confirmed') | Q(queue_number__gt=current, status='pending'),
+                barbershop=locked,
+                booking_day=day
+            ).order_by('queue_number')[:2]
+        )
+        called = next((booking for booking in bookings if booking.queue_number > current), None)
+        if called is None:
+            raise TransitionError('لا توجد حجوزات في الانتظار بعد الدور الحالي.')
+        previous = bookings[0] if bookings[0].queue_number == current else None
+        for booking in bookings:
+            booking.barbershop = locked
+
+        # تأكيد الحجز المستدعى يقدم رقم الدور إليه (advance_turn)
+        changes = [(called, TRANSITIONS['confirm'])]
+        if previous:
+            changes.insert(0, (previous, TRANSITIONS['complete']))
+        _write_transition(locked, changes, user, None)
+        barbershop.current_turn_number = locked.current_turn_number
+
+    return previous, called
@@ -8,11 +8,13 @@ urlpatterns = [
     # Customer booking URLs
     path('', views.CustomerBookingListView.as_view(), name='list'),
     path('create/<int:barbershop_id>/', views.BookingCreateView.as_view(), name='create_booking'),
+    path('slots/<int:barbershop_id>/', views.get_available_slots, name='available_slots'),
     path('<int:pk>/', views.BookingDetailView.as_view(), name='detail'),
     path('<int:pk>/edit/', views.BookingUpdateView.as_view(), name='edit'),
     path('<int:pk>/delete/', views.BookingDeleteView.as_view(), name='delete'),
     path('<int:pk>/cancel/', views.BookingCancelView.as_view(), name='cancel'),
     path('<int:pk>/chat/', views.BookingChatView.as_view(), name='booking_chat'),
+    path('<int:pk>/chat/history/', views.BookingChatHistoryView.as_view(), name='chat_history'),
 
     
     # Merchant booking management URLs
@@ -24,6 +26,8 @@ urlpatterns = [
     path('merchant/<int:pk>/reject/', views.BookingRejectView.as_view(), name='reject'),
     path('merchant/<int:pk>/completed/', views.BookingCompletedView.as_view(), name='completed'),
     path('merchant/<int:pk>/no-show/', views.BookingNoShowView.as_view(), name='no_show'),
+    path('merchant/<int:barbershop_id>/bulk-status/', views.BookingBulkStatusView.as_view(), name='bulk_status'),
+    path('merchant/<int:barbershop_id>/call-next/', views.BookingCallNextView.as_view(), name='call_next'),
 
     path('merchant/<int:pk>/chat/', views.BookingChatView.as_view(), name='merchant_chat'),
     path('merchant/search/', views.BookingSearchView.as_view(), name='search'),
@@ -0,0 +1,38 @@
+from django.db.models import Prefetch
+from .models import Booking, BookingService
+
+
+def backfill_services_summary(booking_ids=None, batch_size=500):
+    """
+    تعبئة المدة الإجمالية وعدد الخدمات وملخصها المخزنة في الحجز من سجلات
+    BookingService (أو من خدمة الحجز للحجوزات القديمة)، على دفعات
+
+    Returns:
+        عدد الحجوزات التي تم تحديثها
+    """
+    bookings = Booking.objects.select_related('service').prefetch_related(
+        Prefetch('booking_services', queryset=BookingService.objects.select_related('service'))
+    ).order_by('pk')
+    if booking_ids is not None:
+        bookings = bookings.filter(pk__in=booking_ids)
+
+    updated_count = 0
+    batch = []
+    for booking in bookings.iterator(chunk_size=batch_size):
+        services = [(bs.service, bs.quantity) for bs in booking.booking_services.all()]
+        if not services and booking.service:
+            # الحجوزات القديمة بخدمة واحدة
+            services = [(booking.service, 1)]
+        booking.set_services_summary(services)
+        batch.append(booking)
+        if len(batch) >= batch_size:
+            updated_count += Booking.objects.bulk_update(
+                batch, ['total_duration_minutes', 'services_count', 'services_summary']
+            )
+            batch = []
+
+    if batch:
+        updated_count += Booking.objects.bulk_update(
+            batch, ['total_duration_minutes', 'services_count', 'services_summary']
+        )
+    return updated_count
@@ -1,6 +1,5 @@
 from django.shortcuts import render
 from django.views.generic import ListView
-from django.db.models import Avg
 from barbershops.models import Barbershop
 from reviews.models import Review
 from .models import SiteSettings, HomePageFeature, Testimonial, HeroSlide
@@ -16,9 +15,7 @@ class HomePageView(ListView):
         return Barbershop.objects.filter(
             is_active=True, 
             is_verified=True
-        ).annotate(
-            avg_rating=Avg('reviews__rating')
-        ).order_by('-avg_rating', '-created_at')[:6]
+        ).order_by('-rating_avg', '-created_at')[:6]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
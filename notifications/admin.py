@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Notification
+from .models import Notification, OutboxEvent
 
 
 @admin.register(Notification)
@@ -20,4 +20,12 @@ class NotificationAdmin(admin.ModelAdmin):
     )
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('recipient', 'sender', 'booking')
\ No newline at end of file
+        return super().get_queryset(request).select_related('recipient', 'sender', 'booking')
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['dedup_key', 'kind', 'attempts', 'available_at', 'dispatched_at', 'created_at']
+    list_filter = ['kind', 'dispatched_at', 'created_at']
+    search_fields = ['dedup_key', 'last_error']
+    readonly_fields = ['created_at']
+    list_per_page = 25
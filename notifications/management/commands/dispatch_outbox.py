@@ -0,0 +1,62 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from notifications.outbox import (
+    OUTBOX_BATCH_SIZE, channel_layer_is_shared, dispatch_outbox, purge_dispatched_events
+)
+
+
+class Command(BaseCommand):
+    help = 'Dispatch pending outbox events (notifications and queue updates) in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help='Number of events dispatched per transaction',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when there are no due events',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the due events once and exit instead of running as a worker',
+        )
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'NOTIFICATION_OUTBOX', False) and not channel_layer_is_shared():
+            # الأحداث ستُحدد كمرسلة بدون أن تصل تحديثات الطابور لأي متصفح
+            raise CommandError(
+                'NOTIFICATION_OUTBOX requires a shared channel layer (set REDIS_URL); '
+                'the in-memory layer cannot reach the ASGI workers'
+            )
+
+        purged = purge_dispatched_events()
+        if purged:
+            self.stdout.write(f'Purged {purged} old dispatched events')
+
+        total_dispatched = total_failed = 0
+        while True:
+            dispatched, failed = dispatch_outbox(options['batch_size'])
+            total_dispatched += dispatched
+            total_failed += failed
+            if failed:
+                self.stderr.write(self.style.WARNING(f'{failed} events failed and will be retried'))
+
+            if dispatched + failed < options['batch_size']:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                close_old_connections()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Dispatched {total_dispatched} outbox events ({total_failed} failed)'
+            )
+        )
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('notification', 'إشعار'), ('turn_update', 'تحديث الطابور')], max_length=20, verbose_name='النوع')),
+                ('dedup_key', models.CharField(max_length=255, unique=True, verbose_name='مفتاح منع التكرار')),
+                ('payload', models.JSONField(default=dict, verbose_name='البيانات')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='عدد المحاولات')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='موعد المحاولة التالية')),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True, verbose_name='تاريخ الإرسال')),
+                ('last_error', models.TextField(blank=True, verbose_name='آخر خطأ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+            ],
+            options={
+                'verbose_name': 'حدث صادر',
+                'verbose_name_plural': 'الأحداث الصادرة',
+                'indexes': [models.Index(fields=['dispatched_at', 'available_at'], name='notifications_outbox_due_idx')],
+            },
+        ),
+    ]
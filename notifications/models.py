@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from bookings.models import Booking
 
@@ -67,6 +68,8 @@ class Notification(models.Model):
 
     def mark_as_read(self):
         """تحديد الإشعار كمقروء"""
+        if self.is_read:
+            return
         self.is_read = True
         self.save(update_fields=['is_read'])
 
@@ -92,4 +95,66 @@ class Notification(models.Model):
             'new_booking': 'text-warning',
             'turn_updated': 'text-secondary',
         }
-        return colors.get(self.notification_type, 'text-dark')
\ No newline at end of file
+        return colors.get(self.notification_type, 'text-dark')
+
+class OutboxEvent(models.Model):
+    """
+    حدث ينتظر الإرسال، يُكتب في نفس معاملة التغيير الذي سببه
+
+    أمر dispatch_outbox يسحب الأحداث على دفعات: ينشئ الإشعارات بإدراج مجمع
+    ويرسل تحديثات الطابور لمجموعات WebSocket، ويعيد المحاولة عند الفشل.
+    التسليم "مرة واحدة على الأقل"؛ dedup_key يمنع تكرار نفس الحدث.
+    """
+    NOTIFICATION = 'notification'
+    TURN_UPDATE = 'turn_update'
+    KIND_CHOICES = (
+        (NOTIFICATION, 'إشعار'),
+        (TURN_UPDATE, 'تحديث الطابور'),
+    )
+
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name='النوع'
+    )
+    dedup_key = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='مفتاح منع التكرار'
+    )
+    payload = models.JSONField(
+        default=dict,
+        verbose_name='البيانات'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='عدد المحاولات'
+    )
+    available_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='موعد المحاولة التالية'
+    )
+    dispatched_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='تاريخ الإرسال'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='آخر خطأ'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='تاريخ الإنشاء'
+    )
+
+    class Meta:
+        verbose_name = 'حدث صادر'
+        verbose_name_plural = 'الأحداث الصادرة'
+        indexes = [
+            # الأحداث المنتظرة: dispatched_at فارغ وموعدها حان
+            models.Index(fields=['dispatched_at', 'available_at'], name='notifications_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} - {self.dedup_key}"
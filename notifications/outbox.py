@@ -0,0 +1,126 @@
+import datetime
+import logging
+from collections import Counter, defaultdict
+from typing import List, Tuple
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Notification, OutboxEvent
+from .utils import adjust_unread_count
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+
+# بعد هذا العدد من المحاولات الفاشلة يبقى الحدث في الجدول بدون إعادة محاولة
+OUTBOX_MAX_ATTEMPTS = 8
+
+# مهلة إعادة المحاولة (بالثواني) تتضاعف مع كل محاولة فاشلة
+OUTBOX_RETRY_DELAY = 2
+
+# الأحداث المرسلة تُحذف بعد هذه المدة (وهي أيضاً مدة منع التكرار بـ dedup_key)
+OUTBOX_RETENTION = datetime.timedelta(days=7)
+
+
+def channel_layer_is_shared() -> bool:
+    """
+    هل تصل رسائل طبقة القنوات لعمليات ASGI الأخرى؟
+
+    InMemoryChannelLayer (بدون REDIS_URL) خاصة بالعملية الحالية: تحديثات الطابور
+    التي يرسلها أمر dispatch_outbox لا تصل لأي اتصال WebSocket.
+    """
+    from channels.layers import InMemoryChannelLayer, get_channel_layer
+    return not isinstance(get_channel_layer(), InMemoryChannelLayer)
+
+
+def _due_events(batch_size: int) -> List[OutboxEvent]:
+    """الأحداث المستحقة مع قفلها (عدة نسخ من الأمر لا تأخذ نفس الأحداث)"""
+    events = OutboxEvent.objects.filter(
+        dispatched_at__isnull=True,
+        attempts__lt=OUTBOX_MAX_ATTEMPTS,
+        available_at__lte=timezone.now()
+    ).order_by('pk')
+    if connection.features.has_select_for_update_skip_locked:
+        events = events.select_for_update(skip_locked=True)
+    return list(events[:batch_size])
+
+
+def _dispatch_notifications(events: List[OutboxEvent]) -> None:
+    """كل إشعارات الدفعة بإدراج مجمع واحد"""
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([
+            Notification(**event.payload) for event in events
+        ])
+        for recipient_id, count in Counter(n.recipient_id for n in notifications).items():
+            adjust_unread_count(recipient_id, count)
+
+
+def _dispatch_turn_updates(events: List[OutboxEvent]) -> List[Tuple[OutboxEvent, Exception]]:
+    """حالة واحدة لكل محل مهما كان عدد أحداثه في الدفعة"""
+    from bookings.broadcast_utils import send_turn_snapshot
+
+    by_barbershop = defaultdict(list)
+    for event in events:
+        by_barbershop[event.payload['barbershop_id']].append(event)
+
+    failed = []
+    for barbershop_id, barbershop_events in by_barbershop.items():
+        try:
+            send_turn_snapshot(barbershop_id)
+        except Exception as e:
+            failed.extend((event, e) for event in barbershop_events)
+    return failed
+
+
+def dispatch_outbox(batch_size: int = OUTBOX_BATCH_SIZE) -> Tuple[int, int]:
+    """
+    إرسال دفعة من الأحداث المستحقة في صندوق الصادر
+
+    الإشعارات تُنشأ في نفس معاملة تحديد الحدث كمرسل (لا تتكرر)، أما رسائل
+    WebSocket فقد تُرسل أكثر من مرة إذا توقف الأمر قبل نهاية المعاملة. الحدث
+    الفاشل يُعاد بعد OUTBOX_RETRY_DELAY * 2^المحاولات ثانية.
+
+    Returns:
+        (عدد الأحداث المرسلة، عدد الأحداث الفاشلة)
+    """
+    with transaction.atomic():
+        events = _due_events(batch_size)
+        if not events:
+            return 0, 0
+
+        by_kind = defaultdict(list)
+        for event in events:
+            by_kind[event.kind].append(event)
+
+        failed = []
+        if by_kind[OutboxEvent.NOTIFICATION]:
+            try:
+                _dispatch_notifications(by_kind[OutboxEvent.NOTIFICATION])
+            except Exception as e:
+                failed.extend((event, e) for event in by_kind[OutboxEvent.NOTIFICATION])
+        if by_kind[OutboxEvent.TURN_UPDATE]:
+            failed.extend(_dispatch_turn_updates(by_kind[OutboxEvent.TURN_UPDATE]))
+
+        now = timezone.now()
+        failed_ids = {event.pk for event, _ in failed}
+        OutboxEvent.objects.filter(
+            pk__in=[event.pk for event in events if event.pk not in failed_ids]
+        ).update(dispatched_at=now)
+
+        for event, error in failed:
+            logger.error(f"Error dispatching outbox event {event.dedup_key} (attempt {event.attempts + 1}): {error}")
+            event.available_at = now + datetime.timedelta(seconds=OUTBOX_RETRY_DELAY * 2 ** event.attempts)
+            event.attempts += 1
+            event.last_error = str(error)
+        OutboxEvent.objects.bulk_update(
+            [event for event, _ in failed], ['attempts', 'available_at', 'last_error']
+        )
+
+    return len(events) - len(failed), len(failed)
+
+
+def purge_dispatched_events(older_than: datetime.timedelta = OUTBOX_RETENTION) -> int:
+    """حذف الأحداث المرسلة الأقدم من older_than"""
+    deleted, _ = OutboxEvent.objects.filter(
+        dispatched_at__lt=timezone.now() - older_than
+    ).delete()
+    return deleted
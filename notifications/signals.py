@@ -1,7 +1,43 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from bookings.models import BookingMessage, Booking
-from .utils import create_chat_notification, create_booking_notification
+from .models import Notification
+from .utils import (
+    create_chat_notification,
+    create_booking_notification,
+    adjust_unread_count,
+    invalidate_notifications_cache,
+)
+
+
+@receiver(post_init, sender=Notification)
+def remember_read_state(sender, instance, **kwargs):
+    """حفظ حالة القراءة كما تم تحميلها لتحديث العداد عند الحفظ"""
+    instance._was_read = instance.__dict__.get('is_read') if instance.pk else None
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_count_on_save(sender, instance, created, **kwargs):
+    """
+    تحديث عداد الإشعارات غير المقروءة عند إنشاء إشعار أو تغيير حالة قراءته
+    """
+    was_read = getattr(instance, '_was_read', None)
+    if created:
+        adjust_unread_count(instance.recipient_id, 0 if instance.is_read else 1)
+    elif was_read is None:
+        invalidate_notifications_cache(instance.recipient_id)
+    else:
+        adjust_unread_count(
+            instance.recipient_id,
+            int(bool(was_read)) - int(bool(instance.is_read))
+        )
+    instance._was_read = instance.is_read
+
+
+@receiver(post_delete, sender=Notification)
+def invalidate_unread_count_on_delete(sender, instance, **kwargs):
+    """حذف العداد المخزن عند حذف إشعار"""
+    invalidate_notifications_cache(instance.recipient_id)
 
 
 @receiver(post_save, sender=BookingMessage)
@@ -13,6 +49,14 @@ def create_message_notification(sender, instance, created, **kwargs):
         create_chat_notification(instance)
 
 
+# أنواع الإشعارات المرسلة للعميل عند انتقال الحجز إلى الحالة
+STATUS_NOTIFICATION_TYPES = {
+    'confirmed': 'booking_confirmed',
+    'cancelled': 'booking_cancelled',
+    'completed': 'booking_completed',
+}
+
+
 @receiver(post_save, sender=Booking)
 def create_booking_notifications(sender, instance, created, **kwargs):
     """
@@ -21,19 +65,8 @@ def create_booking_notifications(sender, instance, created, **kwargs):
     if created:
         # إشعار صاحب المحل بحجز جديد
         create_booking_notification(instance, 'new_booking')
-    else:
-        # التحقق من تغيير الحالة
-        if hasattr(instance, '_state') and instance._state.adding is False:
-            # الحصول على الحالة السابقة من قاعدة البيانات
-            try:
-                old_booking = Booking.objects.get(pk=instance.pk)
-                if old_booking.status != instance.status:
-                    # تم تغيير الحالة، إنشاء إشعار مناسب
-                    if instance.status == 'confirmed':
-                        create_booking_notification(instance, 'booking_confirmed')
-                    elif instance.status == 'cancelled':
-                        create_booking_notification(instance, 'booking_cancelled')
-                    elif instance.status == 'completed':
-                        create_booking_notification(instance, 'booking_completed')
-            except Booking.DoesNotExist:
-                pass
\ No newline at end of file
+    elif instance.status_changed:
+        # تم تغيير الحالة (يتم تتبعها في الذاكرة بدون إعادة قراءة الحجز)
+        notification_type = STATUS_NOTIFICATION_TYPES.get(instance.status)
+        if notification_type:
+            create_booking_notification(instance, notification_type)
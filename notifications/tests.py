@@ -0,0 +1,230 @@
+import datetime
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from barbershops.models import Barbershop
+from .context_processors import notifications_context
+from .models import Notification, OutboxEvent
+from .outbox import OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY, dispatch_outbox
+from .utils import enqueue_outbox_events
+
+User = get_user_model()
+
+
+class NotificationsContextQueryTests(TestCase):
+    """قيم الإشعارات في سياق القوالب لا تُقرأ من قاعدة البيانات إلا إذا استخدمتها الصفحة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='customer', email='customer@example.com', password='pass', is_email_verified=True
+        )
+        Notification.objects.create(
+            recipient=cls.user, title='t', message='m', notification_type='booking_confirmed'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def notification_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return [
+            query for query in context.captured_queries
+            if Notification._meta.db_table in query['sql']
+        ]
+
+    def test_pages_without_notifications_do_not_query_them(self):
+        for url in (
+            reverse('home:index'),
+            reverse('barbershops:list'),
+            reverse('accounts:customer_dashboard'),
+        ):
+            with self.subTest(url=url):
+                responses = []
+                queries = self.notification_queries(lambda: responses.append(self.client.get(url)))
+                self.assertEqual(responses[0].status_code, 200)
+                self.assertEqual(queries, [])
+
+    def test_unread_count_api_is_cached(self):
+        url = reverse('notifications:unread_count')
+        self.assertEqual(len(self.notification_queries(lambda: self.client.get(url))), 1)
+        self.assertEqual(len(self.notification_queries(lambda: self.client.get(url))), 0)
+        self.assertEqual(self.client.get(url).json(), {'unread_count': 1})
+
+    def test_context_is_queried_only_when_rendered(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        context = notifications_context(request)
+        self.assertEqual(self.notification_queries(lambda: Template('').render(Context(context))), [])
+
+        template = Template('{{ notifications_unread_count }} {{ recent_notifications|length }}')
+        queries = self.notification_queries(
+            lambda: self.assertEqual(template.render(Context(context)), '1 1')
+        )
+        self.assertEqual(len(queries), 2)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DispatchOutboxCommandTests(TestCase):
+    """أمر dispatch_outbox يرفض العمل بطبقة قنوات غير مشتركة بين العمليات"""
+
+    def dispatch(self):
+        call_command('dispatch_outbox', '--once', stdout=StringIO(), stderr=StringIO())
+
+    @override_settings(NOTIFICATION_OUTBOX=True)
+    def test_refuses_in_memory_channel_layer(self):
+        with self.assertRaisesMessage(CommandError, 'REDIS_URL'):
+            self.dispatch()
+
+    @override_settings(NOTIFICATION_OUTBOX=True)
+    def test_runs_with_shared_channel_layer(self):
+        with mock.patch(
+            'notifications.management.commands.dispatch_outbox.channel_layer_is_shared', return_value=True
+        ):
+            self.dispatch()
+
+    @override_settings(NOTIFICATION_OUTBOX=False)
+    def test_runs_when_outbox_disabled(self):
+        self.dispatch()
+
+
+class StubChannelLayer:
+    """طبقة قنوات للاختبار تسجل الرسائل المرسلة أو ترفع الخطأ المحدد"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if self.error:
+            raise self.error
+        self.sent.append((group, message))
+
+
+class OutboxDispatchTests(TestCase):
+    """إرسال أحداث صندوق الصادر: التحديد كمرسل، إعادة المحاولة، منع التكرار وحجم الدفعة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass',
+            user_type='barber', is_email_verified=True
+        )
+        cls.barbershop = Barbershop.objects.create(
+            owner=cls.owner, name='shop', description='d', address='a', phone_number='1',
+            opening_time=datetime.time(9), closing_time=datetime.time(18)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.layer = StubChannelLayer()
+
+    def dispatch(self, batch_size=100):
+        with mock.patch('bookings.broadcast_utils.get_channel_layer', return_value=self.layer):
+            return dispatch_outbox(batch_size)
+
+    def enqueue_notifications(self, count, prefix='n'):
+        enqueue_outbox_events(OutboxEvent.NOTIFICATION, [
+            (f'{prefix}:{i}', {
+                'recipient_id': self.owner.pk, 'sender_id': None, 'notification_type': 'new_booking',
+                'title': 't', 'message': f'm {i}', 'booking_id': None,
+            })
+            for i in range(count)
+        ])
+
+    def enqueue_turn_updates(self, count):
+        enqueue_outbox_events(OutboxEvent.TURN_UPDATE, [
+            (f'turn:{i}', {'barbershop_id': self.barbershop.pk}) for i in range(count)
+        ])
+
+    def test_dispatch_marks_events_and_sends_one_update_per_shop(self):
+        self.enqueue_notifications(2)
+        self.enqueue_turn_updates(3)
+
+        self.assertEqual(self.dispatch(), (5, 0))
+        self.assertEqual(Notification.objects.filter(recipient=self.owner).count(), 2)
+        self.assertEqual([group for group, _ in self.layer.sent], [f'barbershop_{self.barbershop.pk}'])
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=True).exists())
+
+    def test_dispatched_events_are_not_resent(self):
+        self.enqueue_notifications(1)
+        self.enqueue_turn_updates(1)
+        self.dispatch()
+
+        self.assertEqual(self.dispatch(), (0, 0))
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(len(self.layer.sent), 1)
+
+    def test_failed_send_backs_off_and_retries(self):
+        self.enqueue_turn_updates(1)
+        self.layer.error = RuntimeError('redis down')
+        before = timezone.now()
+
+        self.assertEqual(self.dispatch(), (0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.dispatched_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.last_error, 'redis down')
+        self.assertGreaterEqual(event.available_at, before + datetime.timedelta(seconds=OUTBOX_RETRY_DELAY))
+
+        # غير مستحق قبل انتهاء المهلة
+        self.assertEqual(self.dispatch(), (0, 0))
+
+        # فشل ثانٍ بعد انتهاء المهلة: المهلة تتضاعف
+        OutboxEvent.objects.update(available_at=timezone.now())
+        before = timezone.now()
+        self.assertEqual(self.dispatch(), (0, 1))
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertGreaterEqual(event.available_at, before + datetime.timedelta(seconds=OUTBOX_RETRY_DELAY * 2))
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        self.layer.error = None
+        self.assertEqual(self.dispatch(), (1, 0))
+        event.refresh_from_db()
+        self.assertIsNotNone(event.dispatched_at)
+        self.assertEqual(len(self.layer.sent), 1)
+
+    def test_failed_turn_update_does_not_block_notifications(self):
+        self.enqueue_notifications(1)
+        self.enqueue_turn_updates(1)
+        self.layer.error = RuntimeError('redis down')
+
+        self.assertEqual(self.dispatch(), (1, 1))
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(
+            OutboxEvent.objects.get(dispatched_at__isnull=True).kind, OutboxEvent.TURN_UPDATE
+        )
+
+    def test_exhausted_events_are_not_retried(self):
+        self.enqueue_turn_updates(1)
+        OutboxEvent.objects.update(attempts=OUTBOX_MAX_ATTEMPTS)
+        self.assertEqual(self.dispatch(), (0, 0))
+        self.assertEqual(self.layer.sent, [])
+
+    def test_duplicate_keys_are_ignored(self):
+        self.enqueue_notifications(2)
+        self.enqueue_notifications(2)
+        self.assertEqual(OutboxEvent.objects.count(), 2)
+        self.assertEqual(self.dispatch(), (2, 0))
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_batch_size_limits_each_dispatch(self):
+        self.enqueue_notifications(5)
+        self.assertEqual(self.dispatch(batch_size=2), (2, 0))
+        self.assertEqual(OutboxEvent.objects.filter(dispatched_at__isnull=True).count(), 3)
+        # الأقدم أولاً
+        self.assertEqual(
+            sorted(OutboxEvent.objects.filter(dispatched_at__isnull=False).values_list('dedup_key', flat=True)),
+            ['n:0', 'n:1']
+        )
@@ -1,8 +1,158 @@
-from .models import Notification
+from collections import Counter
+from .models import Notification, OutboxEvent
+from bookings.models import BookingReadState
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
 
 User = get_user_model()
 
+# مدة بقاء عداد الإشعارات غير المقروءة وآخر الإشعارات في الكاش
+NOTIFICATIONS_CACHE_TIMEOUT = 60 * 60
+RECENT_NOTIFICATIONS_LIMIT = 5
+
+# المدة عند عدم وجود كاش مشترك (SHARED_CACHE): كل عامل له كاش خاص لا تصله
+# تحديثات العمال الآخرين، فتبقى القيمة القديمة بضع ثوانٍ فقط
+LOCAL_NOTIFICATIONS_CACHE_TIMEOUT = 5
+
+
+def _cache_timeout():
+    if getattr(settings, 'SHARED_CACHE', False):
+        return NOTIFICATIONS_CACHE_TIMEOUT
+    return LOCAL_NOTIFICATIONS_CACHE_TIMEOUT
+
+
+def _unread_count_key(user_id):
+    return f'notifications:unread_count:{user_id}'
+
+
+def _recent_notifications_key(user_id):
+    return f'notifications:recent:{user_id}'
+
+
+def get_cached_unread_count(user):
+    """
+    عدد الإشعارات غير المقروءة للمستخدم من الكاش، مع الرجوع لقاعدة البيانات عند عدم وجوده
+    """
+    key = _unread_count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user.pk, is_read=False).count()
+        # add وليس set حتى لا نكتب فوق قيمة زادها طلب آخر في نفس اللحظة
+        cache.add(key, count, _cache_timeout())
+    return max(count, 0)
+
+
+def get_cached_recent_notifications(user):
+    """
+    آخر الإشعارات للمستخدم من الكاش، مع الرجوع لقاعدة البيانات عند عدم وجودها
+    """
+    key = _recent_notifications_key(user.pk)
+    notifications = cache.get(key)
+    if notifications is None:
+        notifications = list(
+            Notification.objects.filter(
+                recipient_id=user.pk
+            ).order_by('-created_at')[:RECENT_NOTIFICATIONS_LIMIT]
+        )
+        cache.set(key, notifications, _cache_timeout())
+    return notifications
+
+
+def _apply_unread_change(user_id, delta):
+    if delta:
+        try:
+            cache.incr(_unread_count_key(user_id), delta)
+        except ValueError:
+            # العداد غير موجود في الكاش: سيُحسب من قاعدة البيانات عند أول قراءة
+            pass
+    cache.delete(_recent_notifications_key(user_id))
+
+
+def adjust_unread_count(user_id, delta):
+    """
+    تعديل عداد الإشعارات غير المقروءة بعد نجاح المعاملة الحالية وإبطال قائمة آخر الإشعارات
+    """
+    transaction.on_commit(lambda: _apply_unread_change(user_id, delta))
+
+
+def reset_unread_count(user_id):
+    """تصفير عداد الإشعارات غير المقروءة بعد تحديد جميع الإشعارات كمقروءة"""
+    def reset():
+        cache.set(_unread_count_key(user_id), 0, _cache_timeout())
+        cache.delete(_recent_notifications_key(user_id))
+
+    transaction.on_commit(reset)
+
+
+def invalidate_notifications_cache(user_id):
+    """حذف عداد وقائمة الإشعارات المخزنة للمستخدم"""
+    transaction.on_commit(
+        lambda: cache.delete_many([
+            _unread_count_key(user_id),
+            _recent_notifications_key(user_id),
+        ])
+    )
+
+
+def notification_outbox_enabled():
+    return getattr(settings, 'NOTIFICATION_OUTBOX', False)
+
+
+def enqueue_outbox_events(kind, events):
+    """
+    إضافة أحداث لصندوق الصادر في المعاملة الحالية
+
+    Args:
+        kind: نوع الحدث (OutboxEvent.NOTIFICATION / OutboxEvent.TURN_UPDATE)
+        events: قائمة (مفتاح منع التكرار، البيانات)؛ المفاتيح الموجودة مسبقاً تُتجاهل
+    """
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(kind=kind, dedup_key=dedup_key, payload=payload) for dedup_key, payload in events],
+        ignore_conflicts=True
+    )
+
+
+def booking_notification_key(booking, notification_type):
+    """مفتاح منع التكرار لإشعار حالة الحجز (مرة لكل تغيير في الحجز)"""
+    return f'booking:{booking.pk}:{notification_type}:{booking.updated_at.isoformat()}'
+
+
+def chat_notification_key(message_obj):
+    return f'message:{message_obj.pk}'
+
+
+def deliver_notifications(notifications, dedup_keys):
+    """
+    حفظ إشعارات غير محفوظة بإدراج مجمع، أو إضافتها لصندوق الصادر عند تفعيل
+    NOTIFICATION_OUTBOX (ينشئها أمر dispatch_outbox لاحقاً)
+    
+    Args:
+        notifications: كائنات Notification غير محفوظة
+        dedup_keys: مفتاح منع التكرار لكل إشعار (بنفس الترتيب)
+    """
+    if not notifications:
+        return
+    if notification_outbox_enabled():
+        enqueue_outbox_events(OutboxEvent.NOTIFICATION, [
+            (dedup_key, {
+                'recipient_id': notification.recipient_id,
+                'sender_id': notification.sender_id,
+                'notification_type': notification.notification_type,
+                'title': notification.title,
+                'message': notification.message,
+                'booking_id': notification.booking_id,
+            })
+            for notification, dedup_key in zip(notifications, dedup_keys)
+        ])
+        return
+
+    # bulk_create بدون إشارة post_save: العدادات تُحدّث هنا
+    Notification.objects.bulk_create(notifications)
+    for recipient_id, count in Counter(n.recipient_id for n in notifications).items():
+        adjust_unread_count(recipient_id, count)
+
 
 def create_notification(recipient, notification_type, title, message, sender=None, booking=None):
     """
@@ -51,22 +201,51 @@ def create_chat_notification(message_obj):
     
     # إنشاء الإشعار فقط إذا كان هناك مستلم
     if recipient:
-        return create_notification(
-            recipient=recipient,
-            sender=sender,
-            notification_type='new_message',
-            title=title,
-            message=f"حجز #{booking.id}: {message_obj.message[:100]}...",
-            booking=booking
-        )
+        notification = build_chat_notification(message_obj, recipient.pk, title)
+        deliver_notifications([notification], [chat_notification_key(message_obj)])
+        return notification
     
     return None
 
 
+def build_chat_notification(message_obj, recipient_id, title):
+    """
+    تجهيز إشعار رسالة المحادثة بدون حفظه ولا تحميل الحجز أو المستلم
+    
+    Args:
+        message_obj: كائن BookingMessage
+        recipient_id: رقم المستخدم المستلم (الطرف الآخر في المحادثة)
+        title: عنوان الإشعار
+    """
+    return Notification(
+        recipient_id=recipient_id,
+        sender=message_obj.sender,
+        notification_type='new_message',
+        title=title,
+        message=f"حجز #{message_obj.booking_id}: {message_obj.message[:100]}...",
+        booking_id=message_obj.booking_id
+    )
+
+
 def create_booking_notification(booking, notification_type, custom_message=None):
     """
     إنشاء إشعار متعلق بالحجز
     
+    Args:
+        booking: كائن Booking
+        notification_type: نوع الإشعار
+        custom_message: رسالة مخصصة (اختياري)
+    """
+    notification = build_booking_notification(booking, notification_type, custom_message)
+    if notification:
+        deliver_notifications([notification], [booking_notification_key(booking, notification_type)])
+    return notification
+
+
+def build_booking_notification(booking, notification_type, custom_message=None):
+    """
+    تجهيز إشعار الحجز بدون حفظه (للإدراج المجمع مع سجلات أخرى)
+    
     Args:
         booking: كائن Booking
         notification_type: نوع الإشعار
@@ -81,21 +260,11 @@ def create_booking_notification(booking, notification_type, custom_message=None)
         'turn_updated': 'تم تحديث الدور',
     }
     
-    # حساب قائمة الخدمات للحجز متعدد الخدمات
-    booking_services = booking.booking_services.all()
-    if booking_services.exists():
-        services_names = []
-        for bs in booking_services:
-            if bs.service and hasattr(bs.service, 'name') and bs.service.name:
-                services_names.append(bs.service.name)
-        
-        if services_names:
-            if len(services_names) == 1:
-                services_text = f"للخدمة {services_names[0]}"
-            else:
-                services_text = f"للخدمات: {', '.join(services_names)}"
-        else:
-            services_text = "لخدمات مختارة"
+    # قائمة الخدمات من الملخص المخزن في الحجز (معبأ عند الحفظ وبترحيل للحجوزات القديمة)
+    if booking.services_count == 1:
+        services_text = f"للخدمة {booking.services_summary}"
+    elif booking.services_count:
+        services_text = f"للخدمات: {booking.services_summary}"
     else:
         services_text = "لخدمات مختارة"
     
@@ -121,7 +290,7 @@ def create_booking_notification(booking, notification_type, custom_message=None)
         sender = booking.barbershop.owner
     
     if recipient:
-        return create_notification(
+        return Notification(
             recipient=recipient,
             sender=sender,
             notification_type=notification_type,
@@ -133,26 +302,24 @@ def create_booking_notification(booking, notification_type, custom_message=None)
     return None
 
 
-def mark_booking_messages_as_read(booking, user):
+def mark_booking_messages_as_read(booking, user, message_id=None):
     """
     تحديد رسائل الحجز كمقروءة للمستخدم المحدد
     
     Args:
         booking: كائن Booking
         user: المستخدم الذي قرأ الرسائل
+        message_id: آخر رسالة معروضة للمستخدم (افتراضياً آخر رسالة في المحادثة)
     """
-    # تحديد الرسائل غير المقروءة من الطرف الآخر
-    unread_messages = booking.messages.filter(
-        is_read=False
-    ).exclude(sender=user)
-    
-    # تحديثها كمقروءة
-    unread_messages.update(is_read=True)
+    # صف واحد لحالة القراءة بدلاً من تحديث كل رسالة
+    BookingReadState.mark_read(booking.pk, user.pk, message_id)
     
     # تحديد الإشعارات المرتبطة كمقروءة أيضاً
-    Notification.objects.filter(
+    updated_count = Notification.objects.filter(
         recipient=user,
         booking=booking,
         notification_type='new_message',
         is_read=False
-    ).update(is_read=True)
\ No newline at end of file
+    ).update(is_read=True)
+    if updated_count:
+        adjust_unread_count(user.pk, -updated_count)
\ No newline at end of file
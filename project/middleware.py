@@ -2,15 +2,72 @@
 Middleware مخصص لحل مشاكل Django Sites مع ngrok وتسجيل أخطاء Allauth
 """
 import logging
-from django.conf import settings
+import threading
+import time
 from django.contrib.sites.models import Site
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 
 
+# مدة بقاء الموقع المخزن لكل نطاق (بالثواني) قبل إعادة قراءته من قاعدة البيانات
+SITE_CACHE_TTL = 300
+
+# النطاقات المعروفة: (النطاق المخزن في Site، اسم الموقع)
+KNOWN_SITES = (
+    ('15d0212cf8fe.ngrok-free.app', 'Ngrok Site'),
+    ('bff867bb20c4.ngrok-free.app', 'Ngrok Site'),
+)
+DEFAULT_SITE = ('localhost:8000', 'Localhost Development')
+
+_site_cache = {}
+_site_cache_lock = threading.Lock()
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def clear_dynamic_site_cache(sender, **kwargs):
+    """مسح المواقع المخزنة عند تعديل أو حذف أي موقع"""
+    with _site_cache_lock:
+        _site_cache.clear()
+
+
+def _site_domain_for_host(host):
+    """إرجاع (النطاق، الاسم) للموقع المناسب للـ host"""
+    for domain, name in KNOWN_SITES:
+        if domain in host:
+            return domain, name
+    return DEFAULT_SITE
+
+
+def get_site_for_host(host):
+    """
+    إرجاع كائن Site المناسب للـ host من الذاكرة، مع قراءته (أو إنشائه) من قاعدة
+    البيانات عند أول طلب أو بعد انتهاء مدة التخزين
+    """
+    domain, name = _site_domain_for_host(host)
+    now = time.monotonic()
+
+    cached = _site_cache.get(domain)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    site, _ = Site.objects.get_or_create(domain=domain, defaults={'name': name})
+    with _site_cache_lock:
+        _site_cache[domain] = (site, now + SITE_CACHE_TTL)
+    return site
+
+
 class DynamicSiteMiddleware:
     """
-    Middleware لتحديد SITE_ID ديناميكياً حسب النطاق
+    Middleware لتحديد الموقع ديناميكياً حسب النطاق
+
+    يضيف الموقع إلى request.site بدلاً من تعديل settings.SITE_ID العام، لأن
+    تعديل الإعدادات غير آمن مع الخيوط المتعددة أو ASGI.
+
+    request.site هو الموقع الذي يستخدمه CustomSocialAccountAdapter لاختيار
+    تطبيق Google OAuth المرتبط بالنطاق، بدون استعلام بعد أول طلب لكل نطاق.
     """
     
     def __init__(self, get_response):
@@ -18,34 +75,10 @@ class DynamicSiteMiddleware:
 
     def __call__(self, request):
         # تحديد الموقع الحالي حسب النطاق
-        host = request.get_host()
-        
-        if 'bff867bb20c4.ngrok-free.app' in host:
-            # ngrok domain
-            try:
-                site = Site.objects.get(domain='bff867bb20c4.ngrok-free.app')
-                settings.SITE_ID = site.id
-            except Site.DoesNotExist:
-                # إنشاء الموقع إذا لم يكن موجوداً
-                site = Site.objects.create(
-                    domain='bff867bb20c4.ngrok-free.app',
-                    name='Ngrok Site'
-                )
-                settings.SITE_ID = site.id
-        else:
-            # localhost domain
-            try:
-                site = Site.objects.get(domain='localhost:8000')
-                settings.SITE_ID = site.id
-            except Site.DoesNotExist:
-                # إنشاء الموقع إذا لم يكن موجوداً
-                site = Site.objects.create(
-                    domain='localhost:8000',
-                    name='Localhost Development'
-                )
-                settings.SITE_ID = site.id
+        site = get_site_for_host(request.get_host())
         
         # إضافة الموقع الحالي إلى request
+        request.site = site
         request.current_site = site
         
         response = self.get_response(request)
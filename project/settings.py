@@ -87,7 +87,7 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
-    "project.middleware.DynamicSiteMiddleware",  # حل مشكلة SITE_ID الديناميكي
+    "project.middleware.DynamicSiteMiddleware",  # request.site حسب النطاق (SITE_ID ثابت)
     "project.middleware.AdminSecurityMiddleware",  # حماية صفحة الإدارة
     "project.middleware.SocialAuthDebugMiddleware",  # تسجيل أخطاء Allauth
     "django.middleware.common.CommonMiddleware",
@@ -139,6 +139,36 @@ else:
         }
     }
 
+# Cache: Redis when available so every worker (gunicorn, ASGI, commands) shares
+# counters and invalidations; otherwise a per-process LocMemCache
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# True only when the cache is shared between processes (see notifications/utils.py
+# and bookings/broadcast_utils.py)
+SHARED_CACHE = 'REDIS_URL' in os.environ
+
+# Chat write-behind: broadcast messages immediately and save them in batches
+CHAT_WRITE_BEHIND = env.bool('CHAT_WRITE_BEHIND', default=False)
+CHAT_FLUSH_INTERVAL_MS = env.int('CHAT_FLUSH_INTERVAL_MS', default=50)
+CHAT_FLUSH_BATCH_SIZE = env.int('CHAT_FLUSH_BATCH_SIZE', default=50)
+
+# Transactional outbox: notifications and queue updates are written with the change
+# and sent by `manage.py dispatch_outbox`. The command runs in its own process, so it
+# needs the Redis channel layer (REDIS_URL) to reach the ASGI workers; with the
+# in-memory layer it refuses to start instead of marking queue updates as delivered
+NOTIFICATION_OUTBOX = env.bool('NOTIFICATION_OUTBOX', default=False)
+
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
 # Authentication Settings
@@ -163,6 +193,11 @@ DATABASES['default']['OPTIONS'] = {
     'timeout': 20,
 }
 
+# Threaded tests (bookings.tests.QueueCounterConcurrencyTests) open several connections,
+# which SQLite's default in-memory test database does not allow
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -0,0 +1,58 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from barbershops.models import Barbershop
+from .models import Review
+
+
+def _rating_state(review):
+    """(barbershop_id, rating, is_approved) بدون تحميل الحقول المؤجلة"""
+    values = review.__dict__
+    return (values.get('barbershop_id'), values.get('rating'), values.get('is_approved'))
+
+
+def _apply_state(state, sign):
+    barbershop_id, rating, is_approved = state
+    if barbershop_id is None or rating is None:
+        return
+    Barbershop.apply_rating_change(
+        barbershop_id,
+        rating_delta=sign * int(rating),
+        count_delta=sign,
+        approved_delta=sign if is_approved else 0,
+    )
+
+
+@receiver(post_init, sender=Review)
+def remember_rating_state(sender, instance, **kwargs):
+    """حفظ حالة التقييم كما تم تحميلها لحساب الفرق عند الحفظ"""
+    instance._rating_state = _rating_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def update_barbershop_rating_on_save(sender, instance, created, **kwargs):
+    """
+    تحديث مجاميع التقييم للمحل عند إنشاء أو تعديل أو اعتماد/إلغاء اعتماد تقييم
+    """
+    old_state = None if created else getattr(instance, '_rating_state', None)
+    new_state = _rating_state(instance)
+
+    if old_state != new_state:
+        if old_state and old_state[0] == new_state[0]:
+            # نفس المحل: تحديث واحد بالفرق فقط
+            Barbershop.apply_rating_change(
+                new_state[0],
+                rating_delta=int(new_state[1]) - int(old_state[1]),
+                approved_delta=int(bool(new_state[2])) - int(bool(old_state[2])),
+            )
+        else:
+            if old_state:
+                _apply_state(old_state, -1)
+            _apply_state(new_state, 1)
+
+    instance._rating_state = new_state
+
+
+@receiver(post_delete, sender=Review)
+def update_barbershop_rating_on_delete(sender, instance, **kwargs):
+    """طرح التقييم المحذوف من مجاميع المحل"""
+    _apply_state(getattr(instance, '_rating_state', None) or _rating_state(instance), -1)
@@ -0,0 +1,48 @@
+from allauth.socialaccount.models import SocialApp
+from django.contrib.sites.models import Site
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from project.middleware import DynamicSiteMiddleware, clear_dynamic_site_cache
+from .adapters import CustomSocialAccountAdapter
+
+
+@override_settings(ALLOWED_HOSTS=['localhost', '.ngrok-free.app'])
+class DynamicSiteTests(TestCase):
+    """الموقع حسب النطاق يُقرأ مرة واحدة ويستخدمه محول Google OAuth من request.site"""
+
+    NGROK_HOST = '15d0212cf8fe.ngrok-free.app'
+
+    def setUp(self):
+        clear_dynamic_site_cache(Site)
+        self.factory = RequestFactory()
+        self.middleware = DynamicSiteMiddleware(lambda request: HttpResponse())
+
+    def request_for(self, host):
+        request = self.factory.get('/', HTTP_HOST=host)
+        self.middleware(request)
+        return request
+
+    def test_site_cached_per_host(self):
+        first = self.request_for(self.NGROK_HOST)
+        self.assertEqual(first.site.domain, self.NGROK_HOST)
+        with self.assertNumQueries(0):
+            second = self.request_for(self.NGROK_HOST)
+        self.assertEqual(second.site, first.site)
+        self.assertEqual(self.request_for('localhost:8000').site.domain, 'localhost:8000')
+
+    def test_adapter_uses_request_site(self):
+        request = self.request_for(self.NGROK_HOST)
+        adapter = CustomSocialAccountAdapter(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(adapter.get_current_site(request), request.site)
+
+    def test_adapter_picks_app_of_request_site(self):
+        localhost = self.request_for('localhost:8000').site
+        request = self.request_for(self.NGROK_HOST)
+        local_app = SocialApp.objects.create(provider='google', name='local', client_id='a')
+        local_app.sites.add(localhost)
+        ngrok_app = SocialApp.objects.create(provider='google', name='ngrok', client_id='b')
+        ngrok_app.sites.add(request.site)
+
+        adapter = CustomSocialAccountAdapter(request)
+        self.assertEqual(adapter.get_app(request, 'google'), ngrok_app)
@@ -12,7 +12,7 @@ from django.db.models import Count, Q
 from .forms import CustomUserCreationForm, CustomUserChangeForm, UserActivationForm, ResendActivationForm
 from barbershops.models import Barbershop, Service
 from reviews.models import Review
-from bookings.models import Booking
+from bookings.models import Booking, STATUS_BREAKDOWN_CACHE_TIMEOUT
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -94,11 +94,10 @@ class BarberDashboardView(LoginRequiredMixin, TemplateView):
             context['current_turn_number'] = current_turn.queue_number if current_turn else None
 
             # Get finished bookings count for today
-            context['finished_bookings_count'] = Booking.objects.filter(
-                barbershop=primary_shop,
-                booking_day=today,
-                status__in=['completed', 'no_show']
-            ).count()
+            todays_stats = Booking.objects.status_breakdown(
+                primary_shop, today, cache_timeout=STATUS_BREAKDOWN_CACHE_TIMEOUT
+            )
+            context['finished_bookings_count'] = todays_stats['completed'] + todays_stats['no_show']
 
             # Get recent reviews
             recent_reviews = Review.objects.filter(
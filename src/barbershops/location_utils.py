@@ -1,8 +1,31 @@
+import base64
+import binascii
+import bisect
+import heapq
 import math
-from typing import Tuple, List, Dict, Any
-from django.db.models import QuerySet
+import threading
+import time
+from typing import Tuple, List, Dict, Any, Iterable, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, FloatField, OuterRef, QuerySet, Subquery, Value
+from django.db.models.functions import Coalesce
 from .models import Barbershop
 
+EARTH_RADIUS_KM = 6371
+
+# حجم خلية الشبكة بالدرجات (~11 كم عند خط الاستواء)
+GRID_CELL_DEGREES = 0.1
+
+# أقصى عمر للفهرس داخل العملية قبل إعادة بنائه
+SPATIAL_INDEX_TTL = 300
+
+# رقم النسخة يصل لكل العمال فقط مع كاش مشترك (SHARED_CACHE). بدونه يزيد كل
+# عامل نسخته في كاشه الخاص ولا يعلم بتغييرات العمال الآخرين، فيعتمد تحديث
+# الفهرس على هذه المدة الأقصر وحدها
+LOCAL_SPATIAL_INDEX_TTL = 30
+SPATIAL_INDEX_VERSION_KEY = 'barbershops:spatial_index_version'
+
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -22,15 +45,204 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     dlat = lat2 - lat1
     dlon = lon2 - lon1
     a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
+    c = 2 * math.asin(min(1.0, math.sqrt(a)))
     
     # نصف قطر الأرض بالكيلومتر
-    r = 6371
+    r = EARTH_RADIUS_KM
     
     return c * r
 
 
-def get_nearest_barbershops(user_lat: float, user_lon: float, max_distance: float = 50) -> List[Dict[str, Any]]:
+class SpatialIndex:
+    """
+    فهرس شبكي (grid) للإحداثيات داخل الذاكرة
+    
+    يقسم الخريطة إلى خلايا بحجم GRID_CELL_DEGREES ويخزن في كل خلية الصالونات
+    الواقعة فيها، فيفحص البحث الخلايا المحيطة بالمستخدم فقط بدلاً من كل الصالونات.
+    """
+
+    def __init__(self, points: Iterable[Tuple[int, float, float]], cell_degrees: float = GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.lon_cells = int(round(360 / cell_degrees))
+        # rows[row][col] = [(id, lat, lon), ...]
+        self.rows: Dict[int, Dict[int, List[Tuple[int, float, float]]]] = {}
+        self.size = 0
+        for point_id, lat, lon in points:
+            row, col = self._cell(lat, lon)
+            self.rows.setdefault(row, {}).setdefault(col, []).append((point_id, lat, lon))
+            self.size += 1
+        self.sorted_rows = sorted(self.rows)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (
+            math.floor(lat / self.cell_degrees),
+            math.floor(lon / self.cell_degrees) % self.lon_cells,
+        )
+
+    def _col_distance(self, col_a: int, col_b: int) -> int:
+        """المسافة بين عمودين مع الالتفاف عند خط الطول 180"""
+        distance = (col_a - col_b) % self.lon_cells
+        return min(distance, self.lon_cells - distance)
+
+    def _lon_span(self, lat_limit: float, distance: float) -> float:
+        """
+        أقصى فرق في خط الطول (بالدرجات) لنقطة تبعد distance كم أو أقل
+        عن نقطة لا يتجاوز خط عرضها lat_limit
+        """
+        cos_lat = math.cos(math.radians(min(90.0, lat_limit)))
+        ratio = math.sin(distance / (2 * EARTH_RADIUS_KM))
+        if cos_lat <= ratio:
+            return 180.0
+        return math.degrees(2 * math.asin(ratio / cos_lat))
+
+    def _ring_points(self, center: Tuple[int, int], ring: int):
+        """
+        نقاط الحلقة رقم ring: الخلايا التي max(فرق الصف, فرق العمود) فيها يساوي ring
+        
+        يمر فقط على الصفوف المشغولة حتى يبقى البحث سريعاً قرب القطبين.
+        """
+        center_row, center_col = center
+        for row in {center_row - ring, center_row + ring}:
+            for col, points in self.rows.get(row, {}).items():
+                if self._col_distance(col, center_col) <= ring:
+                    yield from points
+
+        if ring == 0 or ring > self.lon_cells // 2:
+            return
+        side_cols = {(center_col - ring) % self.lon_cells, (center_col + ring) % self.lon_cells}
+        first = bisect.bisect_left(self.sorted_rows, center_row - ring + 1)
+        last = bisect.bisect_right(self.sorted_rows, center_row + ring - 1)
+        for row in self.sorted_rows[first:last]:
+            columns = self.rows[row]
+            for col in side_cols:
+                yield from columns.get(col, ())
+
+    def _ring_min_distance(self, lat: float, ring: int) -> float:
+        """أقل مسافة ممكنة (كم) لأي نقطة في الحلقة ring أو ما بعدها"""
+        if ring <= 1:
+            return 0.0
+        gap_degrees = (ring - 1) * self.cell_degrees
+        # النقطة تبعد (ring - 1) خلية على الأقل شمالاً/جنوباً...
+        lat_bound = EARTH_RADIUS_KM * math.radians(gap_degrees)
+        if ring > self.lon_cells // 2:
+            return lat_bound
+        # ...أو شرقاً/غرباً، والحالة الأسوأ عند أعلى خط عرض ممكن
+        edge_lat = min(90.0, abs(lat) + ring * self.cell_degrees)
+        lon_gap = math.radians(min(180.0, gap_degrees))
+        cos_lat = math.cos(math.radians(edge_lat))
+        lon_bound = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, cos_lat * math.sin(lon_gap / 2)))
+        return min(lat_bound, lon_bound)
+
+    def within(self, lat: float, lon: float, radius: float) -> List[Tuple[float, int]]:
+        """كل النقاط داخل نصف القطر (كم) مرتبة حسب المسافة: [(distance, id), ...]"""
+        lat_span = math.degrees(radius / EARTH_RADIUS_KM)
+        lon_span = self._lon_span(abs(lat) + lat_span, radius)
+
+        row_min = math.floor((lat - lat_span) / self.cell_degrees)
+        row_max = math.floor((lat + lat_span) / self.cell_degrees)
+        col_min = math.floor((lon - lon_span) / self.cell_degrees)
+        col_max = math.floor((lon + lon_span) / self.cell_degrees)
+        cols = {col % self.lon_cells for col in range(col_min, col_max + 1)}
+
+        results = []
+        first = bisect.bisect_left(self.sorted_rows, row_min)
+        last = bisect.bisect_right(self.sorted_rows, row_max)
+        for row in self.sorted_rows[first:last]:
+            columns = self.rows[row]
+            for col in (cols if len(cols) < len(columns) else cols.intersection(columns)):
+                for point_id, p_lat, p_lon in columns.get(col, ()):
+                    distance = calculate_distance(lat, lon, p_lat, p_lon)
+                    if distance <= radius:
+                        results.append((distance, point_id))
+        results.sort()
+        return results
+
+    def nearest(self, lat: float, lon: float, k: int, max_distance: Optional[float] = None) -> List[Tuple[float, int]]:
+        """أقرب k نقطة (اختيارياً ضمن max_distance) مرتبة حسب المسافة"""
+        if k <= 0 or not self.size:
+            return []
+
+        center = self._cell(lat, lon)
+        best: List[Tuple[float, int]] = []  # max-heap بقيم سالبة
+        seen = 0
+        ring = 0
+
+        while seen < self.size:
+            bound = self._ring_min_distance(lat, ring)
+            if max_distance is not None and bound > max_distance:
+                break
+            if len(best) == k and bound > -best[0][0]:
+                break
+            for point_id, p_lat, p_lon in self._ring_points(center, ring):
+                seen += 1
+                distance = calculate_distance(lat, lon, p_lat, p_lon)
+                if max_distance is not None and distance > max_distance:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, point_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, point_id))
+            ring += 1
+
+        return sorted((-negative, point_id) for negative, point_id in best)
+
+
+_index_lock = threading.Lock()
+_index_state = {'index': None, 'version': None, 'built_at': 0.0}
+
+
+def _spatial_index_ttl() -> int:
+    if getattr(settings, 'SHARED_CACHE', False):
+        return SPATIAL_INDEX_TTL
+    return LOCAL_SPATIAL_INDEX_TTL
+
+
+def invalidate_spatial_index():
+    """إبطال الفهرس في هذه العملية، وفي باقي العمال إذا كان الكاش مشتركاً"""
+    with _index_lock:
+        _index_state['index'] = None
+    try:
+        cache.incr(SPATIAL_INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(SPATIAL_INDEX_VERSION_KEY, 1, None)
+
+
+def get_spatial_index() -> SpatialIndex:
+    """إرجاع فهرس الصالونات النشطة، مع إعادة بنائه عند الحاجة"""
+    version = cache.get(SPATIAL_INDEX_VERSION_KEY)
+    with _index_lock:
+        index = _index_state['index']
+        is_stale = (
+            index is None
+            or _index_state['version'] != version
+            or time.monotonic() - _index_state['built_at'] > _spatial_index_ttl()
+        )
+        if is_stale:
+            points = Barbershop.objects.filter(
+                is_active=True,
+                is_verified=True,
+                latitude__isnull=False,
+                longitude__isnull=False
+            ).values_list('id', 'latitude', 'longitude')
+            index = SpatialIndex((pk, float(lat), float(lon)) for pk, lat, lon in points)
+            _index_state.update(index=index, version=version, built_at=time.monotonic())
+        return index
+
+
+def find_nearby_matches(user_lat: float, user_lon: float, max_distance: float = 50, limit: Optional[int] = None) -> List[Tuple[float, int]]:
+    """
+    معرفات الصالونات القريبة مع المسافة، مرتبة حسب (المسافة، المعرف)
+    
+    Args:
+        limit: أقصى عدد من الصالونات (أقرب k صالون)، بدون حد إذا كان None
+    """
+    index = get_spatial_index()
+    if limit is None:
+        return index.within(user_lat, user_lon, max_distance)
+    return index.nearest(user_lat, user_lon, limit, max_distance)
+
+
+def get_nearest_barbershops(user_lat: float, user_lon: float, max_distance: float = 50, limit: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     الحصول على قائمة الصالونات مرتبة حسب القرب من موقع المستخدم
     
@@ -38,37 +250,127 @@ def get_nearest_barbershops(user_lat: float, user_lon: float, max_distance: floa
         user_lat: خط العرض للمستخدم
         user_lon: خط الطول للمستخدم
         max_distance: أقصى مسافة بالكيلومتر (افتراضي 50 كم)
+        limit: أقصى عدد من الصالونات (أقرب k صالون)، بدون حد إذا كان None
     
     Returns:
         قائمة الصالونات مع المسافة مرتبة حسب القرب
     """
-    # جلب جميع الصالونات النشطة والمعتمدة التي لديها إحداثيات
-    barbershops = Barbershop.objects.filter(
+    matches = find_nearby_matches(user_lat, user_lon, max_distance, limit)
+    return load_nearby_barbershops(matches)
+
+
+def load_nearby_barbershops(matches: List[Tuple[float, int]], queryset: Optional[QuerySet] = None) -> List[Dict[str, Any]]:
+    """جلب الصالونات المطابقة فقط في استعلام واحد مع الحفاظ على ترتيب المسافة"""
+    if not matches:
+        return []
+
+    if queryset is None:
+        queryset = Barbershop.objects.select_related('owner')
+    barbershops = queryset.filter(
         is_active=True,
-        is_verified=True,
-        latitude__isnull=False,
-        longitude__isnull=False
-    ).select_related('owner').prefetch_related('services', 'reviews')
-    
-    barbershops_with_distance = []
-    
-    for barbershop in barbershops:
-        distance = calculate_distance(
-            user_lat, user_lon,
-            float(barbershop.latitude), float(barbershop.longitude)
-        )
-        
-        # إضافة الصالونات التي تقع ضمن المسافة المحددة فقط
-        if distance <= max_distance:
-            barbershops_with_distance.append({
-                'barbershop': barbershop,
-                'distance': round(distance, 2)
-            })
-    
-    # ترتيب حسب المسافة
-    barbershops_with_distance.sort(key=lambda x: x['distance'])
+        is_verified=True
+    ).in_bulk([barbershop_id for _, barbershop_id in matches])
+
+    return [
+        {
+            'barbershop': barbershops[barbershop_id],
+            'distance': round(distance, 2)
+        }
+        for distance, barbershop_id in matches
+        if barbershop_id in barbershops
+    ]
+
+
+def encode_nearby_cursor(distance: float, barbershop_id: int) -> str:
+    """مؤشر الصفحة التالية: آخر (مسافة، معرف) تم إرجاعه"""
+    return base64.urlsafe_b64encode(f'{distance!r}:{barbershop_id}'.encode()).decode()
+
+
+def decode_nearby_cursor(cursor: str) -> Tuple[float, int]:
+    """فك المؤشر - يرفع ValueError إذا كان غير صالح"""
+    try:
+        distance, barbershop_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(distance), int(barbershop_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError('مؤشر غير صالح') from e
+
+
+def paginate_nearby_matches(matches: List[Tuple[float, int]], limit: int, offset: int = 0, cursor: Optional[str] = None) -> Tuple[List[Tuple[float, int]], Optional[str]]:
+    """
+    تقسيم النتائج المرتبة إلى صفحات إما بـ offset أو بمؤشر (keyset)
     
-    return barbershops_with_distance
+    Returns:
+        (نتائج الصفحة، مؤشر الصفحة التالية أو None)
+    """
+    if cursor:
+        start = bisect.bisect_right(matches, decode_nearby_cursor(cursor))
+    else:
+        start = offset
+
+    page = matches[start:start + limit]
+    next_cursor = None
+    if page and start + limit < len(matches):
+        next_cursor = encode_nearby_cursor(*page[-1])
+    return page, next_cursor
+
+
+def with_listing_stats(queryset: QuerySet) -> QuerySet:
+    """
+    إضافة متوسط التقييمات المعتمدة وعدد الخدمات النشطة كاستعلامات فرعية
+    في نفس استعلام جلب الصالونات (بدون JOIN يضاعف الصفوف)
+    """
+    from reviews.models import Review
+    from .models import Service
+
+    approved_reviews = Review.objects.filter(
+        barbershop=OuterRef('pk'),
+        is_approved=True
+    ).order_by().values('barbershop')
+    active_services = Service.objects.filter(
+        barbershop=OuterRef('pk'),
+        is_active=True
+    ).order_by().values('barbershop')
+
+    return queryset.annotate(
+        approved_avg_rating=Coalesce(
+            Subquery(approved_reviews.annotate(value=Avg('rating')).values('value')),
+            Value(0.0),
+            output_field=FloatField()
+        ),
+        active_services_count=Coalesce(
+            Subquery(active_services.annotate(value=Count('id')).values('value')),
+            0
+        ),
+    )
+
+
+def serialize_nearby_barbershops(matches: List[Tuple[float, int]]) -> List[Dict[str, Any]]:
+    """تحويل الصالونات القريبة إلى JSON باستعلام واحد لكل الصفحة"""
+    items = load_nearby_barbershops(matches, with_listing_stats(Barbershop.objects.all()))
+
+    barbershops_data = []
+    for item in items:
+        barbershop = item['barbershop']
+        distance = item['distance']
+        barbershops_data.append({
+            'id': barbershop.id,
+            'name': barbershop.name,
+            'description': barbershop.description,
+            'address': barbershop.address,
+            'phone_number': barbershop.phone_number,
+            'image_url': barbershop.image.url if barbershop.image else None,
+            'latitude': float(barbershop.latitude),
+            'longitude': float(barbershop.longitude),
+            'distance': distance,
+            'distance_text': format_distance(distance),
+            'avg_rating': round(barbershop.approved_avg_rating, 1),
+            'reviews_count': barbershop.approved_review_count,
+            'services_count': barbershop.active_services_count,
+            'opening_time': barbershop.opening_time.strftime('%H:%M') if barbershop.opening_time else None,
+            'closing_time': barbershop.closing_time.strftime('%H:%M') if barbershop.closing_time else None,
+            'detail_url': f'/barbershops/{barbershop.id}/'
+        })
+    return barbershops_data
 
 
 def format_distance(distance: float) -> str:
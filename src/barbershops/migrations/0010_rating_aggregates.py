@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:05
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Barbershop = apps.get_model('barbershops', 'Barbershop')
+    Review = apps.get_model('reviews', 'Review')
+
+    reviews = Review.objects.filter(barbershop=OuterRef('pk')).order_by().values('barbershop')
+
+    def aggregate(queryset, expression):
+        return Subquery(queryset.annotate(value=expression).values('value'))
+
+    Barbershop.objects.update(
+        rating_sum=Coalesce(aggregate(reviews, Sum('rating')), 0),
+        rating_count=Coalesce(aggregate(reviews, Count('id')), 0),
+        approved_review_count=Coalesce(aggregate(reviews.filter(is_approved=True), Count('id')), 0),
+        rating_avg=Coalesce(aggregate(reviews, Avg('rating')), Value(0.0), output_field=FloatField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barbershops', '0009_barbershop_current_turn_number_and_more'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='barbershop',
+            name='approved_review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='عدد التقييمات المعتمدة'),
+        ),
+        migrations.AddField(
+            model_name='barbershop',
+            name='rating_avg',
+            field=models.FloatField(db_index=True, default=0, editable=False, verbose_name='متوسط التقييم'),
+        ),
+        migrations.AddField(
+            model_name='barbershop',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='عدد التقييمات'),
+        ),
+        migrations.AddField(
+            model_name='barbershop',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='مجموع التقييمات'),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
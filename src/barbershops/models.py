@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
@@ -164,6 +166,32 @@ class Barbershop(models.Model):
         verbose_name='الإعدادات المتقدمة'
     )
 
+    # Rating aggregates - يتم تحديثها تلقائياً عند تغيير التقييمات (reviews/signals.py)
+    rating_sum = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='مجموع التقييمات'
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='عدد التقييمات'
+    )
+    approved_review_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='عدد التقييمات المعتمدة'
+    )
+    rating_avg = models.FloatField(
+        default=0,
+        editable=False,
+        db_index=True,
+        verbose_name='متوسط التقييم'
+    )
+
+    # لا تُكتب إلا بتحديثات F() في apply_rating_change وrebuild_rating_aggregates
+    RATING_AGGREGATE_FIELDS = frozenset({'rating_sum', 'rating_count', 'approved_review_count', 'rating_avg'})
+
     class Meta:
         verbose_name = 'محل حلاقة'
         verbose_name_plural = 'محلات الحلاقة'
@@ -207,6 +235,17 @@ class Barbershop(models.Model):
                     'online_payment': False
                 }
             }
+        elif not self._state.adding:
+            # قيم مجاميع التقييم في النسخة المحملة قد تكون قديمة، فلا تُحفظ فوق القيم الحالية
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.RATING_AGGREGATE_FIELDS
+                ]
+            kwargs['update_fields'] = [
+                name for name in update_fields if name not in self.RATING_AGGREGATE_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def get_working_hours(self):
@@ -234,14 +273,32 @@ class Barbershop(models.Model):
 
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum([review.rating for review in reviews]) / len(reviews)
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
 
     @property
     def total_reviews(self):
-        return self.reviews.count()
+        return self.rating_count
+
+    @classmethod
+    def apply_rating_change(cls, barbershop_id, rating_delta=0, count_delta=0, approved_delta=0):
+        """تحديث مجاميع التقييم للمحل بزيادة/نقصان في استعلام UPDATE واحد"""
+        if not (rating_delta or count_delta or approved_delta):
+            return 0
+
+        new_sum = F('rating_sum') + rating_delta
+        new_count = F('rating_count') + count_delta
+        return cls.objects.filter(pk=barbershop_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            approved_review_count=F('approved_review_count') + approved_delta,
+            rating_avg=Coalesce(
+                Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+                Value(0.0),
+                output_field=FloatField()
+            ),
+        )
 
     def get_main_photo_url(self):
         main_image = self.images.filter(is_main=True).first()
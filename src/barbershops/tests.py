@@ -0,0 +1,203 @@
+import datetime
+import json
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from reviews.models import Review
+from .location_utils import SPATIAL_INDEX_VERSION_KEY
+from .models import Barbershop, Service
+from .utils import rebuild_rating_aggregates
+
+User = get_user_model()
+
+
+class NearbyBarbershopsAPITests(TestCase):
+    """عدد استعلامات API الصالونات القريبة ثابت مهما كان عدد الصالونات المُرجعة"""
+
+    # استعلام واحد لجلب صفحة الصالونات مع متوسط التقييم وعدد الخدمات
+    PAGE_QUERIES = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass',
+            user_type='barber', is_email_verified=True
+        )
+        cls.customer = User.objects.create_user(
+            username='customer', email='customer@example.com', password='pass', is_email_verified=True
+        )
+
+    def create_shops(self, count):
+        # إبطال الفهرس الجغرافي يتم بعد نجاح المعاملة، وهو ما لا يحدث داخل TestCase
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_shops(count)
+
+    def _create_shops(self, count):
+        for i in range(count):
+            barbershop = Barbershop.objects.create(
+                owner=self.owner, name=f'shop {i}', description='d', address='a', phone_number='1',
+                opening_time=datetime.time(9), closing_time=datetime.time(18),
+                latitude=30 + i * 0.001, longitude=31, is_verified=True
+            )
+            Service.objects.create(barbershop=barbershop, name='قص', price=10, duration=30)
+            Review.objects.create(
+                barbershop=barbershop, customer=self.customer, rating=4, comment='c', is_approved=True
+            )
+
+    def post(self, **data):
+        return self.client.post(
+            reverse('barbershops:api_nearby'),
+            json.dumps({'latitude': 30, 'longitude': 31, **data}),
+            content_type='application/json'
+        )
+
+    def test_paginated_query_count_is_constant(self):
+        for count in (3, 40):
+            with self.subTest(count=count):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Barbershop.objects.all().delete()
+                self.create_shops(count)
+                # بناء الفهرس الجغرافي وقراءة الموقع الحالي مرة واحدة خارج القياس
+                self.post(limit=1)
+                with self.assertNumQueries(self.PAGE_QUERIES):
+                    response = self.post(limit=100)
+                data = response.json()
+                self.assertEqual(len(data['barbershops']), count)
+                self.assertEqual(data['barbershops'][0]['services_count'], 1)
+                self.assertEqual(data['barbershops'][0]['avg_rating'], 4)
+
+    def test_streamed_query_count_per_batch(self):
+        self.create_shops(150)
+        self.post(limit=1)
+        # دفعتان من 100 صالون: استعلام واحد لكل دفعة
+        with self.assertNumQueries(2 * self.PAGE_QUERIES):
+            response = self.post()
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data['barbershops']), 150)
+
+    def test_index_invalidated_after_commit(self):
+        self.create_shops(1)
+        self.post(limit=1)
+        barbershop = Barbershop.objects.get()
+        version = cache.get(SPATIAL_INDEX_VERSION_KEY)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            barbershop.latitude = 30.5
+            barbershop.save(update_fields=['latitude'])
+            barbershop.save(update_fields=['description'])
+            self.assertEqual(cache.get(SPATIAL_INDEX_VERSION_KEY), version)
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        self.assertNotEqual(cache.get(SPATIAL_INDEX_VERSION_KEY), version)
+        self.assertEqual(self.post(limit=1).json()['barbershops'], [])
+
+
+class RatingAggregateTests(TestCase):
+    """مجاميع التقييم المخزنة تتبع التقييمات ولا يكتب فوقها حفظ المحل العادي"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            username='owner', email='owner@example.com', password='pass',
+            user_type='barber', is_email_verified=True
+        )
+        cls.customers = [
+            User.objects.create_user(
+                username=f'customer{i}', email=f'customer{i}@example.com', password='pass',
+                is_email_verified=True
+            )
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.barbershop = self.create_shop('shop')
+
+    def create_shop(self, name):
+        return Barbershop.objects.create(
+            owner=self.owner, name=name, description='d', address='a', phone_number='1',
+            opening_time=datetime.time(9), closing_time=datetime.time(18)
+        )
+
+    def review(self, rating, customer=0, is_approved=True, barbershop=None):
+        return Review.objects.create(
+            barbershop=barbershop or self.barbershop, customer=self.customers[customer],
+            rating=rating, comment='c', is_approved=is_approved
+        )
+
+    def assertAggregates(self, rating_sum, rating_count, approved, barbershop=None):
+        barbershop = Barbershop.objects.get(pk=(barbershop or self.barbershop).pk)
+        self.assertEqual(
+            (barbershop.rating_sum, barbershop.rating_count, barbershop.approved_review_count),
+            (rating_sum, rating_count, approved)
+        )
+        self.assertAlmostEqual(barbershop.rating_avg, rating_sum / rating_count if rating_count else 0)
+
+    def test_create_and_rating_change(self):
+        review = self.review(4)
+        self.review(2, customer=1)
+        self.assertAggregates(6, 2, 2)
+
+        review.rating = 5
+        review.save()
+        self.assertAggregates(7, 2, 2)
+
+    def test_approve_and_unapprove(self):
+        review = self.review(4, is_approved=False)
+        self.assertAggregates(4, 1, 0)
+
+        review.is_approved = True
+        review.save()
+        self.assertAggregates(4, 1, 1)
+
+        review.is_approved = False
+        review.save()
+        self.assertAggregates(4, 1, 0)
+
+    def test_delete(self):
+        review = self.review(4)
+        self.review(2, customer=1)
+        review.delete()
+        self.assertAggregates(2, 1, 1)
+
+        Review.objects.get().delete()
+        self.assertAggregates(0, 0, 0)
+
+    def test_move_to_other_shop(self):
+        other = self.create_shop('other')
+        review = self.review(4)
+        review.barbershop = other
+        review.save()
+        self.assertAggregates(0, 0, 0)
+        self.assertAggregates(4, 1, 1, barbershop=other)
+
+    def test_save_does_not_overwrite_aggregates(self):
+        stale = Barbershop.objects.get(pk=self.barbershop.pk)
+        self.review(4)
+
+        stale.name = 'renamed'
+        stale.save()
+        self.assertAggregates(4, 1, 1)
+
+        stale.save(update_fields=['description', 'rating_sum', 'rating_count'])
+        self.assertAggregates(4, 1, 1)
+        self.assertEqual(Barbershop.objects.get(pk=self.barbershop.pk).name, 'renamed')
+
+    def test_rebuild_rating_aggregates(self):
+        other = self.create_shop('other')
+        self.review(4)
+        self.review(1, customer=1, is_approved=False)
+        self.review(5, barbershop=other)
+        Barbershop.objects.update(rating_sum=99, rating_count=1, approved_review_count=7, rating_avg=99)
+
+        self.assertEqual(rebuild_rating_aggregates([self.barbershop.pk]), 1)
+        self.assertAggregates(5, 2, 1)
+        # المحلات غير المحددة لا تتغير
+        self.assertEqual(Barbershop.objects.get(pk=other.pk).rating_sum, 99)
+
+        empty = self.create_shop('empty')
+        Barbershop.objects.filter(pk=empty.pk).update(rating_sum=3, rating_count=1, rating_avg=3)
+        self.assertEqual(rebuild_rating_aggregates(), 3)
+        self.assertAggregates(5, 1, 1, barbershop=other)
+        self.assertAggregates(0, 0, 0, barbershop=empty)
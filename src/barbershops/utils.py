@@ -1,6 +1,34 @@
+from django.db.models import Avg, Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from .models import Barbershop
 
 def reset_daily_turns():
     """Resets the current_turn_number for all barbershops to 0."""
     updated_count = Barbershop.objects.all().update(current_turn_number=0)
     return updated_count
+
+
+def rebuild_rating_aggregates(barbershop_ids=None):
+    """Recomputes the stored rating aggregates from the reviews table in one UPDATE."""
+    from reviews.models import Review
+
+    barbershops = Barbershop.objects.all()
+    if barbershop_ids is not None:
+        barbershops = barbershops.filter(pk__in=barbershop_ids)
+
+    reviews = Review.objects.filter(barbershop=OuterRef('pk')).order_by().values('barbershop')
+
+    def aggregate(queryset, expression):
+        return Subquery(queryset.annotate(value=expression).values('value'))
+
+    updated_count = barbershops.update(
+        rating_sum=Coalesce(aggregate(reviews, Sum('rating')), 0),
+        rating_count=Coalesce(aggregate(reviews, Count('id')), 0),
+        approved_review_count=Coalesce(
+            aggregate(reviews.filter(is_approved=True), Count('id')), 0
+        ),
+        rating_avg=Coalesce(
+            aggregate(reviews, Avg('rating')), Value(0.0), output_field=FloatField()
+        ),
+    )
+    return updated_count
@@ -87,8 +87,8 @@ class BookingHistoryAdmin(admin.ModelAdmin):
 
 @admin.register(BookingMessage)
 class BookingMessageAdmin(admin.ModelAdmin):
-    list_display = ['booking', 'sender', 'message_preview', 'is_read', 'created_at']
-    list_filter = ['is_read', 'created_at']
+    list_display = ['booking', 'sender', 'message_preview', 'created_at']
+    list_filter = ['created_at']
     search_fields = ['booking__customer__username', 'sender__username', 'message']
     readonly_fields = ['created_at']
     
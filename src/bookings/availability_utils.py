@@ -0,0 +1,235 @@
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from django.core.cache import cache
+from django.db.models import F, IntegerField, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Booking
+
+# الفترات بالدقائق منذ منتصف الليل: (البداية، النهاية)
+Interval = Tuple[int, int]
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# المسافة بين بدايات المواعيد المقترحة (بالدقائق)
+SLOT_STEP_MINUTES = 30
+
+# الحجوزات التي تشغل وقتاً في طابور اليوم
+ACTIVE_BOOKING_STATUSES = ('pending', 'confirmed')
+
+BOOKED_DURATIONS_CACHE_TIMEOUT = 300
+
+
+def booked_durations_cache_key(barbershop_id: int, day: datetime.date) -> str:
+    return f'bookings:booked_durations:{barbershop_id}:{day}'
+
+
+def _to_minutes(value: Any) -> Optional[int]:
+    """تحويل 'HH:MM' أو كائن time إلى دقائق منذ منتصف الليل"""
+    if isinstance(value, datetime.time):
+        return value.hour * 60 + value.minute
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_minutes(minutes: int) -> str:
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """ترتيب الفترات ودمج المتداخلة منها - O(n log n)"""
+    merged: List[Interval] = []
+    for start, end in sorted(interval for interval in intervals if interval[0] < interval[1]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def intersect_intervals(first: List[Interval], second: List[Interval]) -> List[Interval]:
+    """تقاطع قائمتين مرتبتين ومدموجتين من الفترات بمؤشرين - O(n + m)"""
+    result: List[Interval] = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(free: List[Interval], occupied: List[Interval]) -> List[Interval]:
+    """طرح الفترات المشغولة من الفترات الحرة (كلاهما مرتب ومدموج) - O(n + m)"""
+    result: List[Interval] = []
+    j = 0
+    for start, end in free:
+        cursor = start
+        while j < len(occupied) and occupied[j][1] <= cursor:
+            j += 1
+        k = j
+        while k < len(occupied) and occupied[k][0] < end:
+            if occupied[k][0] > cursor:
+                result.append((cursor, occupied[k][0]))
+            cursor = max(cursor, occupied[k][1])
+            k += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+def get_opening_intervals(barbershop, day: datetime.date) -> List[Interval]:
+    """
+    فترات العمل في اليوم: ساعات العمل من settings['working_hours'] (أو وقت
+    الفتح والإغلاق القديمين) متقاطعة مع فترات الحجز booking_slots إن وجدت
+    """
+    working_hours = barbershop.get_working_hours()
+    if working_hours:
+        hours = working_hours.get(WEEKDAYS[day.weekday()])
+        if not hours or hours.get('is_open') is False:
+            return []
+        start, end = _to_minutes(hours.get('start')), _to_minutes(hours.get('end'))
+    else:
+        start, end = _to_minutes(barbershop.opening_time), _to_minutes(barbershop.closing_time)
+
+    if start is None or end is None or start >= end:
+        return []
+    opening = [(start, end)]
+
+    booking_slots = barbershop.booking_slots or barbershop.get_booking_slots()
+    if isinstance(booking_slots, dict) and booking_slots:
+        slots = []
+        for times in booking_slots.values():
+            if isinstance(times, dict):
+                slot_start, slot_end = _to_minutes(times.get('start')), _to_minutes(times.get('end'))
+                if slot_start is not None and slot_end is not None:
+                    slots.append((slot_start, slot_end))
+        opening = intersect_intervals(opening, merge_intervals(slots))
+
+    return opening
+
+
+def get_booked_durations(barbershop, day: datetime.date) -> List[int]:
+    """
+    مدة كل حجز نشط في اليوم (الخدمات + التحضير) بترتيب الطابور في استعلام واحد
+
+    مخزنة لكل (محل، يوم) ويتم حذفها عند أي تغيير على حجوزات اليوم
+    (bookings/signals.py)
+    """
+    cache_key = booked_durations_cache_key(barbershop.pk, day)
+    durations = cache.get(cache_key)
+    if durations is not None:
+        return durations
+
+    minutes_per_service = (
+        F('booking_services__service__duration') + F('booking_services__service__preparation_time')
+    ) * F('booking_services__quantity')
+    legacy_minutes = F('service__duration') + F('service__preparation_time')
+
+    durations = list(
+        Booking.objects.filter(
+            barbershop=barbershop,
+            booking_day=day,
+            status__in=ACTIVE_BOOKING_STATUSES
+        ).annotate(
+            minutes=Coalesce(
+                Sum(minutes_per_service, output_field=IntegerField()),
+                legacy_minutes,
+                Value(0),
+                output_field=IntegerField()
+            )
+        ).order_by('queue_number').values_list('minutes', flat=True)
+    )
+    cache.set(cache_key, durations, BOOKED_DURATIONS_CACHE_TIMEOUT)
+    return durations
+
+
+def layout_queue(opening: List[Interval], durations: List[int], start: int = 0) -> List[Interval]:
+    """
+    توزيع حجوزات الطابور على فترات العمل بالترتيب: كل حجز يبدأ بعد السابق له،
+    ولا تمتد الخدمة عبر فترة الراحة بين فترتين
+
+    Args:
+        start: لا يبدأ الطابور قبل هذه الدقيقة (الوقت الحالي لطابور اليوم:
+            الحجوزات المنتظرة لم تُنفذ بعد مهما كان موعدها المفترض)
+    """
+    opening = [(max(interval_start, start), end) for interval_start, end in opening if end > start]
+    occupied: List[Interval] = []
+    index = 0
+    cursor = opening[0][0] if opening else 0
+    for duration in durations:
+        while index < len(opening) and cursor + duration > opening[index][1]:
+            index += 1
+            if index < len(opening):
+                cursor = opening[index][0]
+        if index >= len(opening):
+            break
+        occupied.append((cursor, cursor + duration))
+        cursor += duration
+    return merge_intervals(occupied)
+
+
+def get_free_intervals(barbershop, day: datetime.date, now: Optional[datetime.datetime] = None) -> List[Interval]:
+    """
+    الفترات الحرة في اليوم بعد طرح وقت الحجوزات
+
+    في يوم now يبدأ توزيع الطابور من max(وقت الفتح، الوقت الحالي)، فالطابور
+    المتأخر عن موعده يشغل الوقت القادم بدلاً من وقت مضى.
+    """
+    opening = get_opening_intervals(barbershop, day)
+    if not opening:
+        return []
+
+    start = 0
+    if now is not None and day == now.date():
+        start = now.hour * 60 + now.minute
+    occupied = layout_queue(opening, get_booked_durations(barbershop, day), start=start)
+    return subtract_intervals(opening, occupied)
+
+
+def get_available_slots(barbershop, day: datetime.date, duration: int,
+                        step: int = SLOT_STEP_MINUTES, now: Optional[datetime.datetime] = None) -> List[str]:
+    """
+    المواعيد المتاحة ('HH:MM') لخدمة مدتها duration دقيقة في اليوم المحدد
+
+    Args:
+        barbershop: المحل
+        day: اليوم
+        duration: مدة الخدمة مع وقت التحضير بالدقائق
+        step: المسافة بين المواعيد المقترحة
+        now: الوقت الحالي (لاستبعاد المواعيد الماضية في نفس اليوم)
+    """
+    earliest = 0
+    if now is not None:
+        if day < now.date():
+            return []
+        if day == now.date():
+            earliest = now.hour * 60 + now.minute
+
+    duration = max(duration, 1)
+    slots: List[str] = []
+    for start, end in get_free_intervals(barbershop, day, now=now):
+        candidate = start
+        if candidate < earliest:
+            # أول موعد بعد الوقت الحالي على نفس شبكة المواعيد
+            candidate += -(-(earliest - candidate) // step) * step
+        while candidate + duration <= end:
+            slots.append(format_minutes(candidate))
+            candidate += step
+    return slots
+
+
+def get_availability(barbershop, day: datetime.date, service, now: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """بيانات المواعيد المتاحة لخدمة واحدة كما تُرجعها الواجهة"""
+    duration = service.duration + service.preparation_time
+    return {
+        'date': day.isoformat(),
+        'duration': duration,
+        'slots': get_available_slots(barbershop, day, duration, now=now),
+    }
@@ -0,0 +1,210 @@
+import asyncio
+import contextvars
+import datetime
+import logging
+import threading
+import uuid
+from typing import Any, Dict, Optional, Set
+from asgiref.sync import SyncToAsync, async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from barbershops.models import Barbershop
+from notifications.models import OutboxEvent
+from notifications.utils import enqueue_outbox_events, notification_outbox_enabled
+from .models import Booking, STATUS_BREAKDOWN_CACHE_TIMEOUT
+from .wait_time_utils import estimate_wait_times
+
+logger = logging.getLogger(__name__)
+
+# التحديثات المتتالية لنفس المحل خلال هذه المدة (بالثواني) تُرسل كرسالة واحدة
+TURN_BROADCAST_WINDOW = 0.5
+
+# مدة الاحتفاظ بحالات الطابور المرسلة لإرسال الفروقات للعملاء عند إعادة الاتصال
+TURN_SNAPSHOT_TIMEOUT = 120
+
+# المحلات التي لديها إرسال مجدول لم يتم بعد
+_pending_broadcasts: Set[int] = set()
+_pending_lock = threading.Lock()
+
+
+def get_turn_snapshot(barbershop_id: int, day: Optional[datetime.date] = None,
+                      now: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """
+    الحالة الكاملة لطابور المحل اليوم كما تُرسل لمجموعة barbershop_<id>:
+    الدور الحالي، عدد المنجز، عدد المنتظرين، الموعد التقريبي للدور التالي
+    وأوقات انتظار كل حجز نشط
+    """
+    now = now or timezone.now()
+    day = day or timezone.localdate(now)
+
+    current_turn_number = Barbershop.objects.filter(
+        pk=barbershop_id
+    ).values_list('current_turn_number', flat=True).first() or 0
+    breakdown = Booking.objects.status_breakdown(
+        barbershop=barbershop_id, day=day, cache_timeout=STATUS_BREAKDOWN_CACHE_TIMEOUT
+    )
+    wait_times = estimate_wait_times(barbershop_id, day=day, now=now)
+    waiting = [item for item in wait_times if item['queue_number'] > current_turn_number]
+
+    return {
+        'current_turn_number': current_turn_number,
+        'finished_bookings_count': breakdown['completed'] + breakdown['no_show'],
+        'waiting_count': len(waiting),
+        'next_eta_time': waiting[0]['eta_time'] if waiting else None,
+        'wait_times': wait_times,
+    }
+
+
+def _turn_sequence_key(barbershop_id: int) -> str:
+    return f'bookings:turn_sequence:{barbershop_id}'
+
+
+def _turn_snapshot_key(barbershop_id: int, sequence: int) -> str:
+    return f'bookings:turn_snapshot:{barbershop_id}:{sequence}'
+
+
+def turn_sequencing_enabled() -> bool:
+    """
+    أرقام التسلسل تحتاج كاشاً مشتركاً (SHARED_CACHE): مع كاش لكل عملية يكون
+    لكل عامل وعملية ASGI عداد خاص، فلا يمكن مقارنة أرقامها ببعض
+    """
+    return getattr(settings, 'SHARED_CACHE', False)
+
+
+def get_turn_sequence(barbershop_id: int) -> Optional[int]:
+    """رقم تسلسل آخر حالة تم تسجيلها لطابور المحل (None بدون كاش مشترك)"""
+    if not turn_sequencing_enabled():
+        return None
+    return cache.get(_turn_sequence_key(barbershop_id))
+
+
+def store_turn_snapshot(barbershop_id: int, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    تسجيل حالة جديدة للطابور برقم تسلسل متزايد وتخزينها في الكاش المشترك
+    (بدون كاش مشترك تُرجع الحالة كما هي بدون تسلسل)
+    """
+    if not turn_sequencing_enabled():
+        return snapshot
+    key = _turn_sequence_key(barbershop_id)
+    cache.add(key, 0, None)
+    snapshot = dict(snapshot, sequence=cache.incr(key))
+    cache.set(_turn_snapshot_key(barbershop_id, snapshot['sequence']), snapshot, TURN_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_turn_update_since(barbershop_id: int, since: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    ما يحتاجه عميل WebSocket عند الاتصال أو إعادة الاتصال
+
+    - بدون since: آخر حالة مخزنة كاملة (أو حالة جديدة إن انتهت صلاحيتها)
+    - since يساوي آخر تسلسل: None (لم يفت العميل شيء)
+    - since أقدم: الحقول التي تغيرت فقط منذ تلك الحالة مع delta=True، أو
+      الحالة الكاملة إن لم تعد الحالة القديمة موجودة في الكاش
+    - بدون كاش مشترك: الحالة الكاملة الحالية دائماً (since يُتجاهل)
+    """
+    if not turn_sequencing_enabled():
+        return get_turn_snapshot(barbershop_id)
+
+    sequence = get_turn_sequence(barbershop_id)
+    if since is not None and since == sequence:
+        return None
+
+    latest = cache.get(_turn_snapshot_key(barbershop_id, sequence)) if sequence else None
+    if latest is None:
+        return store_turn_snapshot(barbershop_id, get_turn_snapshot(barbershop_id))
+    if since is None or since > sequence:
+        return latest
+
+    previous = cache.get(_turn_snapshot_key(barbershop_id, since))
+    if previous is None:
+        return latest
+    delta = {key: value for key, value in latest.items() if previous.get(key) != value}
+    delta['delta'] = True
+    return delta
+
+
+def _build_turn_snapshot(barbershop_id: int) -> Dict[str, Any]:
+    with _pending_lock:
+        _pending_broadcasts.discard(barbershop_id)
+    return store_turn_snapshot(barbershop_id, get_turn_snapshot(barbershop_id))
+
+
+async def _send_turn_snapshot_async(barbershop_id: int) -> None:
+    try:
+        snapshot = await database_sync_to_async(_build_turn_snapshot)(barbershop_id)
+        await get_channel_layer().group_send(
+            f'barbershop_{barbershop_id}',
+            {'type': 'booking_turn_update', **snapshot}
+        )
+    except Exception as e:
+        logger.error(f"Error broadcasting turn update for barbershop {barbershop_id}: {e}")
+
+
+def send_turn_snapshot(barbershop_id: int) -> Dict[str, Any]:
+    """تسجيل حالة جديدة للطابور وإرسالها لمجموعة المحل الآن (يرفع الأخطاء)"""
+    snapshot = _build_turn_snapshot(barbershop_id)
+    async_to_sync(get_channel_layer().group_send)(
+        f'barbershop_{barbershop_id}',
+        {'type': 'booking_turn_update', **snapshot}
+    )
+    return snapshot
+
+
+def _send_turn_snapshot(barbershop_id: int) -> None:
+    try:
+        send_turn_snapshot(barbershop_id)
+    except Exception as e:
+        logger.error(f"Error broadcasting turn update for barbershop {barbershop_id}: {e}")
+    finally:
+        # اتصال قاعدة البيانات الخاص بهذا الخيط
+        connections.close_all()
+
+
+def _main_event_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """حلقة خادم ASGI التي يعمل منها هذا الطلب المتزامن (None في WSGI والأوامر)"""
+    loop = getattr(SyncToAsync.threadlocal, 'main_event_loop', None)
+    return loop if loop is not None and loop.is_running() else None
+
+
+def _schedule_turn_broadcast(barbershop_id: int) -> None:
+    with _pending_lock:
+        if barbershop_id in _pending_broadcasts:
+            return
+        _pending_broadcasts.add(barbershop_id)
+
+    loop = _main_event_loop()
+    if loop is not None:
+        # على حلقة الخادم نفسها حتى تصل الرسالة لطبقة القنوات المشتركة مع
+        # المستهلكين، وبسياق جديد غير مرتبط بالطلب الحالي
+        loop.call_soon_threadsafe(
+            loop.call_later, TURN_BROADCAST_WINDOW,
+            lambda: loop.create_task(_send_turn_snapshot_async(barbershop_id)),
+            context=contextvars.Context()
+        )
+    else:
+        timer = threading.Timer(TURN_BROADCAST_WINDOW, _send_turn_snapshot, args=(barbershop_id,))
+        timer.daemon = True
+        timer.start()
+
+
+def broadcast_turn_update(barbershop_id: int) -> None:
+    """
+    إرسال الحالة الكاملة لطابور المحل بعد نجاح المعاملة الحالية
+
+    الإرسال يتم بعد TURN_BROADCAST_WINDOW على حلقة خادم ASGI (أو في خيط
+    منفصل خارجها)، فلا ينتظر الطلب طبقة القنوات (Redis)، وكل التحديثات على
+    نفس المحل خلال هذه المدة تُجمع في رسالة واحدة تحمل آخر حالة.
+
+    عند تفعيل NOTIFICATION_OUTBOX يُكتب التحديث في صندوق الصادر داخل
+    المعاملة نفسها ويرسله أمر dispatch_outbox (مرة لكل محل في كل دفعة).
+    """
+    if notification_outbox_enabled():
+        enqueue_outbox_events(OutboxEvent.TURN_UPDATE, [
+            (f'turn_update:{barbershop_id}:{uuid.uuid4().hex}', {'barbershop_id': barbershop_id})
+        ])
+        return
+    transaction.on_commit(lambda: _schedule_turn_broadcast(barbershop_id))
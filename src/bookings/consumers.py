@@ -1,12 +1,19 @@
 import json
+import uuid
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Booking, BookingMessage
-from accounts.models import CustomUser
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from notifications.utils import build_chat_notification, chat_notification_key, deliver_notifications
+from .broadcast_utils import get_turn_update_since
+from .chat_utils import BufferedChatMessage, chat_write_behind_enabled, get_chat_write_buffer
+from .models import Booking, BookingMessage, BookingReadState
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.booking_id = self.scope['url_route']['kwargs']['booking_id']
+        self.booking_id = int(self.scope['url_route']['kwargs']['booking_id'])
         self.room_group_name = f'chat_{self.booking_id}'
         self.user = self.scope['user']
 
@@ -15,8 +22,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        is_authorized = await self.check_authorization(self.booking_id, self.user)
-        if not is_authorized:
+        # Load the booking participants once for the life of the socket
+        self.participants = await self.load_participants(self.booking_id)
+        if not self.participants or self.user.pk not in (
+            self.participants['customer_id'], self.participants['owner_id']
+        ):
             await self.close()
             return
 
@@ -38,52 +48,119 @@ class ChatConsumer(AsyncWebsocketConsumer):
     # Receive message from WebSocket
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
+        if 'read' in text_data_json:
+            # القارئ وصلته رسالة وهو في المحادثة: رقمها (أو null لآخر رسالة محفوظة)
+            await self.mark_read(text_data_json['read'])
+            return
         message = text_data_json['message']
 
+        if chat_write_behind_enabled():
+            await self.receive_write_behind(message)
+            return
+
         # Save message to database
-        new_msg = await self.save_message(self.booking_id, self.user, message)
+        new_msg = await self.save_message(message)
 
         # Send message to room group
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
+                'id': new_msg.pk,
                 'message': message,
                 'sender_username': self.user.username,
                 'created_at': new_msg.created_at.strftime('%d/%m/%Y %H:%M')
             }
         )
 
+    async def receive_write_behind(self, message):
+        """
+        Broadcast first with a server-assigned uid and timestamp, then persist
+        in the next batch of the write buffer (chat_ack / chat_nack follow)
+        """
+        uid = uuid.uuid4().hex
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'chat_message',
+                'uid': uid,
+                'message': message,
+                'sender_username': self.user.username,
+                'created_at': timezone.localtime().strftime('%d/%m/%Y %H:%M')
+            }
+        )
+        recipient_id, title = self.get_notification_recipient()
+        await get_chat_write_buffer().add(BufferedChatMessage(
+            uid=uid,
+            booking_id=self.booking_id,
+            sender=self.user,
+            message=message,
+            reply_channel=self.channel_name,
+            recipient_id=recipient_id,
+            notification_title=title
+        ))
+
     # Receive message from room group
     async def chat_message(self, event):
-        message = event['message']
-        sender_username = event['sender_username']
-        created_at = event['created_at']
-
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
-            'message': message,
-            'sender_username': sender_username,
-            'created_at': created_at
+            key: value for key, value in event.items() if key != 'type'
         }))
 
+    # Buffered messages of this socket were saved ([{uid, id}]) or could not be saved
+    async def chat_ack(self, event):
+        await self.send(text_data=json.dumps({'ack': event['messages']}))
+
+    async def chat_nack(self, event):
+        await self.send(text_data=json.dumps({'nack': [item['uid'] for item in event['messages']]}))
+
     @database_sync_to_async
-    def check_authorization(self, booking_id, user):
-        try:
-            booking = Booking.objects.get(pk=booking_id)
-            return user == booking.customer or user == booking.barbershop.owner
-        except Booking.DoesNotExist:
-            return False
+    def load_participants(self, booking_id):
+        """العميل وصاحب المحل واسم المحل في استعلام واحد"""
+        return Booking.objects.filter(pk=booking_id).values(
+            'customer_id',
+            owner_id=F('barbershop__owner_id'),
+            barbershop_name=F('barbershop__name')
+        ).first()
+
+    def get_notification_recipient(self):
+        """(المستلم، عنوان الإشعار): الطرف الآخر في المحادثة"""
+        if self.user.pk == self.participants['customer_id']:
+            return (
+                self.participants['owner_id'],
+                f"رسالة جديدة من {self.user.get_full_name() or self.user.username}"
+            )
+        return (
+            self.participants['customer_id'],
+            f"رسالة جديدة من {self.participants['barbershop_name']}"
+        )
 
     @database_sync_to_async
-    def save_message(self, booking_id, sender, message):
-        booking = Booking.objects.get(pk=booking_id)
-        new_message = BookingMessage.objects.create(booking=booking, sender=sender, message=message)
-        
-        # إرسال إشعار للطرف الآخر
-        from notifications.utils import create_chat_notification
-        create_chat_notification(new_message)
-        
+    def mark_read(self, message_id):
+        # رقم الرسالة من العميل: يتم تجاهل القيم غير الصالحة
+        if message_id is not None:
+            try:
+                message_id = int(message_id)
+            except (TypeError, ValueError):
+                return
+            if message_id <= 0:
+                return
+        BookingReadState.mark_read(self.booking_id, self.user.pk, message_id)
+
+    @database_sync_to_async
+    def save_message(self, message):
+        """حفظ الرسالة وإشعار الطرف الآخر في معاملة قصيرة واحدة"""
+        recipient_id, title = self.get_notification_recipient()
+        with transaction.atomic():
+            # bulk_create بدون إشارة post_save: الإشعار يُنشأ هنا مرة واحدة
+            new_message = BookingMessage.objects.bulk_create([
+                BookingMessage(booking_id=self.booking_id, sender=self.user, message=message)
+            ])[0]
+            if recipient_id:
+                deliver_notifications(
+                    [build_chat_notification(new_message, recipient_id, title)],
+                    [chat_notification_key(new_message)]
+                )
         return new_message
 
 
@@ -97,6 +174,10 @@ class BarbershopTurnConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
+        # إرسال حالة الطابور فوراً (أو ما فات العميل منذ ?since=<آخر تسلسل>)
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        await self.send_update_since(query.get('since', [None])[0])
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -104,12 +185,28 @@ class BarbershopTurnConsumer(AsyncWebsocketConsumer):
         )
 
     async def receive(self, text_data):
-        # This consumer is for server push only, ignore client messages
-        pass
+        # The only client message is {"since": <last seen sequence>} after a reconnect
+        try:
+            since = json.loads(text_data).get('since')
+        except (ValueError, AttributeError):
+            return
+        await self.send_update_since(since)
+
+    async def send_update_since(self, since):
+        try:
+            since = int(since) if since is not None else None
+        except (TypeError, ValueError):
+            since = None
+        update = await self.get_update_since(since)
+        if update:
+            await self.send(text_data=json.dumps(update))
+
+    @database_sync_to_async
+    def get_update_since(self, since):
+        return get_turn_update_since(int(self.shop_id), since)
 
     async def booking_turn_update(self, event):
-        # Send the turn update to WebSocket
+        # Send the full queue snapshot (see bookings/broadcast_utils.py) to WebSocket
         await self.send(text_data=json.dumps({
-            'current_turn_number': event.get('current_turn_number'),
-            'finished_bookings_count': event.get('finished_bookings_count')
+            key: value for key, value in event.items() if key != 'type'
         }))
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from bookings.chat_utils import chat_write_behind_enabled
+from bookings.models import Booking, BookingMessage
+from bookings.routing import websocket_urlpatterns
+from notifications.models import Notification
+
+
+class Command(BaseCommand):
+    help = 'Measure chat throughput (messages per second) of one booking room through ChatConsumer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('booking_id', type=int, help='Booking whose chat room is used')
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=200,
+            help='Number of messages sent by the customer',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark messages and notifications instead of deleting them',
+        )
+
+    def handle(self, *args, **options):
+        booking = Booking.objects.select_related('customer', 'barbershop__owner').filter(
+            pk=options['booking_id']
+        ).first()
+        if booking is None or booking.customer is None:
+            raise CommandError('Booking not found or has no customer')
+
+        last_message_id = BookingMessage.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        last_notification_id = Notification.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        count = options['messages']
+        elapsed = asyncio.run(self.run_room(booking, count))
+
+        if not options['keep']:
+            BookingMessage.objects.filter(booking=booking, pk__gt=last_message_id).delete()
+            Notification.objects.filter(booking=booking, pk__gt=last_notification_id).delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{count} messages in {elapsed:.2f}s: {count / elapsed:.1f} messages/second in booking {booking.pk} room'
+            )
+        )
+
+    async def run_room(self, booking, count):
+        """
+        المرسل (العميل) والمستقبل (صاحب المحل) في نفس الغرفة؛ الزمن حتى وصول
+        آخر رسالة (وآخر تأكيد حفظ في وضع الحفظ المؤجل)
+        """
+        application = URLRouter(websocket_urlpatterns)
+        path = f'/ws/chat/{booking.pk}/'
+        sockets = []
+        for user in (booking.customer, booking.barbershop.owner):
+            communicator = WebsocketCommunicator(application, path)
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError(f'{user} could not join the booking chat')
+            sockets.append(communicator)
+        sender, receiver = sockets
+
+        start = time.perf_counter()
+        for i in range(count):
+            await sender.send_json_to({'message': f'benchmark {i}'})
+        for _ in range(count):
+            await receiver.receive_json_from(timeout=30)
+        if chat_write_behind_enabled():
+            # المحادثة لا تعتبر محفوظة إلا بعد وصول تأكيدات كل الرسائل للمرسل
+            acknowledged = 0
+            while acknowledged < count:
+                acknowledged += len((await sender.receive_json_from(timeout=30)).get('ack', []))
+        elapsed = time.perf_counter() - start
+
+        for communicator in sockets:
+            await communicator.disconnect()
+        return elapsed
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barbershops', '0010_rating_aggregates'),
+        ('bookings', '0008_queuecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceTimeEstimate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('average_minutes', models.FloatField(default=0, verbose_name='متوسط المدة الفعلية (دقائق)')),
+                ('sample_count', models.PositiveIntegerField(default=0, verbose_name='عدد العينات')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='آخر تحديث')),
+                ('barbershop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='service_time_estimates', to='barbershops.barbershop', verbose_name='محل الحلاقة')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_estimates', to='barbershops.service', verbose_name='الخدمة')),
+            ],
+            options={
+                'verbose_name': 'تقدير مدة الخدمة',
+                'verbose_name_plural': 'تقديرات مدد الخدمات',
+                'unique_together': {('barbershop', 'service')},
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Max, Q
 from django.contrib.auth import get_user_model
 from barbershops.models import Barbershop, Service
 from django.utils import timezone
@@ -6,6 +8,50 @@ from decimal import Decimal
 
 User = get_user_model()
 
+# مدة بقاء ملخص حالات الحجوزات في الكاش (بالثواني)
+STATUS_BREAKDOWN_CACHE_TIMEOUT = 30
+
+
+def status_breakdown_cache_key(barbershop_id, day):
+    return f'bookings:status_breakdown:{barbershop_id}:{day}'
+
+
+class BookingQuerySet(models.QuerySet):
+
+    def status_breakdown(self, barbershop=None, day=None, cache_timeout=None):
+        """
+        عدد الحجوزات لكل حالة في استعلام واحد (تجميع شرطي)
+
+        يُرجع قاموساً يحتوي على كل حالات STATUS_CHOICES بالإضافة إلى 'total'.
+        عند تمرير cache_timeout يتم تخزين النتيجة لكل (محل، يوم)، ويُستخدم
+        الكاش فقط عند الاستدعاء من المدير مباشرة مع تحديد المحل.
+        """
+        queryset = self
+        if barbershop is not None:
+            queryset = queryset.filter(barbershop=barbershop)
+        if day is not None:
+            queryset = queryset.filter(booking_day=day)
+
+        cache_key = None
+        if cache_timeout and barbershop is not None and not self.query.where:
+            cache_key = status_breakdown_cache_key(getattr(barbershop, 'pk', barbershop), day)
+            breakdown = cache.get(cache_key)
+            if breakdown is not None:
+                return breakdown
+
+        breakdown = queryset.order_by().aggregate(
+            total=Count('id'),
+            **{
+                status: Count('id', filter=Q(status=status))
+                for status, _ in Booking.STATUS_CHOICES
+            }
+        )
+
+        if cache_key:
+            cache.set(cache_key, breakdown, cache_timeout)
+        return breakdown
+
+
 class Booking(models.Model):
     STATUS_CHOICES = (
         ('pending', 'في الانتظار'),
@@ -75,6 +121,20 @@ class Booking(models.Model):
         decimal_places=2,
         verbose_name='السعر الإجمالي'
     )
+    # ملخص الخدمات المحجوزة - يتم حسابه عند حفظ الحجز حتى لا تقرأ القوائم BookingService
+    total_duration_minutes = models.PositiveIntegerField(
+        default=0,
+        verbose_name='إجمالي مدة الخدمات (دقائق)'
+    )
+    services_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='عدد الخدمات'
+    )
+    services_summary = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name='ملخص الخدمات'
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name='تاريخ الإنشاء'
@@ -84,10 +144,58 @@ class Booking(models.Model):
         verbose_name='تاريخ التحديث'
     )
 
+    objects = BookingQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'حجز'
         verbose_name_plural = 'الحجوزات'
         ordering = ['-booking_day', 'queue_number']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['barbershop', 'booking_day', 'queue_number'],
+                name='unique_queue_number_per_shop_day'
+            ),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # الحالة كما تم تحميلها (أو إنشاؤها) لتتبع تغييرها بدون استعلام إضافي
+        self._loaded_status = self.__dict__.get('status')
+        self._status_changed_by = None
+        self._status_change_notes = ''
+
+    @property
+    def previous_status(self):
+        """الحالة قبل التعديلات غير المحفوظة"""
+        return self._loaded_status
+
+    @property
+    def status_changed(self):
+        """هل تغيرت الحالة منذ التحميل أو آخر حفظ"""
+        if self._loaded_status is None or 'status' not in self.__dict__:
+            return False
+        return self.status != self._loaded_status
+
+    def change_status(self, new_status, changed_by=None, notes=''):
+        """
+        تغيير الحالة مع تسجيل من قام بالتغيير؛ عند الحفظ يتم إنشاء سجل
+        BookingHistory (bookings/signals.py) وإشعار العميل (notifications/signals.py)
+        """
+        self.status = new_status
+        self._status_changed_by = changed_by
+        self._status_change_notes = notes
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'status' in update_fields:
+            self._loaded_status = self.status
+            self._status_changed_by = None
+            self._status_change_notes = ''
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_status = self.__dict__.get('status', self._loaded_status)
 
     def __str__(self):
         if self.customer:
@@ -114,16 +222,17 @@ class Booking(models.Model):
             return False
         return self.booking_day > timezone.now().date()
 
-    def unread_messages(self):
-        """هل هناك رسائل غير مقروءة من الطرف الآخر"""
-        # تصفية الرسائل غير المقروءة من الطرف الآخر
-        if self.customer:
-            return self.messages.filter(
-                is_read=False
-            ).exclude(
-                sender=self.customer
-            ).exists()
-        return False
+    def unread_messages(self, user):
+        """
+        هل هناك رسائل غير مقروءة للمستخدم من الطرف الآخر
+
+        لصفحات القوائم استخدم bookings.chat_utils.unread_counts_for لكل
+        الحجوزات في استعلام واحد.
+        """
+        last_read = self.read_states.filter(user=user).values_list(
+            'last_read_message_id', flat=True
+        ).first() or 0
+        return self.messages.filter(pk__gt=last_read).exclude(sender=user).exists()
 
     def get_status_class(self):
         """إرجاع CSS class حسب حالة الحجز"""
@@ -156,6 +265,8 @@ class Booking(models.Model):
     
     def get_total_duration(self):
         """حساب إجمالي مدة الخدمات المحجوزة"""
+        if self.services_count:
+            return self.total_duration_minutes
         total_minutes = 0
         for booking_service in self.booking_services.all():
             total_minutes += booking_service.service.duration * booking_service.quantity
@@ -171,6 +282,29 @@ class Booking(models.Model):
                 services.append(booking_service.service.name)
         return services
 
+    @staticmethod
+    def summarize_services(services):
+        """
+        حساب (المدة الإجمالية، عدد الخدمات، ملخص الأسماء) من قائمة (الخدمة، الكمية)
+        """
+        total_minutes = 0
+        names = []
+        for service, quantity in services:
+            total_minutes += service.duration * quantity
+            names.append(f"{service.name} (x{quantity})" if quantity > 1 else service.name)
+        summary = '، '.join(names)
+        if len(summary) > 255:
+            summary = summary[:254] + '…'
+        return total_minutes, len(names), summary
+
+    def set_services_summary(self, services):
+        """تعبئة حقول ملخص الخدمات من قائمة (الخدمة، الكمية) بدون حفظ"""
+        (
+            self.total_duration_minutes,
+            self.services_count,
+            self.services_summary,
+        ) = self.summarize_services(services)
+
 class BookingService(models.Model):
     """نموذج وسيط لربط الحجوزات بالخدمات المتعددة"""
     booking = models.ForeignKey(
@@ -230,6 +364,123 @@ class BookingService(models.Model):
         super().save(*args, **kwargs)
 
 
+class QueueCounter(models.Model):
+    """عداد الأدوار اليومي لكل محل - صف واحد لكل (محل، يوم) يتم قفله وزيادته ذرياً"""
+    barbershop = models.ForeignKey(
+        Barbershop,
+        on_delete=models.CASCADE,
+        related_name='queue_counters',
+        verbose_name='محل الحلاقة'
+    )
+    day = models.DateField(verbose_name='اليوم')
+    last_number = models.PositiveIntegerField(
+        default=0,
+        verbose_name='آخر رقم دور تم إصداره'
+    )
+
+    class Meta:
+        verbose_name = 'عداد الأدوار'
+        verbose_name_plural = 'عدادات الأدوار'
+        unique_together = ['barbershop', 'day']
+
+    def __str__(self):
+        return f"{self.barbershop_id} - {self.day} - {self.last_number}"
+
+    @classmethod
+    def next_number(cls, barbershop, day):
+        """
+        حجز رقم الدور التالي للمحل في اليوم المحدد
+
+        يبدأ بعملية UPDATE حتى يحصل على قفل الكتابة قبل أي قراءة (قفل الصف في
+        PostgreSQL وقفل قاعدة البيانات في SQLite)، فلا يحصل طلبان متزامنان على
+        نفس الرقم. يجب استدعاؤه داخل نفس المعاملة التي تحفظ الحجز حتى لا تظهر
+        فجوات في الترقيم إذا فشل الحفظ.
+        """
+        counter = cls.objects.filter(barbershop=barbershop, day=day)
+
+        with transaction.atomic():
+            updated = counter.update(last_number=F('last_number') + 1)
+            if not updated:
+                # أول حجز لهذا اليوم: نبدأ من آخر دور موجود (للحجوزات السابقة للعداد)
+                existing_max = Booking.objects.filter(
+                    barbershop=barbershop,
+                    booking_day=day
+                ).aggregate(max_number=Max('queue_number'))['max_number'] or 0
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(
+                            barbershop=barbershop,
+                            day=day,
+                            last_number=existing_max + 1
+                        )
+                    return existing_max + 1
+                except IntegrityError:
+                    # طلب آخر أنشأ العداد في نفس اللحظة
+                    counter.update(last_number=F('last_number') + 1)
+
+            return counter.values_list('last_number', flat=True).get()
+
+
+class ServiceTimeEstimate(models.Model):
+    """
+    متوسط متحرك لمدة تنفيذ الخدمة الفعلية في المحل (بالدقائق)
+
+    يتم تحديثه تدريجياً من انتقال الحجز من "مؤكد" إلى "مكتمل" بدلاً من إعادة
+    حسابه من كامل التاريخ، ويُستخدم لتوقع وقت الانتظار في الطابور.
+    """
+    # عدد العينات الذي يصبح بعده المتوسط متحركاً بوزن ثابت (1 / ESTIMATE_WINDOW)
+    ESTIMATE_WINDOW = 20
+
+    barbershop = models.ForeignKey(
+        Barbershop,
+        on_delete=models.CASCADE,
+        related_name='service_time_estimates',
+        verbose_name='محل الحلاقة'
+    )
+    service = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        related_name='time_estimates',
+        verbose_name='الخدمة'
+    )
+    average_minutes = models.FloatField(
+        default=0,
+        verbose_name='متوسط المدة الفعلية (دقائق)'
+    )
+    sample_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='عدد العينات'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='آخر تحديث'
+    )
+
+    class Meta:
+        verbose_name = 'تقدير مدة الخدمة'
+        verbose_name_plural = 'تقديرات مدد الخدمات'
+        unique_together = ['barbershop', 'service']
+
+    def __str__(self):
+        return f"{self.barbershop_id} - {self.service_id} - {self.average_minutes:.1f}"
+
+    @classmethod
+    def record_sample(cls, barbershop_id, service_id, minutes):
+        """إضافة مدة فعلية جديدة إلى المتوسط المتحرك للخدمة"""
+        with transaction.atomic():
+            estimate, created = cls.objects.select_for_update().get_or_create(
+                barbershop_id=barbershop_id,
+                service_id=service_id,
+                defaults={'average_minutes': minutes, 'sample_count': 1}
+            )
+            if not created:
+                weight = 1 / min(estimate.sample_count + 1, cls.ESTIMATE_WINDOW)
+                estimate.average_minutes += weight * (minutes - estimate.average_minutes)
+                estimate.sample_count += 1
+                estimate.save(update_fields=['average_minutes', 'sample_count', 'updated_at'])
+        return estimate
+
+
 class BookingHistory(models.Model):
     booking = models.ForeignKey(
         Booking,
@@ -285,21 +536,87 @@ class BookingMessage(models.Model):
         verbose_name='المرسل'
     )
     message = models.TextField(verbose_name='الرسالة')
-    is_read = models.BooleanField(default=False, verbose_name='تم قرائتها')
+    # حالة القراءة لكل طرف في BookingReadState
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='وقت الإرسال')
     
     class Meta:
         verbose_name = 'رسالة حجز'
         verbose_name_plural = 'رسائل الحجوزات'
         ordering = ['created_at']
+        indexes = [
+            # سجل المحادثة يُقرأ بصفحات حسب (الحجز، رقم الرسالة)
+            models.Index(fields=['booking', 'id'], name='bookings_message_page_idx'),
+        ]
     
     def __str__(self):
         return f'{self.sender.username}: {self.message[:50]}'
 
-    @property
-    def is_unread(self):
-        """هل الرسالة غير مقروءة"""
-        return not self.is_read
+
+class BookingReadState(models.Model):
+    """
+    آخر رسالة قرأها أحد طرفي المحادثة في الحجز
+
+    كل رسالة من الطرف الآخر رقمها أكبر من last_read_message_id غير مقروءة،
+    فتحديد المحادثة كمقروءة تحديث صف واحد بدلاً من تحديث كل رسالة.
+    """
+    booking = models.ForeignKey(
+        Booking,
+        on_delete=models.CASCADE,
+        related_name='read_states',
+        verbose_name='الحجز'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='booking_read_states',
+        verbose_name='المستخدم'
+    )
+    last_read_message_id = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='آخر رسالة مقروءة'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='آخر تحديث'
+    )
+
+    class Meta:
+        verbose_name = 'حالة قراءة المحادثة'
+        verbose_name_plural = 'حالات قراءة المحادثات'
+        unique_together = ['booking', 'user']
+
+    def __str__(self):
+        return f"{self.booking_id} - {self.user_id} - {self.last_read_message_id}"
+
+    @classmethod
+    def mark_read(cls, booking_id, user_id, message_id=None):
+        """
+        تحديد المحادثة كمقروءة حتى message_id (أو آخر رسالة فيها) بإدراج أو
+        تحديث صف واحد
+
+        التحديث شرطي (last_read_message_id أقل من الرقم الجديد)، فلا ترجع آخر
+        رسالة مقروءة للخلف إذا وصل تأكيد قراءة قديم بعد تأكيد أحدث منه.
+        """
+        if message_id is None:
+            message_id = BookingMessage.objects.filter(
+                booking_id=booking_id
+            ).aggregate(last=Max('pk'))['last']
+            if message_id is None:
+                return
+        behind = cls.objects.filter(
+            booking_id=booking_id,
+            user_id=user_id,
+            last_read_message_id__lt=message_id
+        )
+
+        if behind.update(last_read_message_id=message_id, updated_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(booking_id=booking_id, user_id=user_id, last_read_message_id=message_id)
+        except IntegrityError:
+            # الصف موجود برقم أحدث، أو أنشأه طلب آخر في نفس اللحظة برقم أقدم
+            behind.update(last_read_message_id=message_id, updated_at=timezone.now())
 
 
 
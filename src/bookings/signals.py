@@ -0,0 +1,71 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .availability_utils import booked_durations_cache_key
+from .models import Booking, BookingHistory, BookingService, status_breakdown_cache_key
+from .broadcast_utils import broadcast_turn_update
+from .wait_time_utils import learn_from_completion
+
+
+def invalidate_day_caches(barbershop_id, day):
+    """حذف البيانات المخزنة لحجوزات (محل، يوم) بعد نجاح المعاملة الحالية"""
+    cache_keys = [
+        status_breakdown_cache_key(barbershop_id, day),
+        booked_durations_cache_key(barbershop_id, day),
+    ]
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_booking_day_caches(sender, instance, **kwargs):
+    """حذف ملخص الحالات ومدد حجوزات اليوم بعد أي تغيير على حجز"""
+    invalidate_day_caches(instance.barbershop_id, instance.booking_day)
+
+
+@receiver(post_save, sender=Booking)
+def broadcast_new_booking(sender, instance, created, **kwargs):
+    """الحجز الجديد يغير عدد المنتظرين وأوقات الانتظار في طابور المحل"""
+    if created:
+        broadcast_turn_update(instance.barbershop_id)
+
+
+@receiver(post_save, sender=Booking)
+def record_status_history(sender, instance, created, **kwargs):
+    """إنشاء سجل BookingHistory للحالة التي تم تغييرها عبر change_status"""
+    if created or not instance.status_changed or instance._status_changed_by is None:
+        return
+    BookingHistory.objects.create(
+        booking=instance,
+        old_status=instance.previous_status,
+        new_status=instance.status,
+        changed_by=instance._status_changed_by,
+        notes=instance._status_change_notes
+    )
+
+
+@receiver(post_save, sender=BookingService)
+@receiver(post_delete, sender=BookingService)
+def invalidate_booking_service_day_caches(sender, instance, **kwargs):
+    """تغيير خدمات الحجز يغير مدته في طابور اليوم"""
+    if BookingService.booking.is_cached(instance):
+        booking = instance.booking
+        invalidate_day_caches(booking.barbershop_id, booking.booking_day)
+        return
+
+    booking = Booking.objects.filter(pk=instance.booking_id).values('barbershop_id', 'booking_day').first()
+    if booking:
+        invalidate_day_caches(booking['barbershop_id'], booking['booking_day'])
+
+
+@receiver(post_save, sender=BookingHistory)
+def update_wait_times_on_status_change(sender, instance, created, **kwargs):
+    """
+    تعلم مدة الخدمة عند إكمال الحجز وإرسال الحالة الجديدة لطابور المحل
+    """
+    if not created:
+        return
+    if instance.new_status == 'completed':
+        learn_from_completion(instance)
+    broadcast_turn_update(instance.booking.barbershop_id)
@@ -3,17 +3,26 @@ from django.views.generic import View, ListView, DetailView, CreateView, UpdateV
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.urls import reverse_lazy, reverse
+from django.core.exceptions import PermissionDenied
 from django.utils import timezone
-from django.db.models import Q
-from .models import Booking, BookingHistory, BookingMessage
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils.dateparse import parse_date
+from .models import Booking, BookingHistory, BookingMessage, STATUS_BREAKDOWN_CACHE_TIMEOUT
+from .availability_utils import ACTIVE_BOOKING_STATUSES, get_availability
+from .wait_time_utils import estimate_wait_times
+from .chat_utils import (
+    CHAT_HISTORY_MAX_PAGE_SIZE, CHAT_HISTORY_PAGE_SIZE, get_chat_history, serialize_chat_message, unread_counts_for
+)
+from .transition_utils import TransitionError, TurnConflictError, apply_bulk_transition, apply_transition, call_next_turn
 from .forms import BookingForm, BookingStatusForm, BookingSearchForm, BookingMessageForm
 from barbershops.models import Barbershop, Service
 from django.contrib.auth.decorators import login_required
 from django.http import Http404, JsonResponse
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from notifications.utils import create_booking_notification, create_chat_notification
+from notifications.utils import create_chat_notification, mark_booking_messages_as_read
 import logging
+from collections import OrderedDict
+from itertools import groupby
+from operator import attrgetter
 
 logger = logging.getLogger(__name__)
 
@@ -46,16 +55,27 @@ class MerchantBookingListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
         self.barbershop = get_object_or_404(Barbershop, pk=self.kwargs['barbershop_id'])
         return self.barbershop.owner == self.request.user
 
+    # عدد الأيام المعروضة في كل صفحة
+    days_per_page = 7
+
     def get_queryset(self):
         # جلب الحجوزات للمحل المحدد فقط مرتبة من الأحدث للأقدم
         return Booking.objects.filter(
-            barbershop=self.barbershop
+            barbershop=self.barbershop,
+            booking_day__isnull=False
         ).select_related(
             'service', 'customer', 'barbershop'
-        ).prefetch_related(
-            'booking_services__service',
-            'messages__sender'
-        ).order_by('-created_at')
+        ).order_by('-booking_day', '-created_at')
+
+    def get_before_day(self):
+        """قراءة مؤشر الصفحة ?before=<YYYY-MM-DD> (الأيام الأقدم من هذا اليوم)"""
+        before = self.request.GET.get('before')
+        if not before:
+            return None
+        try:
+            return parse_date(before)
+        except ValueError:
+            return None
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -68,36 +88,48 @@ class MerchantBookingListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
         # استخدام رقم الدور المحفوظ مباشرة من المحل
         context['current_turn_number'] = self.barbershop.current_turn_number
 
-        # جلب جميع الحجوزات مرتبة من الأحدث للأقدم
-        all_bookings = self.get_queryset()
-        
-        # تجميع الحجوزات حسب التاريخ
-        from collections import OrderedDict
+        bookings = self.get_queryset()
+        before_day = self.get_before_day()
+        if before_day:
+            bookings = bookings.filter(booking_day__lt=before_day)
+
+        # أيام الصفحة الحالية (مع يوم إضافي لمعرفة وجود صفحة تالية)
+        days = list(
+            bookings.order_by('-booking_day')
+            .values_list('booking_day', flat=True)
+            .distinct()[:self.days_per_page + 1]
+        )
+        has_older_days = len(days) > self.days_per_page
+        days = days[:self.days_per_page]
+
+        # تجميع حجوزات هذه الأيام فقط؛ الترتيب يتم في قاعدة البيانات
         bookings_by_date = OrderedDict()
+        for date, day_bookings in groupby(
+            bookings.filter(booking_day__in=days),
+            key=attrgetter('booking_day')
+        ):
+            bookings_by_date[date] = list(day_bookings)
+
+        # الرسائل غير المقروءة لكل حجوزات الصفحة في استعلام واحد
+        page_bookings = [booking for day_bookings in bookings_by_date.values() for booking in day_bookings]
+        unread_counts = unread_counts_for(page_bookings, self.request.user)
+        for booking in page_bookings:
+            booking.unread_count = unread_counts.get(booking.pk, 0)
+        
+        context['bookings_by_date'] = bookings_by_date
+        context['before_day'] = before_day
+        context['next_before_day'] = days[-1] if has_older_days else None
+        # هل تغطي أيام الصفحة اليوم الحالي (لتنبيه الصفحة بحجوزات اليوم الجديدة)
+        context['shows_today'] = (
+            (not has_older_days or days[-1] <= today)
+            and (before_day is None or today < before_day)
+        )
         
-        for booking in all_bookings:
-            booking_date = booking.booking_day
-            if booking_date not in bookings_by_date:
-                bookings_by_date[booking_date] = []
-            bookings_by_date[booking_date].append(booking)
-        
-        # ترتيب التواريخ من الأحدث للأقدم وترتيب الحجوزات داخل كل يوم
-        sorted_bookings_by_date = OrderedDict()
-        for date in sorted(bookings_by_date.keys(), reverse=True):
-            # ترتيب الحجوزات داخل كل يوم: الأحدث أولاً
-            sorted_bookings_by_date[date] = sorted(
-                bookings_by_date[date], 
-                key=lambda x: x.created_at, 
-                reverse=True
-            )
-        
-        context['bookings_by_date'] = sorted_bookings_by_date
-        
-        # حجوزات اليوم للإحصائيات
-        todays_bookings = all_bookings.filter(booking_day=today)
-        context['finished_bookings_count'] = todays_bookings.filter(
-            status__in=['completed', 'no_show']
-        ).count()
+        # إحصائيات حجوزات اليوم في استعلام واحد
+        todays_stats = Booking.objects.status_breakdown(
+            self.barbershop, today, cache_timeout=STATUS_BREAKDOWN_CACHE_TIMEOUT
+        )
+        context['finished_bookings_count'] = todays_stats['completed'] + todays_stats['no_show']
         
         # إزالة المفتاح غير الضروري
         if 'bookings' in context:
@@ -118,42 +150,51 @@ class CustomerBookingListView(LoginRequiredMixin, ListView):
             customer=self.request.user
         ).select_related(
             'barbershop', 'barbershop__owner', 'service'
-        ).prefetch_related(
-            'booking_services__service'
         ).order_by('-booking_day', '-created_at')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         today = timezone.now().date()
         
-        all_user_bookings = self.get_queryset()
-
-        # Get all barbershops where the user has any booking (not just today)
-        user_shops = Barbershop.objects.filter(
-            bookings__in=all_user_bookings
-        ).distinct()
-        
-        current_turns_info = []
-        for shop in user_shops:
-            # Get today's confirmed bookings only
-            confirmed_today = Booking.objects.filter(
-                barbershop=shop,
-                booking_day=today,
-                status='confirmed'
-            ).order_by('queue_number')
-            
-            # Get the highest turn number from today's confirmed bookings
-            current_turn = confirmed_today.last()
-            current_turn_number = current_turn.queue_number if current_turn else None
-            
-            # أضف shop_id دائماً حتى لو لم يوجد دور حالي
-            current_turns_info.append({
-                'shop_name': shop.name,
-                'shop_id': shop.id,
-                'turn_number': current_turn_number
-            })
+        # أعلى دور مؤكد اليوم لكل محل حجز فيه المستخدم، في استعلام واحد
+        todays_confirmed_turn = Booking.objects.filter(
+            barbershop=OuterRef('pk'),
+            booking_day=today,
+            status='confirmed'
+        ).order_by('-queue_number').values('queue_number')[:1]
+
+        # أضف shop_id دائماً حتى لو لم يوجد دور حالي
+        current_turns_info = list(
+            Barbershop.objects.filter(
+                pk__in=Booking.objects.filter(
+                    customer=self.request.user
+                ).values('barbershop')
+            ).annotate(
+                shop_id=F('pk'),
+                shop_name=F('name'),
+                turn_number=Subquery(todays_confirmed_turn)
+            ).values('shop_name', 'shop_id', 'turn_number')
+        )
 
         context['current_turns_info'] = current_turns_info
+
+        # وقت الانتظار المتوقع لحجوزات اليوم النشطة في الصفحة الحالية
+        active_today = [
+            booking for booking in context['bookings']
+            if booking.booking_day == today and booking.status in ACTIVE_BOOKING_STATUSES
+        ]
+        wait_times = {}
+        for barbershop_id in {booking.barbershop_id for booking in active_today}:
+            for item in estimate_wait_times(barbershop_id, today):
+                wait_times[item['booking_id']] = item
+        for booking in active_today:
+            booking.wait_estimate = wait_times.get(booking.id)
+
+        # الرسائل غير المقروءة لكل حجوزات الصفحة في استعلام واحد
+        unread_counts = unread_counts_for(context['bookings'], self.request.user)
+        for booking in context['bookings']:
+            booking.unread_count = unread_counts.get(booking.pk, 0)
+
         return context
 
 class BookingDetailView(LoginRequiredMixin, DetailView):
@@ -219,17 +260,10 @@ class BookingCreateView(LoginRequiredMixin, CreateView):
             
             logger.info(f"الخدمات المختارة: {[s.name for s in selected_services]}")
             
+            # إشعار الحجز الجديد يتم إنشاؤه مرة واحدة من post_save (notifications/signals.py)
             self.object = form.save()
             logger.info(f"تم إنشاء الحجز بنجاح - ID: {self.object.id}")
             
-            # إنشاء إشعار للحجز الجديد
-            try:
-                create_booking_notification(self.object, 'new_booking')
-                logger.info("تم إنشاء الإشعار بنجاح")
-            except Exception as e:
-                # تسجيل الخطأ لكن لا نفشل إنشاء الحجز
-                logger.warning(f"خطأ في إنشاء الإشعار: {e}")
-            
             messages.success(self.request, 'تم إنشاء حجزك بنجاح!')
             return redirect(self.get_success_url())
             
@@ -265,42 +299,19 @@ class BookingCreateView(LoginRequiredMixin, CreateView):
 
 @login_required
 def get_available_slots(request, barbershop_id):
-    date = request.GET.get('date')
+    """المواعيد المتاحة لخدمة في يوم معين: ?date=YYYY-MM-DD&service_id=<id>"""
+    barbershop = get_object_or_404(Barbershop, id=barbershop_id)
     service_id = request.GET.get('service_id')
-    available_slots = []
+    try:
+        day = parse_date(request.GET.get('date') or '')
+    except ValueError:
+        day = None
 
-    if date and service_id:
-        barbershop = get_object_or_404(Barbershop, id=barbershop_id)
-        service = get_object_or_404(Service, id=service_id)
-        from datetime import datetime, time
+    if not day or not service_id:
+        return JsonResponse({'slots': []})
 
-        day_of_week = datetime.strptime(date, '%Y-%m-%d').strftime('%A').lower()
-        work_hour = barbershop.work_hours.filter(day_of_week=day_of_week[:3]).first()
-
-        if work_hour:
-            start = datetime.combine(datetime.strptime(date, '%Y-%m-%d'), work_hour.start_time)
-            end = datetime.combine(datetime.strptime(date, '%Y-%m-%d'), work_hour.end_time)
-            service_duration_minutes = service.duration
-
-            existing_bookings = Booking.objects.filter(
-                barbershop=barbershop,
-                start_time__date=start.date(),
-                status='confirmed'
-            )
-
-            current_time = start
-            while (current_time + timezone.timedelta(minutes=service_duration_minutes)) <= end:
-                is_booked = any(
-                    (b.start_time < (current_time + timezone.timedelta(minutes=service_duration_minutes)) and b.end_time > current_time)
-                    for b in existing_bookings
-                )
-
-                if not is_booked:
-                    available_slots.append(current_time.strftime('%H:%M'))
-                
-                current_time += timezone.timedelta(minutes=30)
-
-    return JsonResponse({'slots': available_slots})
+    service = get_object_or_404(Service, id=service_id, barbershop=barbershop)
+    return JsonResponse(get_availability(barbershop, day, service, now=timezone.localtime()))
 
 
 @login_required
@@ -341,28 +352,160 @@ class BookingUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         booking = self.get_object()
         return self.request.user == booking.customer
 
-class BookingCancelView(LoginRequiredMixin, UserPassesTestMixin, View):
+class TransitionResponseMixin:
+    """
+    ردود طلبات تغيير حالة الحجوزات: JSON لطلبات AJAX، ورسالة مع إعادة توجيه لغيرها
+
+    PermissionDenied ترجع 403 لطلبات AJAX وإلا تُرفع كما هي، وTransitionError
+    ترجع 409 عند تعارض الدور و400 لغير ذلك.
+    """
+
+    def is_ajax(self):
+        return self.request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+    def get_error_redirect_url(self):
+        return self.get_redirect_url()
+
+    def error_response(self, error):
+        if self.is_ajax():
+            if isinstance(error, PermissionDenied):
+                status = 403
+            elif isinstance(error, TurnConflictError):
+                status = 409
+            else:
+                status = 400
+            return JsonResponse({'status': 'error', 'message': str(error)}, status=status)
+        if isinstance(error, PermissionDenied):
+            raise error
+        messages.error(self.request, str(error))
+        return redirect(self.get_error_redirect_url())
+
+    def success_response(self, message, redirect_url, data=None, level=messages.SUCCESS):
+        if self.is_ajax():
+            return JsonResponse({'status': 'success', 'message': message, **(data or {})})
+        messages.add_message(self.request, level, message)
+        return redirect(redirect_url)
+
+
+class BookingTransitionView(LoginRequiredMixin, TransitionResponseMixin, View):
+    """
+    تنفيذ انتقال حالة الحجز بضغطة زر واحدة عبر apply_transition
+
+    التحقق من الصلاحية والحالة يتم داخل المعاملة على الحجز المقفل، بدون تحميل
+    الحجز مرة أخرى في test_func.
+    """
+    action = None
+    success_message = ''
+
+    def get_redirect_url(self, barbershop_id):
+        return reverse('bookings:merchant_list', kwargs={'barbershop_id': barbershop_id})
+
+    def get_error_redirect_url(self):
+        barbershop_id = Booking.objects.filter(pk=self.kwargs['pk']).values_list('barbershop_id', flat=True).first()
+        return self.get_redirect_url(barbershop_id)
+
     def post(self, request, *args, **kwargs):
-        booking = self.get_object()
-        booking.status = 'cancelled'
-        booking.save()
-        
-        # إنشاء إشعار إلغاء الحجز
         try:
-            create_booking_notification(booking, 'booking_cancelled')
-        except Exception as e:
-            print(f"Error creating cancellation notification: {e}")
-        
-        messages.success(request, 'تم إلغاء الحجز بنجاح.')
-        return redirect('bookings:list')
+            booking = apply_transition(self.kwargs['pk'], self.action, request.user)
+        except Booking.DoesNotExist:
+            raise Http404('الحجز غير موجود')
+        except (PermissionDenied, TransitionError) as e:
+            return self.error_response(e)
+
+        return self.success_response(
+            self.success_message,
+            self.get_redirect_url(booking.barbershop_id),
+            {
+                'booking_id': booking.id,
+                'new_status_label': booking.get_status_display(),
+                'new_status_class': booking.get_status_class(),
+                'current_turn_number': booking.barbershop.current_turn_number
+            }
+        )
 
-    def get_object(self, queryset=None):
-        pk = self.kwargs.get('pk')
-        return get_object_or_404(Booking, pk=pk)
 
-    def test_func(self):
-        booking = self.get_object()
-        return self.request.user == booking.customer
+class BookingCancelView(BookingTransitionView):
+    """إلغاء الحجز من قبل العميل"""
+    action = 'cancel'
+    success_message = 'تم إلغاء الحجز بنجاح.'
+
+    def get_redirect_url(self, barbershop_id):
+        return reverse('bookings:list')
+
+
+class BookingBulkStatusView(LoginRequiredMixin, TransitionResponseMixin, View):
+    """
+    تحديث حالة عدة حجوزات في المحل دفعة واحدة (تأكيد/إكمال/لم يحضر/رفض)
+
+    يستقبل booking_ids (مكرر) و status، ويتخطى الحجوزات التي لا يسمح
+    انتقالها من حالتها الحالية.
+    """
+
+    def get_redirect_url(self):
+        return reverse('bookings:merchant_list', kwargs={'barbershop_id': self.kwargs['barbershop_id']})
+
+    def post(self, request, *args, **kwargs):
+        barbershop = get_object_or_404(Barbershop, pk=self.kwargs['barbershop_id'])
+
+        try:
+            booking_ids = [int(pk) for pk in request.POST.getlist('booking_ids')]
+        except ValueError:
+            booking_ids = []
+        if not booking_ids:
+            return self.error_response(TransitionError('يرجى اختيار حجز واحد على الأقل.'))
+
+        try:
+            bookings, skipped = apply_bulk_transition(
+                barbershop, booking_ids, request.POST.get('status'), request.user
+            )
+        except (PermissionDenied, TransitionError) as e:
+            return self.error_response(e)
+
+        message = f'تم تحديث {len(bookings)} حجز.'
+        if skipped:
+            message += f' تم تخطي {len(skipped)} حجز لا يمكن تحديث حالته.'
+
+        return self.success_response(
+            message,
+            self.get_redirect_url(),
+            {
+                'updated': [booking.id for booking in bookings],
+                'skipped': skipped,
+                'current_turn_number': barbershop.current_turn_number
+            },
+            level=messages.SUCCESS if bookings else messages.WARNING
+        )
+
+
+class BookingCallNextView(LoginRequiredMixin, TransitionResponseMixin, View):
+    """استدعاء الدور التالي: إكمال الحجز الحالي وتأكيد أول حجز في الانتظار"""
+
+    def get_redirect_url(self):
+        return reverse('bookings:merchant_list', kwargs={'barbershop_id': self.kwargs['barbershop_id']})
+
+    def post(self, request, *args, **kwargs):
+        barbershop = get_object_or_404(Barbershop, pk=self.kwargs['barbershop_id'])
+
+        # رقم الدور الذي رآه الحلاق في الصفحة حتى لا يتم تخطي عميل إذا تقدم الدور من جهاز آخر
+        try:
+            expected_turn_number = int(request.POST['current_turn_number'])
+        except (KeyError, ValueError):
+            expected_turn_number = None
+
+        try:
+            previous, called = call_next_turn(barbershop, request.user, expected_turn_number)
+        except (PermissionDenied, TransitionError) as e:
+            return self.error_response(e)
+
+        return self.success_response(
+            f'تم استدعاء الدور رقم {called.queue_number}.',
+            self.get_redirect_url(),
+            {
+                'completed_booking_id': previous.id if previous else None,
+                'booking_id': called.id,
+                'current_turn_number': barbershop.current_turn_number
+            }
+        )
 
 
 class BookingDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
@@ -412,6 +555,11 @@ class BookingUpdateStatusView(LoginRequiredMixin, UserPassesTestMixin, UpdateVie
         return self.request.user == booking.barbershop.owner
 
     def form_valid(self, form):
+        form.instance.change_status(
+            form.instance.status,
+            self.request.user,
+            'تم تحديث الحالة بواسطة صاحب المحل.'
+        )
         messages.success(self.request, 'Booking status updated successfully.')
         return super().form_valid(form)
 
@@ -426,7 +574,7 @@ class BookingSearchView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         queryset = Booking.objects.filter(
             barbershop__owner=self.request.user
-        ).select_related('customer', 'barbershop', 'service').order_by('-created_at')
+        ).select_related('customer', 'barbershop').order_by('-created_at')
         
         form = BookingSearchForm(self.request.GET, user=self.request.user)
         
@@ -481,21 +629,19 @@ class TodayBookingsView(LoginRequiredMixin, ListView):
             barbershop__owner=self.request.user,
             booking_day=timezone.now().date()
         ).select_related(
-            'customer', 'barbershop', 'service'
-        ).prefetch_related(
-            'booking_services__service'
+            'customer', 'barbershop'
         ).order_by('queue_number')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['today'] = timezone.now().date()
         
-        # تجميع الحجوزات حسب الحالة
-        bookings = self.get_queryset()
-        context['pending_count'] = bookings.filter(status='pending').count()
-        context['confirmed_count'] = bookings.filter(status='confirmed').count()
-        context['completed_count'] = bookings.filter(status='completed').count()
-        context['cancelled_count'] = bookings.filter(status='cancelled').count()
+        # تجميع الحجوزات حسب الحالة في استعلام واحد
+        breakdown = self.object_list.status_breakdown()
+        context['pending_count'] = breakdown['pending']
+        context['confirmed_count'] = breakdown['confirmed']
+        context['completed_count'] = breakdown['completed']
+        context['cancelled_count'] = breakdown['cancelled']
         
         return context
 
@@ -506,16 +652,20 @@ class BookingChatView(LoginRequiredMixin, View):
 
     def dispatch(self, request, *args, **kwargs):
         # Centralized security check
-        self.booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        if not (request.user == self.booking.customer or request.user == self.booking.barbershop.owner):
+        self.booking = get_object_or_404(Booking.objects.select_related('barbershop'), pk=self.kwargs['pk'])
+        if request.user.pk not in (self.booking.customer_id, self.booking.barbershop.owner_id):
             raise Http404
         return super().dispatch(request, *args, **kwargs)
 
     def get(self, request, *args, **kwargs):
-        chat_messages = BookingMessage.objects.filter(booking=self.booking).order_by('created_at')
+        # آخر صفحة فقط؛ الرسائل الأقدم تُجلب من BookingChatHistoryView
+        chat_messages, has_older = get_chat_history(self.booking.pk)
+        if chat_messages:
+            mark_booking_messages_as_read(self.booking, request.user, chat_messages[-1].pk)
         context = {
             'booking': self.booking,
-            'chat_messages': chat_messages
+            'chat_messages': chat_messages,
+            'has_older': has_older,
         }
         return render(request, self.template_name, context)
 
@@ -533,39 +683,41 @@ class BookingChatView(LoginRequiredMixin, View):
 
         return redirect('bookings:booking_chat', pk=self.booking.pk)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['messages'] = BookingMessage.objects.filter(booking=self.object).order_by('timestamp')
-        context['message_form'] = BookingMessageForm()
-        return context
-        """السماح للعميل وصاحب المحل بالوصول للمحادثة"""
-        return Booking.objects.filter(
-            Q(customer=self.request.user) | Q(barbershop__owner=self.request.user)
-        )
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        
-        # جلب الرسائل
-        chat_messages = BookingMessage.objects.filter(
-            booking=self.object
-        ).select_related('sender').order_by('created_at')
-        
-        context['chat_messages'] = chat_messages
-        context['message_form'] = BookingMessageForm()
-        
-        # تحديد هوية المستخدم
-        context['is_barber'] = (
-            self.request.user == self.object.barbershop.owner
+
+class BookingChatHistoryView(BookingChatView):
+    """
+    صفحات سجل المحادثة بصيغة JSON
+
+    ?before_id=<id> للرسائل الأقدم، ?after_id=<id> للرسائل الجديدة منذ آخر
+    رسالة لدى العميل، وبدونهما آخر صفحة. limit اختياري (بحد أقصى
+    CHAT_HISTORY_MAX_PAGE_SIZE).
+    """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        try:
+            before_id, after_id = (
+                int(request.GET[name]) if request.GET.get(name) else None
+                for name in ('before_id', 'after_id')
+            )
+            limit = int(request.GET.get('limit') or CHAT_HISTORY_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'معاملات غير صالحة'}, status=400)
+        if before_id is not None and after_id is not None:
+            return JsonResponse(
+                {'status': 'error', 'message': 'لا يمكن استخدام before_id و after_id معاً'}, status=400
+            )
+
+        chat_messages, has_more = get_chat_history(
+            self.booking.pk,
+            before_id=before_id,
+            after_id=after_id,
+            limit=min(max(limit, 1), CHAT_HISTORY_MAX_PAGE_SIZE)
         )
-        
-        # تحديث حالة قراءة الرسائل
-        unread_messages = chat_messages.filter(
-            is_read=False
-        ).exclude(sender=self.request.user)
-        unread_messages.update(is_read=True)
-        
-        return context
+        return JsonResponse({
+            'messages': [serialize_chat_message(message) for message in chat_messages],
+            'has_more': has_more,
+        })
 
 
 class BookingSendMessageView(LoginRequiredMixin, CreateView):
@@ -596,190 +748,25 @@ class BookingSendMessageView(LoginRequiredMixin, CreateView):
         return reverse_lazy('bookings:chat', kwargs={'pk': booking.pk})
 
 
-class BookingConfirmView(LoginRequiredMixin, UserPassesTestMixin, View):
+class BookingConfirmView(BookingTransitionView):
     """تأكيد الحجز من قبل صاحب المحل بضغطة زر واحدة."""
-
-    def post(self, request, *args, **kwargs):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        barbershop = booking.barbershop
-
-        # التحقق من الصلاحية والحالة
-        if barbershop.owner != self.request.user:
-            message = 'ليس لديك صلاحية لتنفيذ هذا الإجراء.'
-            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-                return JsonResponse({'status': 'error', 'message': message}, status=403)
-            messages.error(request, message)
-            return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-        if booking.status != 'pending':
-            message = 'لا يمكن تأكيد هذا الحجز لأنه ليس في حالة الانتظار.'
-            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-                return JsonResponse({'status': 'error', 'message': message}, status=400)
-            messages.error(request, message)
-            return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-        # تحديث الحالة والحقل الجديد في المحل
-        old_status = booking.status
-        booking.status = 'confirmed'
-        booking.save()
-
-        # تحديث رقم الدور الحالي في المحل نفسه
-        barbershop.current_turn_number = booking.queue_number
-        barbershop.save(update_fields=['current_turn_number'])
-
-        # إنشاء سجل للتاريخ
-        BookingHistory.objects.create(
-            booking=booking,
-            old_status=old_status,
-            new_status='confirmed',
-            changed_by=self.request.user,
-            notes='تم تأكيد الحجز بواسطة صاحب المحل.'
-        )
-
-        # إرسال إشعار WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'barbershop_{barbershop.id}',
-            {
-                'type': 'booking_turn_update',
-                'booking_id': booking.id,
-                'status': booking.get_status_display(),
-                'status_class': booking.get_status_class(),
-                'current_turn_number': barbershop.current_turn_number,
-            }
-        )
-
-        # إرسال رسالة للعميل (اختياري)
-        BookingMessage.objects.create(
-            booking=booking,
-            sender=self.request.user,
-            message='تهانينا! تم تأكيد حجزك.'
-        )
-        
-        # إنشاء إشعار تأكيد الحجز
-        try:
-            create_booking_notification(booking, 'booking_confirmed')
-        except Exception as e:
-            print(f"Error creating confirmation notification: {e}")
-
-        message = 'تم تأكيد الحجز بنجاح.'
-        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            return JsonResponse({
-                'status': 'success',
-                'message': message,
-                'booking_id': booking.id,
-                'new_status_label': booking.get_status_display(),
-                'new_status_class': booking.get_status_class(),
-                'current_turn_number': barbershop.current_turn_number
-            })
-
-        messages.success(request, message)
-        return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-    def test_func(self):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        return booking.barbershop.owner == self.request.user
+    action = 'confirm'
+    success_message = 'تم تأكيد الحجز بنجاح.'
 
 
-class BookingCompletedView(LoginRequiredMixin, UserPassesTestMixin, View):
+class BookingCompletedView(BookingTransitionView):
     """تحديث حالة الحجز إلى 'مكتمل' مباشرة."""
+    action = 'complete'
+    success_message = 'تم تحديث حالة الحجز إلى "مكتمل" بنجاح.'
 
-    def post(self, request, *args, **kwargs):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        # التحقق من أن المستخدم هو صاحب المحل
-        if booking.barbershop.owner != self.request.user:
-            messages.error(request, 'ليس لديك صلاحية لتحديث هذا الحجز.')
-            return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-        old_status = booking.status
-        booking.status = 'completed'
-        booking.save()
-
-        BookingHistory.objects.create(
-            booking=booking,
-            old_status=old_status,
-            new_status='completed',
-            changed_by=self.request.user,
-            notes='تم تحديث الحالة إلى مكتمل بواسطة صاحب المحل.'
-        )
-
-        messages.success(request, 'تم تحديث حالة الحجز إلى "مكتمل" بنجاح.')
-        return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-    def test_func(self):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        return booking.barbershop.owner == self.request.user
 
-
-class BookingNoShowView(LoginRequiredMixin, UserPassesTestMixin, View):
+class BookingNoShowView(BookingTransitionView):
     """تحديث حالة الحجز إلى 'لم يحضر' مباشرة."""
+    action = 'no_show'
+    success_message = 'تم تحديث حالة الحجز إلى "لم يحضر" بنجاح.'
 
-    def post(self, request, *args, **kwargs):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        # التحقق من أن المستخدم هو صاحب المحل
-        if booking.barbershop.owner != self.request.user:
-            messages.error(request, 'ليس لديك صلاحية لتحديث هذا الحجز.')
-            return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-        old_status = booking.status
-        booking.status = 'no_show'
-        booking.save()
-
-        BookingHistory.objects.create(
-            booking=booking,
-            old_status=old_status,
-            new_status='no_show',
-            changed_by=self.request.user,
-            notes='تم تحديث الحالة إلى لم يحضر بواسطة صاحب المحل.'
-        )
-
-        messages.success(request, 'تم تحديث حالة الحجز إلى "لم يحضر" بنجاح.')
-        return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
 
-    def test_func(self):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        return booking.barbershop.owner == self.request.user
-
-
-class BookingRejectView(LoginRequiredMixin, UserPassesTestMixin, View):
+class BookingRejectView(BookingTransitionView):
     """رفض الحجز من قبل صاحب المحل بضغطة زر واحدة."""
-
-    def post(self, request, *args, **kwargs):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-
-        # التحقق من الصلاحية والحالة
-        if booking.barbershop.owner != self.request.user:
-            messages.error(request, 'ليس لديك صلاحية لتنفيذ هذا الإجراء.')
-            return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-        
-        if booking.status != 'pending':
-            messages.error(request, 'لا يمكن رفض هذا الحجز لأنه ليس في حالة الانتظار.')
-            return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-        # تحديث الحالة
-        old_status = booking.status
-        booking.status = 'cancelled'
-        booking.save()
-
-        # إنشاء سجل للتاريخ
-        BookingHistory.objects.create(
-            booking=booking,
-            old_status=old_status,
-            new_status='cancelled',
-            changed_by=self.request.user,
-            notes='تم رفض الحجز بواسطة صاحب المحل.'
-        )
-
-        # إرسال رسالة للعميل
-        BookingMessage.objects.create(
-            booking=booking,
-            sender=self.request.user,
-            message='نعتذر، تم رفض حجزك من قبل صاحب المحل.'
-        )
-
-        messages.success(request, 'تم رفض الحجز بنجاح.')
-        return redirect('bookings:merchant_list', barbershop_id=booking.barbershop.id)
-
-    def test_func(self):
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'])
-        return booking.barbershop.owner == self.request.user
+    action = 'reject'
+    success_message = 'تم رفض الحجز بنجاح.'
@@ -0,0 +1,119 @@
+import datetime
+from typing import Any, Dict, List, Optional
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from .availability_utils import ACTIVE_BOOKING_STATUSES
+from .models import Booking, BookingHistory, BookingService, ServiceTimeEstimate
+
+# المدد الفعلية خارج هذا النطاق (بالدقائق) تعتبر أخطاء تسجيل ولا يتم التعلم منها
+MIN_SERVICE_SAMPLE_MINUTES = 1
+MAX_SERVICE_SAMPLE_MINUTES = 240
+
+
+def learn_from_completion(history: BookingHistory) -> None:
+    """
+    تحديث متوسط مدة الخدمات من انتقال الحجز من "مؤكد" إلى "مكتمل"
+
+    المدة الفعلية = وقت سجل الإكمال - وقت آخر سجل تأكيد، وتُوزع على خدمات
+    الحجز بنسبة مددها الاسمية.
+    """
+    confirmed_at = BookingHistory.objects.filter(
+        booking_id=history.booking_id,
+        new_status='confirmed',
+        created_at__lte=history.created_at
+    ).order_by('-created_at').values_list('created_at', flat=True).first()
+    if confirmed_at is None:
+        return
+
+    elapsed = (history.created_at - confirmed_at).total_seconds() / 60
+    if not MIN_SERVICE_SAMPLE_MINUTES <= elapsed <= MAX_SERVICE_SAMPLE_MINUTES:
+        return
+
+    booking = Booking.objects.filter(pk=history.booking_id).values(
+        'barbershop_id', 'service_id', 'service__duration'
+    ).first()
+    if booking is None:
+        return
+
+    services = list(
+        BookingService.objects.filter(booking_id=history.booking_id)
+        .values_list('service_id', 'quantity', 'service__duration')
+    )
+    if not services and booking['service_id']:
+        services = [(booking['service_id'], 1, booking['service__duration'])]
+    if not services:
+        return
+
+    nominal_total = sum(quantity * max(duration, 1) for _, quantity, duration in services)
+    for service_id, quantity, duration in services:
+        share = elapsed * quantity * max(duration, 1) / nominal_total
+        ServiceTimeEstimate.record_sample(booking['barbershop_id'], service_id, share / quantity)
+
+
+def get_service_estimates(barbershop_id: int) -> Dict[int, float]:
+    """متوسط المدة الفعلية لكل خدمة في المحل {service_id: دقائق}"""
+    return dict(
+        ServiceTimeEstimate.objects.filter(
+            barbershop_id=barbershop_id
+        ).values_list('service_id', 'average_minutes')
+    )
+
+
+def _expected_minutes(booking: Booking, estimates: Dict[int, float]) -> float:
+    """المدة المتوقعة للحجز: المتوسط الفعلي لكل خدمة أو مدتها الاسمية إن لم يتوفر"""
+    items = [(bs.service, bs.quantity) for bs in booking.booking_services.all()]
+    if not items and booking.service:
+        items = [(booking.service, 1)]
+    return sum(quantity * estimates.get(service.pk, service.duration) for service, quantity in items)
+
+
+def estimate_wait_times(barbershop_id: int, day: Optional[datetime.date] = None,
+                        now: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+    """
+    وقت الانتظار المتوقع والموعد التقريبي لكل حجز نشط في طابور اليوم
+
+    الانتظار = مجموع المدد المتوقعة للحجوزات التي قبله في الطابور، مع طرح ما
+    مضى من وقت الحجز المؤكد الجاري تنفيذه.
+    """
+    now = now or timezone.now()
+    day = day or timezone.localdate(now)
+
+    confirmed_at = BookingHistory.objects.filter(
+        booking=OuterRef('pk'),
+        new_status='confirmed'
+    ).order_by('-created_at').values('created_at')[:1]
+
+    bookings = Booking.objects.filter(
+        barbershop_id=barbershop_id,
+        booking_day=day,
+        status__in=ACTIVE_BOOKING_STATUSES
+    ).annotate(
+        confirmed_at=Subquery(confirmed_at)
+    ).select_related(
+        'service'
+    ).prefetch_related(
+        'booking_services__service'
+    ).order_by('queue_number')
+
+    estimates = get_service_estimates(barbershop_id)
+    wait_minutes = 0.0
+    wait_times = []
+    for booking in bookings:
+        eta = now + datetime.timedelta(minutes=wait_minutes)
+        wait_times.append({
+            'booking_id': booking.id,
+            'queue_number': booking.queue_number,
+            'status': booking.status,
+            'wait_minutes': round(wait_minutes),
+            'eta': eta.isoformat(),
+            'eta_time': timezone.localtime(eta).strftime('%H:%M'),
+        })
+
+        minutes = _expected_minutes(booking, estimates)
+        if booking.status == 'confirmed' and booking.confirmed_at:
+            # الحجز الجاري: يتبقى منه فقط ما لم يمض بعد
+            minutes -= (now - booking.confirmed_at).total_seconds() / 60
+        wait_minutes += max(minutes, 0)
+
+    return wait_times
+
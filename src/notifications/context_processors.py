@@ -1,26 +1,24 @@
-from .models import Notification
+from django.utils.functional import SimpleLazyObject
+from .utils import get_cached_unread_count, get_cached_recent_notifications
 
 
 def notifications_context(request):
     """
     إضافة معلومات الإشعارات لجميع الصفحات
+
+    القيم كسولة: لا يتم الاستعلام عنها إلا إذا قرأها القالب فعلاً
     """
-    if request.user.is_authenticated:
-        unread_count = Notification.objects.filter(
-            recipient=request.user,
-            is_read=False
-        ).count()
-        
-        recent_notifications = Notification.objects.filter(
-            recipient=request.user
-        ).order_by('-created_at')[:5]
-        
-        return {
-            'notifications_unread_count': unread_count,
-            'recent_notifications': recent_notifications,
-        }
-    
+    def unread_count():
+        if request.user.is_authenticated:
+            return get_cached_unread_count(request.user)
+        return 0
+
+    def recent_notifications():
+        if request.user.is_authenticated:
+            return get_cached_recent_notifications(request.user)
+        return []
+
     return {
-        'notifications_unread_count': 0,
-        'recent_notifications': [],
-    }
\ No newline at end of file
+        'notifications_unread_count': SimpleLazyObject(unread_count),
+        'recent_notifications': SimpleLazyObject(recent_notifications),
+    }
@@ -1,6 +1,11 @@
 from django import template
 from django.utils.safestring import mark_safe
 from notifications.models import Notification
+from notifications.utils import (
+    get_cached_unread_count,
+    get_cached_recent_notifications,
+    RECENT_NOTIFICATIONS_LIMIT,
+)
 
 register = template.Library()
 
@@ -9,7 +14,7 @@ register = template.Library()
 def unread_notifications_count(user):
     """إرجاع عدد الإشعارات غير المقروءة للمستخدم"""
     if user.is_authenticated:
-        return Notification.objects.filter(recipient=user, is_read=False).count()
+        return get_cached_unread_count(user)
     return 0
 
 
@@ -17,7 +22,7 @@ def unread_notifications_count(user):
 def notification_badge(user):
     """عرض شارة الإشعارات"""
     if user.is_authenticated:
-        count = Notification.objects.filter(recipient=user, is_read=False).count()
+        count = get_cached_unread_count(user)
         return {'count': count}
     return {'count': 0}
 
@@ -26,6 +31,8 @@ def notification_badge(user):
 def recent_notifications(user, limit=5):
     """عرض آخر الإشعارات"""
     if user.is_authenticated:
+        if limit <= RECENT_NOTIFICATIONS_LIMIT:
+            return {'notifications': get_cached_recent_notifications(user)[:limit]}
         notifications = Notification.objects.filter(
             recipient=user
         ).order_by('-created_at')[:limit]
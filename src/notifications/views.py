@@ -8,6 +8,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.db.models import Q
 from .models import Notification
+from .utils import get_cached_unread_count, get_cached_recent_notifications, reset_unread_count
 
 
 class NotificationListView(LoginRequiredMixin, ListView):
@@ -24,10 +25,7 @@ class NotificationListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['unread_count'] = Notification.objects.filter(
-            recipient=self.request.user,
-            is_read=False
-        ).count()
+        context['unread_count'] = get_cached_unread_count(self.request.user)
         return context
 
 
@@ -56,6 +54,7 @@ def mark_all_read(request):
         recipient=request.user,
         is_read=False
     ).update(is_read=True)
+    reset_unread_count(request.user.pk)
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
         return JsonResponse({'status': 'success'})
@@ -66,10 +65,7 @@ def mark_all_read(request):
 @login_required
 def get_unread_count(request):
     """الحصول على عدد الإشعارات غير المقروءة"""
-    count = Notification.objects.filter(
-        recipient=request.user,
-        is_read=False
-    ).count()
+    count = get_cached_unread_count(request.user)
     
     return JsonResponse({'unread_count': count})
 
@@ -77,9 +73,7 @@ def get_unread_count(request):
 @login_required
 def get_recent_notifications(request):
     """الحصول على آخر الإشعارات"""
-    notifications = Notification.objects.filter(
-        recipient=request.user
-    ).order_by('-created_at')[:5]
+    notifications = get_cached_recent_notifications(request.user)
     
     notifications_data = []
     for notification in notifications:
@@ -96,8 +90,5 @@ def get_recent_notifications(request):
     
     return JsonResponse({
         'notifications': notifications_data,
-        'unread_count': Notification.objects.filter(
-            recipient=request.user,
-            is_read=False
-        ).count()
+        'unread_count': get_cached_unread_count(request.user)
     })
\ No newline at end of file
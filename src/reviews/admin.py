@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from barbershops.utils import rebuild_rating_aggregates
 from .models import Review
 
 
@@ -51,11 +52,15 @@ class ReviewAdmin(admin.ModelAdmin):
     actions = ['approve_reviews', 'disapprove_reviews']
     
     def approve_reviews(self, request, queryset):
+        barbershop_ids = set(queryset.values_list('barbershop_id', flat=True))
         updated = queryset.update(is_approved=True)
+        rebuild_rating_aggregates(barbershop_ids)
         self.message_user(request, f'تم الموافقة على {updated} تقييم.')
     approve_reviews.short_description = 'الموافقة على التقييمات المحددة'
     
     def disapprove_reviews(self, request, queryset):
+        barbershop_ids = set(queryset.values_list('barbershop_id', flat=True))
         updated = queryset.update(is_approved=False)
+        rebuild_rating_aggregates(barbershop_ids)
         self.message_user(request, f'تم رفض {updated} تقييم.')
     disapprove_reviews.short_description = 'رفض التقييمات ال��حددة'
\ No newline at end of file